@@ -0,0 +1,40 @@
+"""
+Standalone benchmarks, run from the repository root::
+
+    python -m benchmarks.overlap
+
+Each benchmark works on a throwaway sqlite database, see benchmarks/settings.py.
+"""
+import os
+import time
+
+
+def setup():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+    import django
+    from django.conf import settings
+    name = settings.DATABASES["default"]["NAME"]
+    if os.path.exists(name):
+        os.remove(name)
+    django.setup()
+
+    from django.core.management import call_command
+    call_command("migrate", verbosity=0)
+
+
+def insert_promises(promises):
+    # through bulk_insert() like the bulk endpoint and the seed command:
+    # bulk_create() skips Promise.save(), which numbers promises for the change feed
+    from promises.models import Promise
+    Promise.objects.bulk_insert((promise.sinceWhen, promise.tilWhen, promise.user1_id, promise.user2_id)
+                                for promise in promises)
+
+
+def best_of(repeat, func):
+    # best wall time of ``repeat`` calls, in milliseconds
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
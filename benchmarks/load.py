@@ -0,0 +1,299 @@
+"""
+Load test: virtual users run a weighted mix of the runtest.py scenarios
+concurrently, and throughput and latency percentiles are reported per
+scenario.
+
+    python -m benchmarks.load --users 32 --duration 30 --mix list=50,create=20,put=15,delete=10,userall=5
+    python -m benchmarks.load --url http://localhost:8000 --accounts test1:test1passwd,test2:test2passwd
+
+Without --url the app is served in this process (a threaded wsgiref server,
+or uvicorn with --server asgi) from a fresh benchmark database seeded with
+--accounts users and --promises promises. Generator and server then share a
+CPU and the GIL; point --url at a separate deployment for capacity numbers.
+
+Every virtual user logs in once for a token, then loops: pick a scenario,
+run it, wait --think seconds. put and delete pick one of the promises the
+virtual user created, or create one first. Failures are counted, never
+fatal. --output writes the results as JSON.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlsplit
+
+from benchmarks import setup
+
+SCENARIOS = ("list", "create", "put", "delete", "userall")
+
+PASSWORD = "loadtest"
+
+
+class VirtualUser:
+
+    def __init__(self, url, username, password, rand):
+        parts = urlsplit(url)
+        self.connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+        self.username = username
+        self.password = password
+        self.rand = rand
+        self.token = None
+        self.user_id = None
+        self.partners = []
+        self.promises = []
+
+    def request(self, method, path, body=None):
+        # (status, decoded JSON or None)
+        headers = {"Accept": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        if body is not None:
+            body = json.dumps(body)
+            headers["Content-Type"] = "application/json"
+        try:
+            self.connection.request(method, path, body, headers)
+            response = self.connection.getresponse()
+            content = response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            raise
+        data = json.loads(content) if content and response.getheader("Content-Type", "").startswith("application/json") else None
+        return response.status, data
+
+    def login(self, users):
+        status, data = self.request("POST", "/tokens/", {"username": self.username, "password": self.password})
+        if status != 200:
+            raise RuntimeError(f"login of {self.username} failed: {status} {data}")
+        self.token = data["token"]
+        self.user_id = users[self.username]
+        self.partners = [user_id for user_id in users.values() if user_id != self.user_id]
+
+    def window(self):
+        since = datetime(2018, 6, 1, tzinfo=timezone.utc) + timedelta(minutes=30 * self.rand.randrange(10000))
+        return {"sinceWhen": since.isoformat(), "tilWhen": (since + timedelta(hours=self.rand.randint(1, 4))).isoformat()}
+
+    # scenarios: return True on the expected status
+
+    def list(self):
+        return self.request("GET", "/promises/")[0] == 200
+
+    def create(self):
+        status, data = self.request("POST", "/promises/", dict(self.window(), user2=self.rand.choice(self.partners)))
+        if status == 201:
+            self.promises.append(data["id"])
+        return status == 201
+
+    def put(self):
+        if not self.promises:
+            return self.create()
+        return self.request("PUT", f"/promises/{self.rand.choice(self.promises)}/", self.window())[0] == 200
+
+    def delete(self):
+        if not self.promises:
+            return self.create()
+        promise_id = self.promises.pop(self.rand.randrange(len(self.promises)))
+        return self.request("DELETE", f"/promises/{promise_id}/")[0] == 204
+
+    def userall(self):
+        return self.request("GET", "/userall/")[0] == 200
+
+
+def run_user(user, mix, deadline, think, records):
+    scenarios, weights = zip(*mix.items())
+    while time.perf_counter() < deadline:
+        scenario = user.rand.choices(scenarios, weights)[0]
+        started = time.perf_counter()
+        try:
+            ok = getattr(user, scenario)()
+        except (OSError, http.client.HTTPException, ValueError):
+            ok = False
+        records.append((scenario, time.perf_counter() - started, ok))
+        if think:
+            time.sleep(think)
+
+
+def percentile(sorted_values, fraction):
+    # nearest rank, in milliseconds
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))] * 1000
+
+
+def summarize(records, elapsed):
+    latencies, errors = defaultdict(list), defaultdict(int)
+    for scenario, latency, ok in records:
+        latencies[scenario].append(latency)
+        errors[scenario] += not ok
+    latencies["total"] = [latency for _, latency, _ in records]
+    errors["total"] = sum(errors.values())
+
+    results = {}
+    for scenario in [s for s in SCENARIOS if s in latencies] + ["total"]:
+        values = sorted(latencies[scenario])
+        results[scenario] = {
+            "requests": len(values),
+            "errors": errors[scenario],
+            "throughput": len(values) / elapsed,
+            "p50_ms": percentile(values, 0.50),
+            "p95_ms": percentile(values, 0.95),
+            "p99_ms": percentile(values, 0.99),
+            "max_ms": values[-1] * 1000 if values else None,
+        }
+    return results
+
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"unknown scenario {name!r}, expected one of {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def parse_accounts(text):
+    return [tuple(account.split(":", 1)) for account in text.split(",")]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve(kind, port):
+    # the app on localhost:port in a daemon thread
+    if kind == "asgi":
+        import uvicorn
+        from homeworktwo.asgi import application
+        server = uvicorn.Server(uvicorn.Config(application, host="127.0.0.1", port=port, log_level="warning"))
+        target = server.run
+    else:
+        from socketserver import ThreadingMixIn
+        from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+        from django.core.wsgi import get_wsgi_application
+
+        class Server(ThreadingMixIn, WSGIServer):
+            daemon_threads = True
+
+        class Handler(WSGIRequestHandler):
+            def log_message(self, *args):
+                pass
+
+        target = make_server("127.0.0.1", port, get_wsgi_application(), Server, Handler).serve_forever
+    threading.Thread(target=target, daemon=True).start()
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{kind} server did not start")
+
+
+def seed(accounts, promises, rand_seed):
+    # the accounts, one hash per password, then promises between them from
+    # the seed command
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+
+    hashes = {password: make_password(password) for _, password in set(accounts)}
+    User.objects.bulk_create(User(username=username, password=hashes[password]) for username, password in accounts)
+    call_command("seed", users=0, promises=promises, seed=rand_seed, stdout=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="a running deployment; default: serve the app in this process")
+    parser.add_argument("--server", choices=("wsgi", "asgi"), default="wsgi", help="in-process server")
+    parser.add_argument("--accounts", type=parse_accounts,
+                        help="username:password,...; default with --url: runtest.py's test users")
+    parser.add_argument("--users", type=int, default=16, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=10, help="seconds")
+    parser.add_argument("--think", type=float, default=0, help="seconds between a virtual user's requests")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("list=50,create=20,put=15,delete=10,userall=5"))
+    parser.add_argument("--promises", type=int, default=1000, help="promises seeded without --url")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results as JSON to this file, - for stdout")
+    args = parser.parse_args()
+
+    if args.url:
+        if args.accounts is None:
+            sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+            import promtest
+            args.accounts = promtest.create_users(10)
+        url = args.url
+    else:
+        setup()
+        args.accounts = args.accounts or [(f"load{i}", PASSWORD) for i in range(max(2, args.users))]
+        seed(args.accounts, args.promises, args.seed)
+        port = free_port()
+        serve(args.server, port)
+        url = f"http://127.0.0.1:{port}"
+
+    # user ids, from the same /users/?username= lookup as runtest.py
+    probe = VirtualUser(url, None, None, None)
+    users = {}
+    for username, _ in args.accounts:
+        _, found = probe.request("GET", f"/users/?username={username}")
+        if not found:
+            parser.error(f"no user {username} at {url}")
+        users[username] = found[0]["id"]
+
+    virtual_users = []
+    for i in range(args.users):
+        username, password = args.accounts[i % len(args.accounts)]
+        user = VirtualUser(url, username, password, random.Random(args.seed + i))
+        user.login(users)
+        virtual_users.append(user)
+
+    records = []
+    started_at = datetime.now(timezone.utc)
+    started = time.perf_counter()
+    deadline = started + args.duration
+    threads = [threading.Thread(target=run_user, args=(user, args.mix, deadline, args.think, records))
+               for user in virtual_users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    results = summarize(records, elapsed)
+
+    # the JSON report has stdout to itself with --output -
+    table = sys.stderr if args.output == "-" else sys.stdout
+    print(f"{'scenario':>10} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}",
+          file=table)
+    for scenario, result in results.items():
+        print(f"{scenario:>10} {result['requests']:>9} {result['errors']:>7} {result['throughput']:>8.1f} "
+              + " ".join(f"{result[key]:>8.1f}" if result[key] is not None else f"{'-':>8}"
+                         for key in ("p50_ms", "p95_ms", "p99_ms")), file=table)
+
+    if args.output:
+        report = {
+            "url": args.url or f"in-process {args.server}",
+            "started": started_at.isoformat(),
+            "users": args.users,
+            "duration": elapsed,
+            "think": args.think,
+            "mix": args.mix,
+            "results": results,
+        }
+        if args.output == "-":
+            json.dump(report, sys.stdout, indent=2)
+        else:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Time window query: PromiseQuerySet.overlapping against the plain overlap
+predicate, as the promise table grows.
+
+History is generated backwards from a fixed "now", so growing the table
+adds older promises while the queried window stays the last week. The
+bounded query should stay flat; the plain predicate scans all history.
+
+    python -m benchmarks.overlap --sizes 10000,100000,1000000
+"""
+import argparse
+import random
+from datetime import datetime, timedelta
+
+from benchmarks import best_of, insert_promises, setup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    setup()
+
+    import pytz
+    from django.contrib.auth.models import User
+    from promises.models import Promise
+
+    alice = User.objects.create(username="alice")
+    bob = User.objects.create(username="bob")
+    now = datetime(2018, 6, 1, tzinfo=pytz.utc)
+    window = (now - timedelta(days=7), now)
+    rand = random.Random(0)
+
+    print(f"{'rows':>10} {'matches':>8} {'overlapping ms':>15} {'plain ms':>10}")
+    inserted = 0
+    for size in [int(s) for s in args.sizes.split(",")]:
+        promises = []
+        for i in range(inserted, size):
+            since = now - timedelta(minutes=20 * i)
+            duration = timedelta(minutes=rand.randint(30, 240))
+            promises.append(Promise(sinceWhen=since, tilWhen=since + duration, duration=duration,
+                                    user1=alice, user2=bob))
+        insert_promises(promises)
+        inserted = size
+
+        bounded = Promise.objects.overlapping(*window)
+        plain = Promise.objects.filter(sinceWhen__lt=window[1], tilWhen__gt=window[0])
+        matches = bounded.count()
+        assert matches == plain.count()
+        print(f"{size:>10} {matches:>8} "
+              f"{best_of(args.repeat, lambda: list(bounded.values_list('id'))):>15.2f} "
+              f"{best_of(args.repeat, lambda: list(plain.values_list('id'))):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Rendering promises: PromiseSerializer over model instances against
+PromiseRowSerializer over PromiseQuerySet.rows() dicts.
+
+"render" serializes and renders already fetched objects, "total" includes
+the query; on sqlite, rows() skips parsing the stored datetime text.
+
+    python -m benchmarks.serializers --rows 100000
+"""
+import argparse
+from datetime import datetime, timedelta
+
+from benchmarks import best_of, insert_promises, setup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    setup()
+
+    import pytz
+    from django.contrib.auth.models import User
+    from rest_framework.renderers import JSONRenderer
+    from promises.models import Promise
+    from promises.serializers import PromiseRowSerializer, PromiseSerializer
+
+    alice = User.objects.create(username="alice")
+    bob = User.objects.create(username="bob")
+    now = datetime(2018, 6, 1, tzinfo=pytz.utc)
+    insert_promises(
+        Promise(sinceWhen=now - timedelta(minutes=20 * i), tilWhen=now - timedelta(minutes=20 * i - 60),
+                duration=timedelta(hours=1), user1=alice, user2=bob)
+        for i in range(args.rows)
+    )
+    promises = Promise.objects.order_by("id")
+    rows = promises.rows()
+    fetched_promises = list(promises)
+    fetched_rows = list(rows)
+
+    def render_models(promises):
+        return JSONRenderer().render(PromiseSerializer(promises, many=True).data)
+
+    def render_rows(rows):
+        return JSONRenderer().render(PromiseRowSerializer(rows, many=True).data)
+
+    assert render_models(fetched_promises) == render_rows(fetched_rows)
+    timings = [
+        ("render", best_of(args.repeat, lambda: render_models(fetched_promises)),
+         best_of(args.repeat, lambda: render_rows(fetched_rows))),
+        ("total", best_of(args.repeat, lambda: render_models(promises.all())),
+         best_of(args.repeat, lambda: render_rows(rows.all()))),
+    ]
+    print(f"{args.rows} rows")
+    print(f"{'':>8} {'PromiseSerializer ms':>21} {'PromiseRowSerializer ms':>24} {'speedup':>8}")
+    for name, model_ms, row_ms in timings:
+        print(f"{name:>8} {model_ms:>21.0f} {row_ms:>24.0f} {model_ms / row_ms:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Throughput and latency of GET /promises/ served by the WSGI and the ASGI
+deployment, while other clients keep /promises/events/ streams open.
+
+Both get the same number of threads for requests: gunicorn's gthread worker
+with --threads N in front of homeworktwo.wsgi, uvicorn in front of
+homeworktwo.asgi with ASGI_THREADS = N. Under WSGI every open stream holds
+one of the N threads, so from N streams on nothing else is served; under
+ASGI waiting streams hold no thread.
+
+    python -m benchmarks.servers --threads 8 --streams 0,8,64 --clients 32
+
+Needs gunicorn and uvicorn installed.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from benchmarks import insert_promises, setup
+
+SERVERS = {
+    "wsgi": ["gunicorn", "homeworktwo.wsgi:application", "--worker-class", "gthread", "--workers", "1",
+             "--threads", "{threads}", "--bind", "127.0.0.1:{port}", "--log-level", "warning"],
+    "asgi": ["uvicorn", "homeworktwo.asgi:application", "--host", "127.0.0.1", "--port", "{port}",
+             "--log-level", "warning"],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start(name, port, threads, database):
+    command = [sys.executable, "-m"] + [arg.format(port=port, threads=threads) for arg in SERVERS[name]]
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE="benchmarks.settings", BENCH_DB=database,
+               BENCH_THREADS=str(threads))
+    server = subprocess.Popen(command, env=env)
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError(f"{name} did not start")
+
+
+async def get(port, target, token, timeout):
+    # status of one GET, or None when it timed out
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        writer.write(f"GET {target} HTTP/1.1\r\nHost: localhost\r\nAuthorization: Bearer {token}\r\n"
+                     f"Connection: close\r\n\r\n".encode())
+        response = await asyncio.wait_for(reader.read(), timeout)
+        return int(response.split(b" ", 2)[1])
+    except asyncio.TimeoutError:
+        return None
+    finally:
+        writer.close()
+
+
+async def hold_stream(port, token):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET /promises/events/?access_token={token} HTTP/1.1\r\nHost: localhost\r\n"
+                 f"Accept: text/event-stream\r\n\r\n".encode())
+    try:
+        while await reader.read(4096):
+            pass
+    finally:
+        writer.close()
+
+
+async def load(port, token, streams, clients, seconds, timeout):
+    holders = [asyncio.ensure_future(hold_stream(port, token)) for _ in range(streams)]
+    await asyncio.sleep(0.5)
+    latencies, failures = [], 0
+    deadline = time.perf_counter() + seconds
+
+    async def client():
+        nonlocal failures
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            status = await get(port, "/promises/", token, timeout)
+            if status == 200:
+                latencies.append(time.perf_counter() - started)
+            else:
+                failures += 1
+
+    await asyncio.gather(*(client() for _ in range(clients)))
+    for holder in holders:
+        holder.cancel()
+    await asyncio.gather(*holders, return_exceptions=True)
+    return latencies, failures
+
+
+def percentile(values, fraction):
+    return sorted(values)[int(fraction * (len(values) - 1))] * 1000 if values else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--streams", default="0,8,64")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--timeout", type=float, default=2, help="seconds before a GET counts as failed")
+    parser.add_argument("--rows", type=int, default=1000)
+    args = parser.parse_args()
+    setup()
+
+    import pytz
+    from datetime import datetime, timedelta
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from promises.authentication import issue_token
+    from promises.models import Promise
+
+    alice = User.objects.create(username="alice")
+    bob = User.objects.create(username="bob")
+    now = datetime(2018, 6, 1, tzinfo=pytz.utc)
+    insert_promises(Promise(sinceWhen=now - timedelta(minutes=20 * i), tilWhen=now - timedelta(minutes=20 * i - 60),
+                            duration=timedelta(hours=1), user1=alice, user2=bob) for i in range(args.rows))
+    token = issue_token(alice.id)
+    database = settings.DATABASES["default"]["NAME"]
+
+    print(f"{'server':>6} {'streams':>8} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'failed':>7}")
+    for name in SERVERS:
+        for streams in [int(s) for s in args.streams.split(",")]:
+            port = free_port()
+            server = start(name, port, args.threads, database)
+            try:
+                latencies, failures = asyncio.run(
+                    load(port, token, streams, args.clients, args.seconds, args.timeout))
+            finally:
+                server.terminate()
+                server.wait()
+            print(f"{name:>6} {streams:>8} {len(latencies) / args.seconds:>8.0f} {percentile(latencies, 0.5):>8.1f} "
+                  f"{percentile(latencies, 0.99):>8.1f} {failures:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+import os
+import tempfile
+
+from homeworktwo.settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('BENCH_DB', os.path.join(tempfile.gettempdir(), 'promises-bench.sqlite3')),
+    }
+}
+
+# see benchmarks/servers.py
+ASGI_THREADS = int(os.environ.get('BENCH_THREADS', ASGI_THREADS))  # noqa: F405
@@ -0,0 +1,75 @@
+"""
+Peak Python memory and time of GET /promises/?stream=1 against building the
+same list in one response, as the promise table grows.
+
+The streamed peak should stay flat (bounded by STREAM_CHUNK_SIZE), while
+the buffered one grows with the table.
+
+    python -m benchmarks.streaming --sizes 10000,50000,100000
+"""
+import argparse
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from benchmarks import insert_promises, setup
+
+
+def measure(func):
+    # (peak MiB, wall ms) of one call
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = func()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return size, peak / 2 ** 20, elapsed * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,50000,100000")
+    args = parser.parse_args()
+    setup()
+
+    import pytz
+    from django.contrib.auth.models import User
+    from rest_framework.renderers import JSONRenderer
+    from rest_framework.test import APIClient
+    from promises.models import Promise
+    from promises.serializers import PromiseSerializer
+
+    alice = User.objects.create(username="alice")
+    bob = User.objects.create(username="bob")
+    now = datetime(2018, 6, 1, tzinfo=pytz.utc)
+    client = APIClient()
+
+    def streamed():
+        resp = client.get("/promises/", {"stream": 1})
+        return sum(len(chunk) for chunk in resp.streaming_content)
+
+    def buffered():
+        promises = Promise.objects.order_by("created", "id")
+        return len(JSONRenderer().render(PromiseSerializer(promises, many=True).data))
+
+    print(f"{'rows':>10} {'bytes':>12} {'streamed MiB':>13} {'ms':>8} {'buffered MiB':>13} {'ms':>8}")
+    inserted = 0
+    for size in [int(s) for s in args.sizes.split(",")]:
+        promises = []
+        for i in range(inserted, size):
+            since = now - timedelta(minutes=20 * i)
+            promises.append(Promise(sinceWhen=since, tilWhen=since + timedelta(hours=1),
+                                    duration=timedelta(hours=1), user1=alice, user2=bob))
+        insert_promises(promises)
+        inserted = size
+        del promises
+
+        length, streamed_peak, streamed_ms = measure(streamed)
+        buffered_length, buffered_peak, buffered_ms = measure(buffered)
+        assert length == buffered_length
+        print(f"{size:>10} {length:>12} {streamed_peak:>13.1f} {streamed_ms:>8.0f} "
+              f"{buffered_peak:>13.1f} {buffered_ms:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -49,3 +49,24 @@ export const logOut = () => {
 		type: LOGOUT
 	};
 };
+
+export const PROMISE_EVENT = "PROMISE_EVENT";
+export const promiseEvent = (name, promise) => {
+	return {
+		type: PROMISE_EVENT,
+		payload: {
+			name: name,
+			promise: promise
+		}
+	};
+};
+
+export const RELOAD_PROMISES = "RELOAD_PROMISES";
+export const reloadPromises = (response) => {
+	return {
+		type: RELOAD_PROMISES,
+		payload: {
+			response: response
+		}
+	};
+};
@@ -1,6 +1,11 @@
 import { initialState } from "./selectors";
 import * as actions from "./actions";
 
+const withId = (ids, id, keep) => {
+	const others = ids.filter((other) => other != id);
+	return keep ? [...others, id] : others;
+};
+
 const promise_reducer = (state = initialState, action) => {
 	switch(action.type) {
 		case actions.ON_LOGIN_SUCCESS:
@@ -15,6 +20,25 @@ const promise_reducer = (state = initialState, action) => {
 				}
 			};
 
+		case actions.PROMISE_EVENT: {
+			const { name, promise } = action.payload;
+			const deleted = name == "delete";
+			return {
+				...state,
+				response: {
+					...state.response,
+					promises_as_inviter: withId(state.response.promises_as_inviter, promise.id, !deleted && promise.user1 == state.userId),
+					promises_as_invitee: withId(state.response.promises_as_invitee, promise.id, !deleted && promise.user2 == state.userId)
+				}
+			};
+		}
+
+		case actions.RELOAD_PROMISES:
+			return {
+				...state,
+				response: action.payload.response
+			};
+
 		case actions.LOGOUT:
 			return initialState;
 
@@ -1,9 +1,12 @@
-import { take, put, call, fork } from "redux-saga/effects";
+import { eventChannel } from "redux-saga";
+import { take, put, call, fork, cancel } from "redux-saga/effects";
 import api from "services/api";
 import * as actions from "./actions";
 
 const usersUrl = "http://13.125.124.84:8000/users/";
 const promisesUrl = "http://13.125.124.84:8000/promises/";
+const tokensUrl = "http://13.125.124.84:8000/tokens/";
+const eventsUrl = "http://13.125.124.84:8000/promises/events/";
 
 const findUserIdFromUsers = (username, users) => {
 	if(!username || !users) return null;
@@ -19,7 +22,7 @@ const findUserIdFromUsers = (username, users) => {
 export function* watchTryLogin() {
 	while(true) {
 		const { username, password } = yield take(actions.TRY_LOGIN);
-		const users = yield call(api.get, usersUrl);
+		const users = yield call(api.get, `${usersUrl}?username=${encodeURIComponent(username)}`);
 		const userId = findUserIdFromUsers(username, users);
 		
 		// if user does not exist, alert
@@ -46,7 +49,8 @@ export function* watchTryLogin() {
 
 export function* watchAddPromiseToServer() {
 	while(true) {
-		const { sinceWhen, tilWhen, user2Username, users, userToken } = yield take(actions.ADD_PROMISE_TO_SERVER);
+		const { sinceWhen, tilWhen, user2Username, userToken } = yield take(actions.ADD_PROMISE_TO_SERVER);
+		const users = yield call(api.get, `${usersUrl}?username=${encodeURIComponent(user2Username)}`);
 		const user2Id = findUserIdFromUsers(user2Username, users);
 		const body = {
 			sinceWhen: sinceWhen,
@@ -70,7 +74,67 @@ export function* watchAddPromiseToServer() {
 	}
 }
 
+// EventSource cannot send headers, so the stream authenticates with a
+// signed token in the query string. On reconnect the server replays what was
+// missed, "reset" means it could not.
+const promiseEventChannel = (accessToken) => eventChannel((emit) => {
+	const source = new EventSource(`${eventsUrl}?access_token=${encodeURIComponent(accessToken)}`);
+	["update", "delete", "reset"].forEach((name) => {
+		source.addEventListener(name, (event) => emit({ name: name, data: JSON.parse(event.data) }));
+	});
+	// the browser retries dropped streams ("overflow", network errors) on
+	// its own; a closed one was refused, e.g. an expired token. END would
+	// end the saga taking from the channel, so it gets a "closed" event
+	source.addEventListener("error", () => {
+		if(source.readyState == EventSource.CLOSED) emit({ name: "closed" });
+	});
+	return () => source.close();
+});
+
+function* streamPromiseEvents(username, password, userId, userToken) {
+	while(true) {
+		const token = yield call(api.post, tokensUrl, { username: username, password: password });
+		if(token.error) return;
+
+		const channel = yield call(promiseEventChannel, token.token);
+		try {
+			while(true) {
+				const { name, data } = yield take(channel);
+				// reconnect with a fresh token
+				if(name == "closed") break;
+				if(name == "reset") {
+					const response = yield call(api.get, `${usersUrl}${userId}/`, {
+						headers: {
+							"Authorization": `Basic ${userToken}`
+						}
+					});
+					if(!response.error) yield put(actions.reloadPromises(response));
+				} else {
+					yield put(actions.promiseEvent(name, data));
+				}
+			}
+		} finally {
+			channel.close();
+		}
+	}
+}
+
+// push instead of polling, from login to logout
+export function* watchPromiseEvents() {
+	while(true) {
+		const { username, password } = yield take(actions.TRY_LOGIN);
+		const login = yield take([actions.ON_LOGIN_SUCCESS, actions.TRY_LOGIN]);
+		if(login.type != actions.ON_LOGIN_SUCCESS) continue;
+
+		const { userId, userToken } = login.payload;
+		const task = yield fork(streamPromiseEvents, username, password, userId, userToken);
+		yield take(actions.LOGOUT);
+		yield cancel(task);
+	}
+}
+
 export default function* () {
 	yield fork(watchTryLogin);
 	yield fork(watchAddPromiseToServer);
+	yield fork(watchPromiseEvents);
 };
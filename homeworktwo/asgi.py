@@ -0,0 +1,238 @@
+"""
+ASGI config for homeworktwo project.
+
+It exposes the ASGI callable as a module-level variable named ``application``,
+to be served by any ASGI server, e.g.::
+
+    uvicorn homeworktwo.asgi:application
+
+Django 2.2 has no ASGI support of its own, and asgiref's WsgiToAsgi runs
+each request in a thread until its response is complete, so an open event
+stream would hold a thread as it does under WSGI. ASGIHandler speaks ASGI
+on the event loop and runs Django (middleware, views, the ORM) in a pool of
+ASGI_THREADS threads, so at most that many requests use the database at
+once.
+
+Request bodies are read on the loop before a thread is taken. Responses
+reach the loop one chunk at a time through a Channel: a thread renders a
+response, then is free, but a streamed one (?stream=1) holds its thread
+until the client has taken all but the last chunk, as under WSGI. Only
+event streams (promises.events, async_streaming_content) wait on the loop
+without a thread. A client that disconnects stops its response at the
+next chunk.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+
+END = object()
+
+
+def get_environ(scope, body):
+    """
+    The WSGI environ of an ASGI http ``scope``, reading the request body
+    from the file ``body``.
+    """
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    script_name = scope.get("root_path", "")
+    path = scope["path"]
+    if script_name and path.startswith(script_name):
+        path = path[len(script_name):]
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        # WSGI strings are latin-1 decoded bytes
+        "SCRIPT_NAME": script_name.encode().decode("latin-1"),
+        "PATH_INFO": path.encode().decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": "HTTP/%s" % scope.get("http_version", "1.1"),
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", ()):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = "HTTP_" + name
+        value = value.decode("latin-1")
+        environ[name] = environ[name] + "," + value if name in environ else value
+    # a chunked request has no Content-Length; Django reads only that much
+    if "CONTENT_LENGTH" not in environ:
+        environ["CONTENT_LENGTH"] = str(body.seek(0, os.SEEK_END))
+        body.seek(0)
+    return environ
+
+
+class Channel:
+    """
+    Hands items from a pool thread to the event loop one at a time, ended by
+    END. The thread waits while the loop has not taken the previous item.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=1)
+        self.stopped = threading.Event()
+        self.ended = False
+
+    # pool side
+    def put(self, item):
+        asyncio.run_coroutine_threadsafe(self.queue.put(item), self.loop).result()
+
+    async def get(self):
+        item = await self.queue.get()
+        self.ended = item is END
+        return item
+
+    async def __aiter__(self):
+        while True:
+            item = await self.get()
+            if item is END:
+                return
+            yield item
+
+    async def close(self):
+        # ask the thread to stop and let it finish
+        self.stopped.set()
+        while not self.ended:
+            await self.get()
+
+
+class ASGIHandler:
+
+    def __init__(self, threads=None):
+        # returns the response object itself, see run()
+        self.wsgi = WSGIHandler()
+        self.executor = ThreadPoolExecutor(threads or settings.ASGI_THREADS, thread_name_prefix="asgi")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self.http(scope, receive, send)
+        else:
+            raise ValueError("Unsupported ASGI scope type %r" % scope["type"])
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await asyncio.get_event_loop().run_in_executor(None, self.executor.shutdown)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def http(self, scope, receive, send):
+        body = await self.read_body(receive)
+        if body is None:
+            return
+        loop = asyncio.get_event_loop()
+        channel = Channel(loop)
+        running = loop.run_in_executor(self.executor, self.run, scope, body, channel)
+        try:
+            started = await channel.get()
+            if started is END:
+                return
+            response, headers = started
+            await send({"type": "http.response.start", "status": response.status_code, "headers": headers})
+            content = getattr(response, "async_streaming_content", None)
+            if content is None:
+                await self.send_body(channel, receive, send)
+            else:
+                try:
+                    await self.send_body(content, receive, send)
+                finally:
+                    await loop.run_in_executor(self.executor, response.close)
+        finally:
+            await channel.close()
+            body.close()
+            # raises what went wrong in the thread
+            await running
+
+    async def read_body(self, receive):
+        # None when the client went away first
+        body = tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                body.close()
+                return None
+            body.write(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body.seek(0)
+        return body
+
+    def run(self, scope, body, channel):
+        """
+        Runs in the pool: handles the request and puts (response, headers)
+        then the body chunks on ``channel``. A streamed response is iterated
+        in this same thread, where its database cursor was opened.
+        """
+        response = None
+        try:
+            started = []
+            response = self.wsgi(get_environ(scope, body), lambda status, headers: started.extend(headers))
+            headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in started]
+            channel.put((response, headers))
+            if getattr(response, "async_streaming_content", None) is not None:
+                # iterated and closed on the loop
+                response = None
+                return
+            for chunk in response if response.streaming else [response.content]:
+                channel.put(chunk)
+                if channel.stopped.is_set():
+                    break
+        finally:
+            if response is not None:
+                response.close()
+            channel.put(END)
+
+    async def send_body(self, chunks, receive, send):
+        disconnected = asyncio.ensure_future(self.wait_for_disconnect(receive))
+        chunks = chunks.__aiter__()
+        try:
+            while True:
+                getting = asyncio.ensure_future(chunks.__anext__())
+                await asyncio.wait({getting, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                # a gone client gets nothing more, even if chunks are ready
+                if disconnected.done():
+                    getting.cancel()
+                    await asyncio.wait({getting})
+                    return
+                try:
+                    chunk = getting.result()
+                except StopAsyncIteration:
+                    break
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            disconnected.cancel()
+            await chunks.aclose()
+
+    async def wait_for_disconnect(self, receive):
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "homeworktwo.settings")
+
+django.setup(set_prefix=False)
+
+application = ASGIHandler()
@@ -11,6 +11,8 @@ https://docs.djangoproject.com/en/2.0/ref/settings/
 """
 
 import os
+import tempfile
+from importlib.util import find_spec
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -46,6 +48,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'promises.middleware.VaryOnAcceptMiddleware',
+    'promises.middleware.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -75,6 +79,11 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'homeworktwo.wsgi.application'
 
+# Threads running requests under homeworktwo.asgi, i.e. how many requests
+# use the database at once
+
+ASGI_THREADS = 8
+
 
 # Database
 # https://docs.djangoproject.com/en/2.0/ref/settings/#databases
@@ -86,6 +95,99 @@ DATABASES = {
     }
 }
 
+# DATABASE_PROFILE=production: WAL journal and pragmas set on every
+# connection, immediate transactions (see homeworktwo/sqlite3/base.py),
+# connections kept for CONN_MAX_AGE seconds, and tests on a database file
+# so that they can use it from several threads
+
+DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE', 'development')
+
+if DATABASE_PROFILE == 'production':
+    DATABASES['default'].update({
+        'ENGINE': 'homeworktwo.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {
+            'pragmas': {
+                'journal_mode': 'WAL',
+                # WAL stays consistent without a sync on every commit
+                'synchronous': 'NORMAL',
+                # KiB when negative
+                'cache_size': -64000,
+                'mmap_size': 256 * 2 ** 20,
+                'busy_timeout': 5000,
+            },
+        },
+        'TEST': {
+            'NAME': os.path.join(tempfile.gettempdir(), 'homeworktwo-test.sqlite3'),
+        },
+    })
+
+# Read replicas: DATABASE_REPLICAS lists database files kept in sync with
+# the primary by replication. Safe requests read from one of them, except
+# for PRIMARY_STICKY_SECONDS after the user's own write, a window kept in
+# the PRIMARY_STICKY_CACHE_ALIAS cache (see promises/routers.py and
+# promises/middleware.py). Tests read from the primary, see
+# homeworktwo/testing.py.
+
+READ_REPLICAS = []
+
+for number, name in enumerate(filter(None, os.environ.get('DATABASE_REPLICAS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = dict(DATABASES['default'], NAME=name, TEST={'MIRROR': 'default'})
+    READ_REPLICAS.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['promises.routers.ReplicaRouter']
+
+TEST_RUNNER = 'homeworktwo.testing.TestRunner'
+
+PRIMARY_STICKY_SECONDS = 10
+
+PRIMARY_STICKY_CACHE_ALIAS = 'default'
+
+
+# Cache
+# https://docs.djangoproject.com/en/2.0/topics/cache/
+# 'responses' holds rendered /users/ and /userall/ responses, see
+# promises/response_cache.py, 'tokens' the revoked access tokens, see
+# promises/authentication.py. Writes evict from the caches, so every process
+# serving requests has to use the same ones: local memory only fits a single
+# process (runserver, tests). The production profile keeps them in files
+# under CACHE_DIR (default: in the temporary directory), shared by all
+# workers of the host; with several hosts, use memcached instead.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    },
+    'tokens': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tokens',
+        # culling an entry would let its revoked token through again
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000000,
+        },
+    },
+}
+
+RESPONSE_CACHE_ALIAS = 'responses'
+
+TOKEN_DENY_LIST_CACHE_ALIAS = 'tokens'
+
+if DATABASE_PROFILE == 'production':
+    CACHE_DIR = os.environ.get('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'homeworktwo-cache'))
+    for alias, cache in CACHES.items():
+        cache.update({
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(CACHE_DIR, alias),
+        })
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.0/ref/settings/#auth-password-validators
@@ -106,6 +208,47 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Authentication
+# Repeated HTTP Basic requests skip the password hasher, see promises/backends.py
+
+AUTHENTICATION_BACKENDS = [
+    'promises.backends.CachedModelBackend',
+]
+
+# Number of verified (username, password) pairs remembered by
+# CachedModelBackend, and for how many seconds.
+
+CREDENTIAL_CACHE_SIZE = 10000
+
+CREDENTIAL_CACHE_TTL = 300
+
+# Lifetime in seconds of the signed access tokens issued by /tokens/
+
+ACCESS_TOKEN_TTL = 900
+
+# MessagePack (Accept / Content-Type: application/msgpack) is offered when
+# the optional msgpack package is installed; JSON stays the default
+
+MSGPACK_ENABLED = find_spec('msgpack') is not None
+
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': (
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+        'promises.authentication.SignedTokenAuthentication',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ) + (('promises.renderers.MessagePackRenderer',) if MSGPACK_ENABLED else ()),
+    'DEFAULT_PARSER_CLASSES': (
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ) + (('promises.parsers.MessagePackParser',) if MSGPACK_ENABLED else ()),
+}
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/2.0/topics/i18n/
 
@@ -124,3 +267,58 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/2.0/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Pagination
+# Default and maximum number of promises returned per page of /promises/.
+
+PROMISE_PAGE_SIZE = 100
+
+PROMISE_MAX_PAGE_SIZE = 1000
+
+# Rows read, serialized and written per chunk by ?stream=1 list responses
+
+STREAM_CHUNK_SIZE = 500
+
+# Default and maximum number of changes per /promises/changes/ response,
+# and how long tombstones of deleted promises are kept for it
+# (see the compact_tombstones command)
+
+CHANGES_PAGE_SIZE = 1000
+
+CHANGES_MAX_PAGE_SIZE = 10000
+
+TOMBSTONE_RETENTION_DAYS = 30
+
+# /promises/events/ streams: events buffered per stream before it is
+# dropped, seconds between polls of the change feed, seconds between
+# heartbeats, most events replayed on reconnect, and the reconnection delay
+# suggested to browsers
+
+EVENT_QUEUE_SIZE = 100
+
+EVENT_POLL_INTERVAL = 1
+
+EVENT_HEARTBEAT = 15
+
+EVENT_REPLAY_LIMIT = 1000
+
+EVENT_RETRY_MS = 3000
+
+# Maximum number of promises in one /promises/bulk/ request
+
+BULK_MAX_ITEMS = 10000
+
+# Maximum number of users returned by ?username= / ?username__startswith=
+
+USER_LOOKUP_LIMIT = 20
+
+# Default and maximum number of promises in /users/<pk>/agenda/
+
+AGENDA_LENGTH = 10
+
+AGENDA_MAX_LENGTH = 100
+
+# Maximum number of users in one /freebusy/ request
+
+FREEBUSY_MAX_USERS = 100
@@ -0,0 +1,31 @@
+"""
+SQLite backend for production, see DATABASE_PROFILE in settings.
+
+On top of the stock backend:
+
+- ``OPTIONS["pragmas"]`` are set on every new connection, in order
+  (journal_mode=WAL lets readers run alongside the writer).
+- Transactions start with BEGIN IMMEDIATE, taking the write lock up front.
+  A deferred transaction that reads and then writes cannot wait for the
+  lock: SQLite fails it at once with "database is locked", whatever the
+  busy timeout. An immediate one waits for up to busy_timeout.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        # not a sqlite3.connect() argument
+        kwargs.pop("pragmas", None)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.settings_dict["OPTIONS"].get("pragmas", {}).items():
+            conn.execute("PRAGMA %s = %s" % (name, value))
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute("BEGIN IMMEDIATE")
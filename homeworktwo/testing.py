@@ -0,0 +1,31 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Runs the tests with reads on the primary: replicas from DATABASE_REPLICAS
+    mirror the test database, but cannot see what a TestCase has not
+    committed. promises.tests.TestReadReplicas sets up replicas of its own.
+
+    Caches get locations of their own, so that file based ones start empty
+    and the test run never serves or evicts a deployment's entries.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache_dir = tempfile.mkdtemp()
+        caches = {alias: dict(cache, LOCATION=os.path.join(self.cache_dir, alias))
+                  for alias, cache in settings.CACHES.items()}
+        self.test_settings = override_settings(READ_REPLICAS=[], CACHES=caches)
+        self.test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.test_settings.disable()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
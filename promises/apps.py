@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class PromisesConfig(AppConfig):
     name = 'promises'
+
+    def ready(self):
+        # connect the signal receivers
+        from promises import signals  # noqa: F401
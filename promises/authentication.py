@@ -0,0 +1,112 @@
+import math
+import secrets
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.cache import caches
+from rest_framework import authentication, exceptions
+
+TOKEN_SALT = "promises.access-token"
+
+
+class TokenDenyList:
+    """
+    Revoked token ids and deleted user ids, in the
+    ``settings.TOKEN_DENY_LIST_CACHE_ALIAS`` cache.
+
+    Each entry is kept only until the tokens it denies would have expired
+    anyway. Denials reach every process only when they share the backend:
+    with local memory (the development profile) a token revoked in one
+    worker still authenticates in the others.
+    """
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def deny(self, jti, expires):
+        timeout = math.ceil(expires - time.time())
+        if timeout > 0:
+            self.backend.set(f"token-denied:{jti}", True, timeout)
+
+    def deny_user(self, user_id):
+        # every token issued to the user so far expires within the TTL, and
+        # ids of deleted users are not reused
+        self.backend.set(f"token-denied-user:{user_id}", True, settings.ACCESS_TOKEN_TTL)
+
+    def denies(self, payload):
+        return bool(self.backend.get_many([f"token-denied:{payload['jti']}", f"token-denied-user:{payload['uid']}"]))
+
+    def clear(self):
+        self.backend.clear()
+
+
+deny_list = TokenDenyList(settings.TOKEN_DENY_LIST_CACHE_ALIAS)
+
+
+def issue_token(user_id):
+    payload = {"uid": user_id, "jti": secrets.token_urlsafe(8), "iat": int(time.time())}
+    return signing.dumps(payload, salt=TOKEN_SALT)
+
+
+def read_token(token):
+    # raises signing.BadSignature (or its subclass SignatureExpired)
+    payload = signing.loads(token, salt=TOKEN_SALT, max_age=settings.ACCESS_TOKEN_TTL)
+    if deny_list.denies(payload):
+        raise signing.BadSignature("Token has been revoked.")
+    return payload
+
+
+def revoke_token(payload):
+    deny_list.deny(payload["jti"], payload["iat"] + settings.ACCESS_TOKEN_TTL)
+
+
+class SignedTokenAuthentication(authentication.BaseAuthentication):
+    """
+    Authenticate ``Authorization: Bearer <token>`` against the HMAC signature
+    of the token alone, without reading the database.
+
+    request.user is an unsaved User carrying only the id from the token,
+    which is all the promise views and permissions look at.
+    """
+    keyword = "Bearer"
+
+    def authenticate(self, request):
+        auth = authentication.get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed("Invalid token header.")
+
+        try:
+            return self.authenticate_token(auth[1].decode())
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed("Invalid or expired token.")
+
+    def authenticate_token(self, token):
+        try:
+            payload = read_token(token)
+        except signing.BadSignature:
+            raise exceptions.AuthenticationFailed("Invalid or expired token.")
+        return (User(id=payload["uid"]), payload)
+
+    def authenticate_header(self, request):
+        return self.keyword
+
+
+class SignedTokenQueryAuthentication(SignedTokenAuthentication):
+    """
+    The same token as ``?access_token=<token>``, for clients that cannot set
+    headers (EventSource). Views opt in to it: query strings end up in logs.
+    """
+
+    def authenticate(self, request):
+        token = request.query_params.get("access_token")
+        if token is None:
+            return None
+        return self.authenticate_token(token)
@@ -0,0 +1,97 @@
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+UserModel = get_user_model()
+
+
+class VerifiedCredentialCache:
+    """
+    Bounded LRU of recently verified credentials whose entries expire after
+    ``ttl`` seconds.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+credential_cache = VerifiedCredentialCache(settings.CREDENTIAL_CACHE_SIZE, settings.CREDENTIAL_CACHE_TTL)
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend that skips the password hasher for credentials it has
+    verified recently.
+
+    Entries are keyed by (username, HMAC of the password), so no plain text
+    password is kept in memory, and remember the password hash they were
+    verified against. A hit is only accepted while the user row still holds
+    that hash and username and the user can still authenticate, so changing
+    the password or username or deactivating the user invalidates it.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        key = (username, self._digest(password))
+        cached = credential_cache.get(key)
+        if cached is not None:
+            user_id, password_hash = cached
+            try:
+                user = UserModel._default_manager.get(pk=user_id)
+            except UserModel.DoesNotExist:
+                user = None
+            if user is not None and user.get_username() == username and user.password == password_hash:
+                return user if self.user_can_authenticate(user) else None
+            credential_cache.discard(key)
+
+        user = super().authenticate(request, username=username, password=password, **kwargs)
+        if user is not None:
+            credential_cache.set(key, (user.pk, user.password))
+        return user
+
+    @staticmethod
+    def _digest(password):
+        return hmac.new(settings.SECRET_KEY.encode(), password.encode(), hashlib.sha256).digest()
@@ -0,0 +1,78 @@
+"""
+ETag / Last-Modified validators for django.views.decorators.http.condition.
+
+Each one is computed from a small aggregate query, so an unchanged
+resource is answered with 304 before the view queries or serializes
+anything.
+"""
+import hashlib
+from calendar import timegm
+
+from django.contrib.auth.models import User
+from django.db.models import Count, Max
+from django.utils.http import http_date, quote_etag
+
+from promises.models import USER_CHANGES, Promise, Sequence
+
+
+def make_etag(*parts):
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def representation(request):
+    # JSON and MessagePack bodies of a resource need different ETags
+    return request.META.get("HTTP_ACCEPT", "")
+
+
+def has_conditional_headers(request):
+    return "HTTP_IF_NONE_MATCH" in request.META or "HTTP_IF_MODIFIED_SINCE" in request.META
+
+
+def promise_list_etag(request, *args, **kwargs):
+    # the count catches deletions, which leave max(updated) unchanged; for
+    # the same reason lists get no Last-Modified
+    state = Promise.objects.aggregate(updated=Max("updated"), count=Count("id"))
+    return make_etag("promises", state["updated"], state["count"], request.get_full_path(), representation(request))
+
+
+def _related_promise_updated(request, pk):
+    # None for a missing or unrelated promise, so the view answers 404/403.
+    # Also None for unconditional requests: PromiseDetail.retrieve sets the
+    # validators from the promise it loads anyway, see promise_validators.
+    if not request.user.is_authenticated or not has_conditional_headers(request):
+        return None
+    if not hasattr(request, "_promise_updated"):
+        request._promise_updated = Promise.objects.filter(pk=pk).involving(request.user.id) \
+            .values_list("updated", flat=True).first()
+    return request._promise_updated
+
+
+def promise_detail_etag(request, pk, *args, **kwargs):
+    updated = _related_promise_updated(request, pk)
+    return None if updated is None else make_etag("promise", pk, updated, representation(request))
+
+
+def promise_detail_last_modified(request, pk, *args, **kwargs):
+    return _related_promise_updated(request, pk)
+
+
+def promise_validators(request, promise):
+    # the headers promise_detail_etag/promise_detail_last_modified describe
+    return {
+        "ETag": quote_etag(make_etag("promise", str(promise.pk), promise.updated, representation(request))),
+        "Last-Modified": http_date(timegm(promise.updated.utctimetuple())),
+    }
+
+
+def user_list_etag(request, *args, **kwargs):
+    # the user lists render usernames and promise ids. A saved or deleted
+    # user bumps USER_CHANGES; the id and count catch users created in bulk.
+    # Promises are never moved between users, so creations and deletions
+    # are all that can change their ids. Username lookups are a single
+    # small query already.
+    if "username" in request.query_params or "username__startswith" in request.query_params:
+        return None
+    users = User.objects.aggregate(last=Max("id"), count=Count("id"))
+    promises = Promise.objects.aggregate(last=Max("id"), count=Count("id"))
+    return make_etag("users", users["last"], users["count"], Sequence.objects.current(USER_CHANGES),
+                     promises["last"], promises["count"], request.get_full_path(), representation(request))
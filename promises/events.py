@@ -0,0 +1,328 @@
+"""
+Server-sent events for promises involving a user.
+
+Events come from the change feed (Promise.objects.changes()), so a stream
+sees the writes of every worker, not only of its own process. While any
+stream is open, one thread per process polls the feed every
+EVENT_POLL_INTERVAL seconds, or right after a write in this process
+commits, and a Broadcaster fans the events out to a bounded queue per open
+stream. A stream whose queue fills up is dropped rather than slowing down
+the poll or buffering without limit: it gets an "overflow" event and is
+closed. The browser then reconnects with Last-Event-ID, and the events it
+missed are replayed from the same feed. An event id is the promise's
+change feed number (Promise.seq).
+
+Like the feed, events say what a promise is now, not how it got there: a
+created or updated promise is an "update" with its current fields, a
+deleted one a "delete" with its id. Under ASGI (homeworktwo/asgi.py) an
+open stream waits without holding a thread.
+"""
+import asyncio
+import queue
+import threading
+from collections import defaultdict
+from heapq import merge
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Q
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from promises.models import (CHANGED, DELETED, EXPIRED, PROMISE_CHANGES, TOMBSTONE_HORIZON, Promise,
+                             PromiseTombstone, Sequence)
+from promises.serializers import PromiseRowSerializer
+
+
+def encode_event(name, data, seq=None):
+    lines = [] if seq is None else [b"id: %d" % seq]
+    lines += [b"event: " + name.encode(), b"data: " + JSONRenderer().render(data), b"", b""]
+    return b"\n".join(lines)
+
+
+def encode_changes(changes):
+    """
+    (seq, encoded event, user ids) for ``changes``, rows of
+    Promise.objects.changes() without EXPIRED ones. A promise changed again
+    since is left out: its later change is in the feed with its own seq.
+    """
+    changed = [promise_id for _, promise_id, kind in changes if kind == CHANGED]
+    deleted = [seq for seq, _, kind in changes if kind == DELETED]
+    promises = list(Promise.objects.filter(id__in=changed).rows("seq"))
+    data = dict(zip((promise["seq"] for promise in promises), PromiseRowSerializer(promises, many=True).data))
+    users = {promise["seq"]: (promise["user1_id"], promise["user2_id"]) for promise in promises}
+    for seq, promise_id, user1_id, user2_id in PromiseTombstone.objects.filter(seq__in=deleted) \
+            .values_list("seq", "promise_id", "user1_id", "user2_id"):
+        data[seq] = {"id": promise_id}
+        users[seq] = (user1_id, user2_id)
+    return [(seq, encode_event("update" if kind == CHANGED else "delete", data[seq], seq), users[seq])
+            for seq, _, kind in changes if seq in data]
+
+
+class Subscription:
+
+    def __init__(self, user_id, size):
+        self.user_id = user_id
+        self.queue = queue.Queue(maxsize=size)
+        self.dropped = False
+
+    # called by the publishing thread after a put or a drop
+    def notify(self):
+        pass
+
+
+class Broadcaster:
+    """
+    Routes (seq, encoded event) pairs to the subscriptions of the users the
+    event is about. publish() never blocks.
+
+    The first subscription starts a thread publishing the change feed from
+    the number it had then on; it ends when nobody is subscribed anymore.
+    """
+
+    def __init__(self, queue_size):
+        self.queue_size = queue_size
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._poller = None
+        self._cursor = None
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id, self.queue_size)
+        with self._lock:
+            if self._poller is None:
+                # read before the subscriber reads where its stream starts
+                self._cursor = Sequence.objects.current(PROMISE_CHANGES)
+                self._poller = threading.Thread(target=self.poll_forever, name="promise-events", daemon=True)
+                self._poller.start()
+            self._subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.user_id, None)
+
+    def publish(self, seq, event, user_ids):
+        with self._lock:
+            targets = set().union(*(self._subscriptions.get(user_id, ()) for user_id in set(user_ids)))
+        for subscription in targets:
+            self.put(subscription, (seq, event))
+
+    def put(self, subscription, item):
+        try:
+            subscription.queue.put_nowait(item)
+        except queue.Full:
+            subscription.dropped = True
+            self.unsubscribe(subscription)
+        subscription.notify()
+
+    def drop_all(self):
+        with self._lock:
+            subscriptions = set().union(*self._subscriptions.values())
+            self._subscriptions.clear()
+        for subscription in subscriptions:
+            subscription.dropped = True
+            subscription.notify()
+
+    def wake(self):
+        # poll now instead of at the next interval
+        self._wakeup.set()
+
+    def poll(self):
+        """
+        Publish the changes after the cursor, EVENT_REPLAY_LIMIT at a time.
+        When tombstones after the cursor were compacted, deletes were missed
+        and every stream is dropped.
+        """
+        limit = settings.EVENT_REPLAY_LIMIT
+        while self._subscriptions:
+            changes = Promise.objects.changes(self._cursor, limit)
+            if any(kind == EXPIRED for _, _, kind in changes):
+                self.drop_all()
+            else:
+                for seq, event, user_ids in encode_changes(changes):
+                    self.publish(seq, event, user_ids)
+            if changes:
+                self._cursor = changes[-1][0]
+            if len(changes) < limit:
+                return
+
+    def polling(self):
+        # whether the poller goes on; it stops with the last subscription
+        with self._lock:
+            if not self._subscriptions:
+                self._poller = None
+            return self._poller is not None
+
+    def poll_forever(self):
+        try:
+            while self.polling():
+                self._wakeup.wait(settings.EVENT_POLL_INTERVAL)
+                self._wakeup.clear()
+                try:
+                    self.poll()
+                except DatabaseError:
+                    # e.g. a locked database; the next poll starts from the
+                    # same cursor
+                    connections.close_all()
+        except BaseException:
+            # the streams reconnect, and start a new poller
+            with self._lock:
+                self._poller = None
+            self.drop_all()
+            raise
+        finally:
+            connections.close_all()
+
+    def clear(self):
+        # drops every subscription and waits for the poller to stop
+        with self._lock:
+            self._subscriptions.clear()
+            poller = self._poller
+        if poller is not None:
+            self.wake()
+            poller.join()
+
+    def __len__(self):
+        return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+
+broadcaster = Broadcaster(settings.EVENT_QUEUE_SIZE)
+
+
+def wake_on_commit():
+    # called from the write paths: streams of this process get the change
+    # without waiting for the next poll
+    transaction.on_commit(broadcaster.wake)
+
+
+def replay(user_id, since):
+    """
+    (seq, encoded event) pairs for the user's changes after ``since``, in seq
+    order, or None when they cannot be replayed: tombstones after ``since``
+    were compacted, or there are more than EVENT_REPLAY_LIMIT of them.
+    Promises changed more than once are replayed once, as "update".
+    """
+    if since < Sequence.objects.current(TOMBSTONE_HORIZON):
+        return None
+    limit = settings.EVENT_REPLAY_LIMIT
+    promises = list(Promise.objects.involving(user_id).filter(seq__gt=since).order_by("seq").rows("seq")[:limit + 1])
+    tombstones = list(PromiseTombstone.objects.filter(Q(user1_id=user_id) | Q(user2_id=user_id), seq__gt=since)
+                      .order_by("seq").values_list("seq", "promise_id")[:limit + 1])
+    if len(promises) + len(tombstones) > limit:
+        return None
+
+    updated = [(promise["seq"], encode_event("update", data, promise["seq"]))
+               for promise, data in zip(promises, PromiseRowSerializer(promises, many=True).data)]
+    deleted = [(seq, encode_event("delete", {"id": promise_id}, seq)) for seq, promise_id in tombstones]
+    return list(merge(updated, deleted))
+
+
+class EventStream:
+    """
+    The body of an event stream: ``start`` events, then whatever the
+    subscription receives, with a comment line every EVENT_HEARTBEAT
+    seconds so proxies keep the connection open and a closed one is noticed.
+
+    Received events numbered up to ``after`` are skipped: ``start`` covers
+    them. Iterating it blocks a thread between events; ``async for`` waits
+    on the event loop instead.
+    """
+
+    def __init__(self, subscription, start, after=None):
+        self.subscription = subscription
+        self.start = start
+        self.after = after
+
+    def opening(self):
+        yield b"retry: %d\n\n" % settings.EVENT_RETRY_MS
+        for _, event in self.start:
+            yield event
+
+    def received(self, seq, event):
+        return None if self.after is not None and seq <= self.after else event
+
+    def overflow(self):
+        return encode_event("overflow", {})
+
+    def __iter__(self):
+        subscription = self.subscription
+        try:
+            yield from self.opening()
+            while True:
+                if subscription.dropped and subscription.queue.empty():
+                    yield self.overflow()
+                    return
+                try:
+                    event = self.received(*subscription.queue.get(timeout=settings.EVENT_HEARTBEAT))
+                except queue.Empty:
+                    yield b": heartbeat\n\n"
+                    continue
+                if event is not None:
+                    yield event
+        finally:
+            self.close()
+
+    async def __aiter__(self):
+        subscription = self.subscription
+        loop = asyncio.get_event_loop()
+        wakeup = asyncio.Event()
+        subscription.notify = lambda: loop.call_soon_threadsafe(wakeup.set)
+        try:
+            for event in self.opening():
+                yield event
+            while True:
+                while not subscription.queue.empty():
+                    event = self.received(*subscription.queue.get_nowait())
+                    if event is not None:
+                        yield event
+                if subscription.dropped:
+                    yield self.overflow()
+                    return
+                try:
+                    await asyncio.wait_for(wakeup.wait(), settings.EVENT_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield b": heartbeat\n\n"
+                wakeup.clear()
+        finally:
+            self.close()
+
+    def close(self):
+        broadcaster.unsubscribe(self.subscription)
+
+
+def open_stream(user_id, last_event_id):
+    """
+    Subscribe first, then read what to replay, so nothing committed in
+    between is missed; replayed events are not sent twice.
+    """
+    subscription = broadcaster.subscribe(user_id)
+    try:
+        start = None if last_event_id is None else replay(user_id, last_event_id)
+        if start is None:
+            # a fresh start: the client reloads its promises on "reset"
+            after = Sequence.objects.current(PROMISE_CHANGES)
+            name = "ready" if last_event_id is None else "reset"
+            start = [(None, encode_event(name, {}, after))]
+        else:
+            after = max([last_event_id] + [seq for seq, _ in start])
+    except Exception:
+        broadcaster.unsubscribe(subscription)
+        raise
+    return EventStream(subscription, start, after)
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    text/event-stream. Streams are written by EventStream; this renders
+    the responses that are not streams (errors) as one "error" event.
+    """
+    media_type = "text/event-stream"
+    format = "event-stream"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return encode_event("error", data)
@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from promises.models import PromiseTombstone
+
+
+class Command(BaseCommand):
+    help = "Drop tombstones of promises deleted longer ago than the retention period. " \
+           "Change feed cursors from before the dropped ones answer 410 afterwards."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=settings.TOMBSTONE_RETENTION_DAYS,
+                            help="retention period in days (default TOMBSTONE_RETENTION_DAYS)")
+
+    def handle(self, *args, **options):
+        count = PromiseTombstone.objects.compact(timezone.now() - timedelta(days=options["days"]))
+        self.stdout.write(f"Dropped {count} tombstones.")
@@ -0,0 +1,101 @@
+import random
+import re
+import time
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from promises.models import Promise
+
+# starts: mostly on weekdays (Monday first) and in working hours, on the quarter hour
+WEEKDAY_WEIGHTS = [10, 10, 10, 10, 9, 4, 3]
+HOUR_WEIGHTS = [0, 0, 0, 0, 0, 0, 1, 2, 6, 10, 10, 9, 7, 9, 10, 10, 9, 7, 6, 6, 5, 3, 1, 0]
+# lengths in minutes, an hour most often
+DURATIONS = [15, 30, 45, 60, 90, 120, 180, 240, 480]
+DURATION_WEIGHTS = [3, 15, 5, 40, 10, 12, 6, 5, 4]
+# some users are in many more promises than others: the n-th most popular
+# one is picked with weight 1 / n ** POPULARITY
+POPULARITY = 0.8
+
+
+class Command(BaseCommand):
+    help = "Create users sharing one password and promises between all users, for benchmarks. " \
+           "Rows are inserted in bulk, --batch-size per transaction."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100, help="users to create (default 100)")
+        parser.add_argument("--promises", type=int, default=1000, help="promises to create (default 1000)")
+        parser.add_argument("--prefix", default="seed", help="username prefix, numbered on (default seed)")
+        parser.add_argument("--password", default="seed", help="password of every created user (default seed)")
+        parser.add_argument("--days", type=int, default=365,
+                            help="promises start within this many days around today (default 365)")
+        parser.add_argument("--batch-size", type=int, default=10000, help="rows per INSERT transaction (default 10000)")
+        parser.add_argument("--seed", type=int, help="random seed, for repeatable data")
+
+    def handle(self, *args, **options):
+        self.batch_size = options["batch_size"]
+        self.verbosity = options["verbosity"]
+        rand = random.Random(options["seed"])
+
+        started = time.perf_counter()
+        self.create_users(options["users"], options["prefix"], options["password"])
+        user_ids = list(User.objects.order_by("id").values_list("id", flat=True))
+        if options["promises"] and len(user_ids) < 2:
+            raise CommandError("Promises need at least two users.")
+        self.stdout.write(f"Created {options['users']} users in {time.perf_counter() - started:.1f}s.")
+
+        started = time.perf_counter()
+        self.create_promises(options["promises"], user_ids, options["days"], rand)
+        self.stdout.write(f"Created {options['promises']} promises in {time.perf_counter() - started:.1f}s.")
+
+    def batches(self, total):
+        for start in range(0, total, self.batch_size):
+            yield start, min(self.batch_size, total - start)
+
+    def progress(self, done, total, what):
+        if self.verbosity > 1:
+            self.stdout.write(f"{done}/{total} {what}")
+
+    def create_users(self, count, prefix, password):
+        # one hash for all: hashing is slow on purpose
+        password = make_password(password)
+        # numbered on from the highest <prefix><number>; other names that
+        # merely start with the prefix do not count
+        numbered = User.objects.filter(username__regex=rf"^{re.escape(prefix)}[0-9]+$")
+        first = max((int(username[len(prefix):]) for username in numbered.values_list("username", flat=True)),
+                    default=-1) + 1
+        for start, size in self.batches(count):
+            User.objects.bulk_create(
+                User(username=f"{prefix}{first + start + i}", password=password) for i in range(size))
+            self.progress(start + size, count, "users")
+
+    def create_promises(self, count, user_ids, days, rand):
+        today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        first_day = today - timedelta(days=days // 2)
+        day_weights = list(accumulate(WEEKDAY_WEIGHTS[(first_day + timedelta(days=d)).weekday()] for d in range(days)))
+        hour_weights = list(accumulate(HOUR_WEIGHTS))
+        duration_weights = list(accumulate(DURATION_WEIGHTS))
+        # popular users are spread over the id range
+        by_popularity = rand.sample(user_ids, len(user_ids))
+        user_weights = list(accumulate(1 / rank ** POPULARITY for rank in range(1, len(user_ids) + 1)))
+
+        for start, size in self.batches(count):
+            starts = zip(rand.choices(range(days), cum_weights=day_weights, k=size),
+                         rand.choices(range(24), cum_weights=hour_weights, k=size),
+                         rand.choices((0, 15, 30, 45), k=size))
+            durations = rand.choices(DURATIONS, cum_weights=duration_weights, k=size)
+            inviters = rand.choices(by_popularity, cum_weights=user_weights, k=size)
+            invitees = rand.choices(by_popularity, cum_weights=user_weights, k=size)
+
+            rows = []
+            for (day, hour, minute), duration, user1, user2 in zip(starts, durations, inviters, invitees):
+                while user2 == user1:
+                    user2 = rand.choice(user_ids)
+                since = first_day + timedelta(days=day, hours=hour, minutes=minute)
+                rows.append((since, since + timedelta(minutes=duration), user1, user2))
+            Promise.objects.bulk_insert(rows)
+            self.progress(start + size, count, "promises")
@@ -0,0 +1,93 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import patch_vary_headers
+from rest_framework.permissions import SAFE_METHODS
+
+from promises import routers
+
+
+class VaryOnAcceptMiddleware:
+    """
+    The API answers in JSON or MessagePack depending on Accept, so caches
+    must not hand one client's representation to another.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        patch_vary_headers(response, ("Accept",))
+        return response
+
+
+def sticky_key(user_id):
+    return f"primary-sticky:{user_id}"
+
+
+def stick_to_primary(user_id):
+    caches[settings.PRIMARY_STICKY_CACHE_ALIAS].set(sticky_key(user_id), True, settings.PRIMARY_STICKY_SECONDS)
+
+
+def sticks_to_primary(user_id):
+    return caches[settings.PRIMARY_STICKY_CACHE_ALIAS].get(sticky_key(user_id), False)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Safe requests read from a replica (see promises.routers), unless:
+
+    - the user wrote within the last PRIMARY_STICKY_SECONDS, so that they
+      see their own writes however far behind the replicas are. The window
+      is kept per user in the PRIMARY_STICKY_CACHE_ALIAS cache, shared by
+      all processes; the API authenticates in the view, so views check it
+      with PrimaryAfterWritesMixin.
+    - the view sets ``read_from_primary = True``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        replica = None
+        if request.method in SAFE_METHODS:
+            replica = routers.choose_replica()
+        with routers.read_from(replica):
+            response = self.get_response(request)
+            replica = routers.reading_from()
+
+        if response.streaming:
+            response.streaming_content = self.routed(response.streaming_content, replica)
+        if settings.READ_REPLICAS and request.method not in SAFE_METHODS and response.status_code < 400:
+            # set by the view's authentication
+            user = getattr(request, "user", None)
+            if user is not None and user.is_authenticated:
+                stick_to_primary(user.pk)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if getattr(getattr(view_func, "cls", None), "read_from_primary", False):
+            routers.read_from_primary()
+
+    # streamed responses read while they are iterated, after __call__
+    def routed(self, chunks, replica):
+        chunks = iter(chunks)
+        while True:
+            with routers.read_from(replica):
+                chunk = next(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+
+
+class PrimaryAfterWritesMixin:
+    """
+    Reads from the primary while the requesting user's sticky window is
+    open, see ReplicaRoutingMiddleware.
+    """
+
+    # override
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if routers.reading_from() is not None and request.user.is_authenticated and sticks_to_primary(request.user.pk):
+            routers.read_from_primary()
@@ -0,0 +1,28 @@
+# Generated by Django 2.2.28 on 2026-10-17 00:22
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Promise',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('sinceWhen', models.DateTimeField()),
+                ('tilWhen', models.DateTimeField()),
+                ('user1', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='promises_as_inviter', to=settings.AUTH_USER_MODEL)),
+                ('user2', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='promises_as_invitee', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
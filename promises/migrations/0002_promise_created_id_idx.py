@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-17 00:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('promises', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='promise',
+            index=models.Index(fields=['created', 'id'], name='promise_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+import datetime
+
+from django.db import migrations, models
+
+
+def fill_duration(apps, schema_editor):
+    Promise = apps.get_model("promises", "Promise")
+    Promise.objects.update(duration=models.ExpressionWrapper(
+        models.F("tilWhen") - models.F("sinceWhen"), output_field=models.DurationField()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('promises', '0002_promise_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promise',
+            name='duration',
+            field=models.DurationField(db_index=True, default=datetime.timedelta(0), editable=False),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_duration, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='promise',
+            index=models.Index(fields=['sinceWhen', 'tilWhen'], name='promise_since_til_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.28 on 2026-10-17 00:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('promises', '0003_promise_time_window'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='promise',
+            index=models.Index(fields=['user1', 'sinceWhen'], name='promise_user1_since_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='promise',
+            index=models.Index(fields=['user2', 'sinceWhen'], name='promise_user2_since_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def fill_updated(apps, schema_editor):
+    Promise = apps.get_model("promises", "Promise")
+    Promise.objects.update(updated=models.F("created"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('promises', '0004_promise_agenda_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promise',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_updated, migrations.RunPython.noop),
+    ]
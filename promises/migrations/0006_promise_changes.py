@@ -0,0 +1,43 @@
+from django.db import migrations, models
+
+
+def number_promises(apps, schema_editor):
+    Promise = apps.get_model("promises", "Promise")
+    Sequence = apps.get_model("promises", "Sequence")
+    Promise.objects.update(seq=models.F("id"))
+    last = Promise.objects.aggregate(last=models.Max("id"))["last"] or 0
+    Sequence.objects.create(name="promise_changes", value=last)
+    Sequence.objects.create(name="tombstone_horizon", value=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('promises', '0005_promise_updated'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PromiseTombstone',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.BigIntegerField(unique=True)),
+                ('promise_id', models.IntegerField()),
+                ('deleted', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='promise',
+            name='seq',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+            preserve_default=False,
+        ),
+        migrations.RunPython(number_promises, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('promises', '0006_promise_changes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promisetombstone',
+            name='user1_id',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='promisetombstone',
+            name='user2_id',
+            field=models.IntegerField(null=True),
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+def create_sequence(apps, schema_editor):
+    Sequence = apps.get_model("promises", "Sequence")
+    Sequence.objects.get_or_create(name="user_changes")
+
+
+def delete_sequence(apps, schema_editor):
+    Sequence = apps.get_model("promises", "Sequence")
+    Sequence.objects.filter(name="user_changes").delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('promises', '0007_tombstone_users'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_sequence, delete_sequence),
+    ]
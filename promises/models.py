@@ -1,8 +1,314 @@
-from django.db import models
+import heapq
+from collections import defaultdict
+from datetime import datetime
+from itertools import islice
+
+from django.conf import settings
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models.functions import Cast, Greatest
+from django.utils import timezone
+from django.utils.timezone import utc
+
+
+DATETIME_COLUMNS = ("created", "updated", "sinceWhen", "tilWhen")
+
+# Sequence names: every promise write and deletion gets the next
+# PROMISE_CHANGES number (Promise.seq, PromiseTombstone.seq), and
+# TOMBSTONE_HORIZON is the last number whose tombstone was compacted away
+PROMISE_CHANGES = "promise_changes"
+TOMBSTONE_HORIZON = "tombstone_horizon"
+# bumped by every change to a user (see promises.conditional.user_list_etag)
+USER_CHANGES = "user_changes"
+
+# kinds of PromiseQuerySet.changes() rows
+CHANGED, DELETED, EXPIRED = 0, 1, 2
+
+
+def parse_stored_datetime(text):
+    """
+    The aware datetime of sqlite's stored text of a datetime column (see
+    PromiseQuerySet.rows): naive UTC "YYYY-MM-DD HH:MM:SS[.ffffff]", or with
+    an offset where a datetime expression wrote it (see ShiftedDatetime).
+    """
+    value = datetime.fromisoformat(text)
+    return value.replace(tzinfo=utc) if value.tzinfo is None else value
+
+
+class ShiftedDatetime(models.Func):
+    """
+    ``F(name) + shift`` for a datetime column, for update().
+
+    sqlite adds a duration to a datetime in Python and returns the sum with
+    a "+00:00" suffix, which the stored UTC text never has. Such a value
+    still reads back, but compares wrongly as text against other rows and
+    against query parameters. The suffix is cut off there.
+    """
+    output_field = models.DateTimeField()
+    template = "%(expressions)s"
+
+    def __init__(self, name, shift):
+        super().__init__(models.F(name) + shift)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template="REPLACE(%(expressions)s, '+00:00', '')", **extra_context)
+
+
+class PromiseQuerySet(models.QuerySet):
+
+    def whole_promise_ids(self, user_ids):
+        """
+        Map each user id to the ids of its promises, inviter ones first.
+        ``user_ids`` is a list of ids or a queryset of users.
+
+        One UNION ALL query over user1/user2; only ids are fetched. A
+        queryset is filtered on as a subquery, so listing every user binds no
+        parameter per user (sqlite limits their number).
+        """
+        if isinstance(user_ids, models.QuerySet):
+            user_ids = user_ids.order_by().values("pk")
+        inviter = self.filter(user1__in=user_ids).values_list("user1", models.Value(0, models.IntegerField()), "id")
+        invitee = self.filter(user2__in=user_ids).values_list("user2", models.Value(1, models.IntegerField()), "id")
+
+        promise_ids = defaultdict(list)
+        for user_id, _, promise_id in sorted(inviter.union(invitee, all=True)):
+            promise_ids[user_id].append(promise_id)
+        return promise_ids
+
+    def rows(self, *extra):
+        """
+        The promises as dicts, for PromiseRowSerializer, with the ``extra``
+        columns as well.
+
+        sqlite stores datetimes as UTC text, and parsing that into aware
+        datetimes is most of the cost of reading a promise. There the
+        datetime columns come back as the stored text, under ``<name>_text``
+        keys, and PromiseRowSerializer rewrites the string instead.
+        """
+        if connections[self.db].vendor != "sqlite" or not settings.USE_TZ:
+            return self.values("id", "user1_id", "user2_id", *DATETIME_COLUMNS, *extra)
+        text = {f"{name}_text": Cast(name, models.TextField()) for name in DATETIME_COLUMNS}
+        return self.annotate(**text).values("id", "user1_id", "user2_id", *text, *extra)
+
+    def changes(self, since, limit):
+        """
+        The first ``limit`` changes numbered after ``since``, as
+        (seq, promise id, kind) in seq order: CHANGED for promises created or
+        updated, DELETED for tombstones. When tombstones after ``since`` were
+        already compacted, a (horizon, 0, EXPIRED) row is among them before
+        any change past the horizon.
+
+        One UNION ALL over the seq indexes; when nothing changed it reads no
+        rows at all.
+        """
+        kind = models.IntegerField()
+        changed = self.filter(seq__gt=since).values_list("seq", "id", models.Value(CHANGED, kind))
+        deleted = PromiseTombstone.objects.filter(seq__gt=since) \
+            .values_list("seq", "promise_id", models.Value(DELETED, kind))
+        expired = Sequence.objects.filter(name=TOMBSTONE_HORIZON, value__gt=since) \
+            .values_list("value", models.Value(0, kind), models.Value(EXPIRED, kind))
+        return list(changed.union(deleted, expired, all=True).order_by("seq")[:limit])
+
+    def involving(self, *user_ids):
+        # promises where any of the users is inviter or invitee
+        return self.filter(models.Q(user1__in=user_ids) | models.Q(user2__in=user_ids))
+
+    def overlapping(self, start, end):
+        """
+        Promises whose [sinceWhen, tilWhen) intersects [start, end).
+
+        No promise lasts longer than the longest stored duration, so any
+        overlapping one starts after ``start - longest``. That bounds the scan
+        of the sinceWhen indexes to the window plus one longest promise,
+        instead of the whole history before ``end``. The longest duration is
+        read from the duration index first and passed as a literal, because
+        sqlite does not use a subquery bound inside the OR of involving().
+        """
+        longest = Promise.objects.aggregate(longest=models.Max("duration"))["longest"]
+        if longest is None:
+            return self.none()
+        queryset = self.filter(sinceWhen__lt=end, tilWhen__gt=start)
+        try:
+            return queryset.filter(sinceWhen__gt=start - longest)
+        except OverflowError:
+            # the window starts within one longest promise of datetime.min
+            return queryset
+
+    def agenda(self, user_id, after, limit):
+        """
+        The first ``limit`` promises of the user starting at or after ``after``,
+        in (sinceWhen, id) order.
+
+        Each role reads at most ``limit`` rows off its (user, sinceWhen) index
+        and the two sorted streams are merged, so the cost depends on
+        ``limit`` and not on the user's history.
+        """
+        as_inviter = self.filter(user1=user_id, sinceWhen__gte=after).order_by("sinceWhen", "id")[:limit]
+        as_invitee = self.filter(user2=user_id, sinceWhen__gte=after).order_by("sinceWhen", "id")[:limit]
+        merged = heapq.merge(as_inviter, as_invitee, key=lambda promise: (promise.sinceWhen, promise.id))
+        return list(islice(merged, limit))
+
+    def bulk_insert(self, rows):
+        """
+        Insert promises given as (sinceWhen, tilWhen, user1_id, user2_id)
+        rows in one transaction, numbered for the change feed, and return
+        their ids in order.
+
+        bulk_create() without model instances: converting values for the
+        database is most of its cost, here each distinct value is converted
+        once and all rows go to one executemany(). The ids are read back by
+        seq, which every backend can do.
+        """
+        rows = list(rows)
+        if not rows:
+            return []
+        self._for_write = True
+        db = self.db
+        connection = connections[db]
+        meta = self.model._meta
+        fields = [meta.get_field(name) for name in ("created", "updated", "sinceWhen", "tilWhen", "duration")]
+        columns = [field.column for field in fields] + [meta.get_field(name).column for name in ("user1", "user2", "seq")]
+        sql = "INSERT INTO %s (%s) VALUES (%s)" % (
+            connection.ops.quote_name(meta.db_table),
+            ", ".join(connection.ops.quote_name(column) for column in columns),
+            ", ".join(["%s"] * len(columns)))
+
+        prepared = {}
+
+        def prepare(field, value):
+            key = (field.attname, value)
+            if key not in prepared:
+                prepared[key] = field.get_db_prep_save(value, connection)
+            return prepared[key]
+
+        now = timezone.now()
+        created, updated, since, til, duration = fields
+        with transaction.atomic(using=db):
+            first = Sequence.objects.db_manager(db).allocate(PROMISE_CHANGES, len(rows))
+            params = [(prepare(created, now), prepare(updated, now), prepare(since, sinceWhen), prepare(til, tilWhen),
+                       prepare(duration, tilWhen - sinceWhen), user1_id, user2_id, seq)
+                      for seq, (sinceWhen, tilWhen, user1_id, user2_id) in enumerate(rows, first)]
+            with connection.cursor() as cursor:
+                cursor.executemany(sql, params)
+            ids = dict(self.using(db).filter(seq__gte=first, seq__lt=first + len(rows)).values_list("seq", "id"))
+        return [ids[seq] for seq in range(first, first + len(rows))]
+
+    def bulk_delete(self, ids):
+        """
+        Delete the promises with these ids with one DELETE statement, and
+        return how many there were.
+
+        delete() would load every row to send post_delete; nothing is sent
+        here, the caller sends promises_changed instead.
+        """
+        self._for_write = True
+        connection = connections[self.db]
+        meta = self.model._meta
+        sql = "DELETE FROM %s WHERE %s IN (%s)" % (
+            connection.ops.quote_name(meta.db_table), connection.ops.quote_name(meta.pk.column),
+            ", ".join(["%s"] * len(ids)))
+        with connection.cursor() as cursor:
+            cursor.execute(sql, list(ids))
+            return cursor.rowcount
+
+    def attach_whole_promises(self, users, queryset=None):
+        # read by UserAllSerializer.get_whole_promises; ``queryset`` selects
+        # the same users, for large lists
+        promise_ids = self.whole_promise_ids([user.id for user in users] if queryset is None else queryset)
+        for user in users:
+            user.whole_promise_ids = promise_ids.get(user.id, [])
+        return users
+
+
+class SequenceManager(models.Manager):
+
+    def allocate(self, name, count=1):
+        """
+        Reserve ``count`` consecutive numbers of the sequence, return the first.
+
+        Call it inside the transaction making the change: the UPDATE keeps the
+        row locked until that transaction ends, so numbers become visible in
+        the order they were handed out, and a reader that has seen number n
+        never sees a lower one commit later.
+        """
+        if not self.filter(name=name).update(value=models.F("value") + count):
+            # the migrations create the rows; this is for a flushed database,
+            # where a concurrent transaction may create the row first
+            try:
+                with transaction.atomic(using=self.db):
+                    self.create(name=name, value=count)
+            except IntegrityError:
+                self.filter(name=name).update(value=models.F("value") + count)
+        return self.current(name) - count + 1
+
+    def current(self, name):
+        return self.filter(name=name).values_list("value", flat=True).first() or 0
+
+
+class Sequence(models.Model):
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+    objects = SequenceManager()
+
 
 class Promise(models.Model):
     created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True, db_index=True)
     sinceWhen = models.DateTimeField()
     tilWhen = models.DateTimeField()
+    # tilWhen - sinceWhen, maintained by save(); bounds overlap queries
+    duration = models.DurationField(editable=False, db_index=True)
     user1 = models.ForeignKey("auth.User", related_name="promises_as_inviter", on_delete=models.CASCADE)
     user2 = models.ForeignKey("auth.User", related_name="promises_as_invitee", on_delete=models.CASCADE)
+    # position in the change feed, renumbered by every save (see changes())
+    seq = models.BigIntegerField(editable=False, db_index=True)
+
+    objects = PromiseQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # keyset pagination of the promise list (see pagination.py)
+            models.Index(fields=["created", "id"], name="promise_created_id_idx"),
+            # time window queries (see PromiseQuerySet.overlapping)
+            models.Index(fields=["sinceWhen", "tilWhen"], name="promise_since_til_idx"),
+            # per user agendas (see PromiseQuerySet.agenda)
+            models.Index(fields=["user1", "sinceWhen"], name="promise_user1_since_idx"),
+            models.Index(fields=["user2", "sinceWhen"], name="promise_user2_since_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.duration = self.tilWhen - self.sinceWhen
+        with transaction.atomic():
+            self.seq = Sequence.objects.allocate(PROMISE_CHANGES)
+            super().save(*args, **kwargs)
+
+
+class PromiseTombstoneQuerySet(models.QuerySet):
+
+    def compact(self, before):
+        """
+        Drop the tombstones of promises deleted before ``before`` and move the
+        horizon past them. Returns the number of tombstones dropped.
+        """
+        with transaction.atomic():
+            last = self.filter(deleted__lt=before).aggregate(last=models.Max("seq"))["last"]
+            if last is None:
+                return 0
+            count, _ = self.filter(seq__lte=last).delete()
+            if not Sequence.objects.filter(name=TOMBSTONE_HORIZON).update(value=Greatest("value", last)):
+                Sequence.objects.create(name=TOMBSTONE_HORIZON, value=last)
+        return count
+
+
+class PromiseTombstone(models.Model):
+    """
+    A deleted promise, kept for the change feed until compacted.
+    """
+    seq = models.BigIntegerField(unique=True)
+    promise_id = models.IntegerField()
+    # who to tell, see promises.events
+    user1_id = models.IntegerField(null=True)
+    user2_id = models.IntegerField(null=True)
+    deleted = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    objects = PromiseTombstoneQuerySet.as_manager()
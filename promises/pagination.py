@@ -0,0 +1,27 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+from promises.models import parse_stored_datetime
+
+
+class PromiseCursorPagination(CursorPagination):
+    """
+    Keyset pagination over (created, id).
+
+    The cursor stores the last seen ``created`` value, so each page is an
+    index range scan on ``promise_created_id_idx`` no matter how deep the
+    client pages.
+    """
+    ordering = ("created", "id")
+    page_size = settings.PROMISE_PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = settings.PROMISE_MAX_PAGE_SIZE
+
+    # PromiseQuerySet.rows() may carry created as sqlite's stored text; the
+    # position has to read like str() of the aware datetime
+    # override
+    def _get_position_from_instance(self, instance, ordering):
+        text = ordering[0].lstrip("-") + "_text"
+        if isinstance(instance, dict) and text in instance:
+            return str(parse_stored_datetime(instance[text]))
+        return super()._get_position_from_instance(instance, ordering)
@@ -8,7 +8,8 @@ class IsRelated(permissions.BasePermission):
 
     def has_object_permission(self, request, view, obj):
         # if not related, false
-        if request.user.id not in [obj.user1.id, obj.user2.id]:
+        # compare raw foreign key ids so the User rows are never fetched
+        if request.user.id not in (obj.user1_id, obj.user2_id):
             return False
 
         return True
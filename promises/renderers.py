@@ -0,0 +1,58 @@
+"""
+MessagePack for clients reading and writing promises in bulk.
+
+Datetimes travel as plain integers, microseconds since the Unix epoch
+(UTC), so any MessagePack library decodes them without an extension hook.
+Serializers hand them over unformatted when the accepted renderer has
+``native_datetimes``, see promises.serializers.native_datetimes. In
+MessagePack request bodies, the datetime fields take the same integers as
+well as ISO 8601 strings, see promises.serializers.epoch_micros_input.
+
+msgpack is optional: without it the renderer and parser are not enabled
+in settings.REST_FRAMEWORK.
+"""
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+from django.utils.encoding import force_str
+from django.utils.functional import Promise as LazyString
+from rest_framework.renderers import BaseRenderer
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def to_epoch_micros(value):
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return (value - EPOCH) // MICROSECOND
+
+
+def from_epoch_micros(value):
+    return EPOCH + value * MICROSECOND
+
+
+def default(obj):
+    if isinstance(obj, datetime):
+        return to_epoch_micros(obj)
+    if isinstance(obj, LazyString):
+        return force_str(obj)
+    raise TypeError(f"Cannot serialize {type(obj).__name__} to msgpack")
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+    native_datetimes = True
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack.packb(data, default=default, use_bin_type=True)
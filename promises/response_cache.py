@@ -0,0 +1,118 @@
+"""
+Server-side cache of rendered user endpoint responses.
+
+Entries live in the ``settings.RESPONSE_CACHE_ALIAS`` cache, bounded by
+MAX_ENTRIES. Every (endpoint, pk) namespace - pk is None for the list -
+carries a version token that is part of its keys; evicting a namespace
+drops the token, so exactly the entries of that namespace stop being served
+and age out of the backend.
+
+Tokens and entries are only evicted everywhere when all processes share the
+backend: with local memory (the development profile) a write in one worker
+leaves the others serving stale responses for up to TIMEOUT. The stats are
+per process.
+"""
+import hashlib
+import threading
+import uuid
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+from promises import routers
+
+
+class ResponseCache:
+
+    def __init__(self, alias):
+        self.alias = alias
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def _count(self, counter, n=1):
+        with self._lock:
+            self._stats[counter] += n
+
+    def reset_stats(self):
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def _version_key(self, endpoint, pk):
+        return f"response-version:{endpoint}:{'list' if pk is None else pk}"
+
+    def _version(self, endpoint, pk):
+        key = self._version_key(endpoint, pk)
+        version = self.backend.get(key)
+        if version is None:
+            self.backend.add(key, uuid.uuid4().hex, None)
+            version = self.backend.get(key)
+        return version
+
+    def key(self, endpoint, pk, request):
+        query = urlencode(sorted(request.query_params.lists()), doseq=True)
+        digest = hashlib.md5(f"{request.accepted_media_type}?{query}".encode()).hexdigest()
+        return f"response:{endpoint}:{pk}:{self._version(endpoint, pk)}:{digest}"
+
+    def get(self, key):
+        cached = self.backend.get(key)
+        self._count("misses" if cached is None else "hits")
+        if cached is None:
+            return None
+        status, content_type, content = cached
+        return HttpResponse(content, status=status, content_type=content_type)
+
+    def set(self, key, response):
+        self.backend.set(key, (response.status_code, response["Content-Type"], response.content))
+
+    def evict(self, endpoint, pk=None):
+        self.backend.delete(self._version_key(endpoint, pk))
+        self._count("evictions")
+
+    def evict_users(self, *user_ids):
+        # everything that renders these users or their promise ids
+        for endpoint in ("users", "userall"):
+            self.evict(endpoint)
+            for user_id in set(user_ids):
+                self.evict(endpoint, str(user_id))
+
+
+response_cache = ResponseCache(settings.RESPONSE_CACHE_ALIAS)
+
+
+class CachedResponseMixin:
+    """
+    Serve GET from response_cache; ``cache_endpoint`` names the namespace.
+    Only responses read from the primary are stored.
+    """
+    cache_endpoint = None
+
+    # override
+    def get(self, request, *args, **kwargs):
+        pk = kwargs.get("pk")
+        # /users/007/ is /users/7/, and evicted with it
+        key = response_cache.key(self.cache_endpoint, None if pk is None else str(int(pk)), request)
+        cached = response_cache.get(key)
+        if cached is not None:
+            return cached
+        self.response_cache_key = key
+        return super().get(request, *args, **kwargs)
+
+    # override
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(self, "response_cache_key", None)
+        # a lagging replica's response would outlive the eviction of the
+        # write it missed
+        if key is not None and response.status_code == 200 and not response.streaming \
+                and routers.reading_from() is None:
+            response.add_post_render_callback(lambda rendered: response_cache.set(key, rendered))
+        return response
@@ -0,0 +1,56 @@
+"""
+Read replicas.
+
+Writes always go to the primary, "default". Reads go to the replica chosen
+for the current request by promises.middleware.ReplicaRoutingMiddleware, or
+to the primary outside of requests (commands, shell) and for requests that
+must see the latest writes.
+"""
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+_routing = threading.local()
+
+
+def choose_replica():
+    return random.choice(settings.READ_REPLICAS) if settings.READ_REPLICAS else None
+
+
+def reading_from():
+    # the replica reads go to in this thread, None for the primary
+    return getattr(_routing, "replica", None)
+
+
+@contextmanager
+def read_from(replica):
+    previous = reading_from()
+    _routing.replica = replica
+    try:
+        yield
+    finally:
+        _routing.replica = previous
+
+
+def read_from_primary():
+    # for the rest of the enclosing read_from() block
+    _routing.replica = None
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        return reading_from() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    # replicas are copies of the primary
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.READ_REPLICAS
@@ -0,0 +1,34 @@
+"""
+Sweep-line helpers over (since, til) intervals, used by the free/busy view.
+"""
+
+
+def busy_blocks(intervals, start, end):
+    """
+    Merge intervals into disjoint, sorted busy blocks clipped to [start, end).
+    """
+    blocks = []
+    for since, til in sorted(intervals):
+        since, til = max(since, start), min(til, end)
+        if since >= til:
+            continue
+        if blocks and since <= blocks[-1][1]:
+            if til > blocks[-1][1]:
+                blocks[-1] = (blocks[-1][0], til)
+        else:
+            blocks.append((since, til))
+    return blocks
+
+
+def free_slots(blocks, start, end, min_length):
+    """
+    Gaps of at least ``min_length`` between sorted disjoint busy blocks
+    inside [start, end).
+    """
+    slots = []
+    cursor = start
+    for since, til in blocks + [(end, end)]:
+        if since > cursor and since - cursor >= min_length:
+            slots.append((cursor, since))
+        cursor = max(cursor, til)
+    return slots
@@ -1,24 +1,177 @@
-from rest_framework import serializers
-from promises.models import Promise
+from datetime import datetime, timedelta
+
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from promises.models import DATETIME_COLUMNS, Promise, parse_stored_datetime
+from promises.renderers import MessagePackRenderer, from_epoch_micros
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.db import models
+from django.utils import timezone
+from django.utils.dateparse import datetime_re
+
+
+def native_datetimes(context):
+    # renderers that encode datetimes themselves (MessagePackRenderer) get
+    # datetime objects instead of ISO 8601 strings
+    renderer = getattr(context.get("request"), "accepted_renderer", None)
+    return getattr(renderer, "native_datetimes", False)
+
+
+class IsoDateTimeField(serializers.DateTimeField):
+    """
+    DateTimeField reading ISO 8601 strings with datetime.fromisoformat(),
+    many times faster than django.utils.dateparse, for request bodies with
+    thousands of datetimes. With ``epoch_micros``, integers are read as
+    microseconds since the epoch, the way MessagePack bodies carry
+    datetimes. Anything else goes through DateTimeField.
+    """
+
+    def __init__(self, *args, epoch_micros=False, **kwargs):
+        self.epoch_micros = epoch_micros
+        super().__init__(*args, **kwargs)
+
+    # override
+    def to_internal_value(self, value):
+        if self.epoch_micros and isinstance(value, int) and not isinstance(value, bool):
+            try:
+                return self.enforce_timezone(from_epoch_micros(value))
+            except OverflowError:
+                self.fail("overflow")
+        input_formats = getattr(self, "input_formats", api_settings.DATETIME_INPUT_FORMATS)
+        # only what parse_datetime() accepts; fromisoformat() takes more
+        if isinstance(value, str) and ISO_8601 in input_formats and datetime_re.match(value):
+            try:
+                parsed = datetime.fromisoformat(value)
+            except ValueError:
+                pass
+            else:
+                return self.enforce_timezone(parsed)
+        return super().to_internal_value(value)
+
+
+def epoch_micros_input(request):
+    # MessagePack request bodies carry datetimes as epoch microseconds
+    content_type = getattr(request, "content_type", "") or ""
+    return content_type.split(";")[0].strip() == MessagePackRenderer.media_type
 
 
-class PromiseSerializer(serializers.ModelSerializer):
-    user1 = serializers.ReadOnlyField(source="user1.id")
-    #  user1 = serializers.ReadOnlyField(source="user1.id")
+class NativeDatetimesMixin:
+    serializer_field_mapping = dict(serializers.ModelSerializer.serializer_field_mapping)
+    serializer_field_mapping[models.DateTimeField] = IsoDateTimeField
+
+    # override
+    def get_fields(self):
+        fields = super().get_fields()
+        native = native_datetimes(self.context)
+        epoch_micros = epoch_micros_input(self.context.get("request"))
+        for field in fields.values():
+            if isinstance(field, serializers.DateTimeField):
+                if native:
+                    field.format = None
+                if isinstance(field, IsoDateTimeField):
+                    field.epoch_micros = epoch_micros
+        return fields
+
+
+# user1/user2 are read from the foreign key columns (user1_id/user2_id) so
+# serializing a promise never fetches the related User rows
+class PromiseSerializer(NativeDatetimesMixin, serializers.ModelSerializer):
+    user1 = serializers.ReadOnlyField(source="user1_id")
 
     class Meta:
         model = Promise
-        fields = "__all__"
+        exclude = ("duration", "seq")
 
 
-class PromiseSerializerWithoutUser(serializers.ModelSerializer):
-    user1 = serializers.ReadOnlyField(source="user1.id")
-    user2 = serializers.ReadOnlyField(source="user2.id")
+class PromiseSerializerWithoutUser(NativeDatetimesMixin, serializers.ModelSerializer):
+    user1 = serializers.ReadOnlyField(source="user1_id")
+    user2 = serializers.ReadOnlyField(source="user2_id")
 
     class Meta:
         model = Promise
-        fields = "__all__"
+        exclude = ("duration", "seq")
+
+
+def datetime_formatters(native=False):
+    """
+    Two functions rendering datetimes exactly like serializers.DateTimeField:
+    one for datetimes, one for sqlite's stored text of a datetime (see
+    parse_stored_datetime).
+
+    For ISO 8601 output in UTC, the default, neither goes through the field:
+    datetimes already in the current timezone only need isoformat(), and the
+    stored text in its usual "YYYY-MM-DD HH:MM:SS[.ffffff]" form only needs
+    its separator and suffix rewritten. ``native`` leaves datetimes as they
+    are, like ``DateTimeField(format=None)``.
+    """
+    if native:
+        return (lambda value: value), parse_stored_datetime
+    field = serializers.DateTimeField()
+    output_format = api_settings.DATETIME_FORMAT
+    iso = output_format is not None and output_format.lower() == ISO_8601 and settings.USE_TZ
+    current = timezone.get_current_timezone()
+
+    def format_datetime(value):
+        if not iso or value is None or value.tzinfo is not current:
+            return field.to_representation(value)
+        value = value.isoformat()
+        return value[:-6] + "Z" if value.endswith("+00:00") else value
+
+    def format_text(value):
+        return format_datetime(parse_stored_datetime(value))
+
+    def format_utc_text(value):
+        # anything longer carries an offset
+        if len(value) not in (19, 26):
+            return format_text(value)
+        return value[:10] + "T" + value[11:] + "Z"
+
+    if iso and current.utcoffset(None) == timedelta(0):
+        return format_datetime, format_utc_text
+    return format_datetime, format_text
+
+
+class PromiseRowListSerializer(serializers.ListSerializer):
+    # override
+    def to_representation(self, data):
+        return self.child.rows_to_representation(data)
+
+
+class PromiseRowSerializer(serializers.BaseSerializer):
+    """
+    Read only PromiseSerializer for PromiseQuerySet.rows() dicts.
+
+    Renders the same JSON with one dict display per row, instead of a
+    to_representation call per field.
+    """
+
+    class Meta:
+        list_serializer_class = PromiseRowListSerializer
+
+    def to_representation(self, row):
+        return self.rows_to_representation([row])[0]
+
+    def rows_to_representation(self, rows):
+        rows = list(rows)
+        format_datetime, format_text = datetime_formatters(native_datetimes(self.context))
+        text = bool(rows) and "created_text" in rows[0]
+        if text:
+            format_datetime = format_text
+        created, updated, since, til = (f"{name}_text" if text else name for name in DATETIME_COLUMNS)
+        # keys in PromiseSerializer field order
+        return [
+            {
+                "id": row["id"],
+                "user1": row["user1_id"],
+                "created": format_datetime(row[created]),
+                "updated": format_datetime(row[updated]),
+                "sinceWhen": format_datetime(row[since]),
+                "tilWhen": format_datetime(row[til]),
+                "user2": row["user2_id"],
+            }
+            for row in rows
+        ]
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -27,6 +180,12 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ("id", "username", "promises_as_inviter", "promises_as_invitee")
 
 
+class UserLookupSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ("id", "username")
+
+
 class UserAllSerializer(serializers.ModelSerializer):
     whole_promises = serializers.SerializerMethodField()
 
@@ -36,6 +195,10 @@ class UserAllSerializer(serializers.ModelSerializer):
 
     # obj is User
     def get_whole_promises(self, obj):
+        # precomputed in bulk by Promise.objects.attach_whole_promises
+        if hasattr(obj, "whole_promise_ids"):
+            return obj.whole_promise_ids
+
         inviter = [promise.id for promise in obj.promises_as_inviter.all()]
         invitee = [promise.id for promise in obj.promises_as_invitee.all()]
 
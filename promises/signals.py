@@ -0,0 +1,87 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from promises import events
+from promises.authentication import deny_list
+from promises.models import PROMISE_CHANGES, USER_CHANGES, Promise, PromiseTombstone, Sequence
+from promises.response_cache import response_cache
+
+# Sent by the bulk endpoints, whose bulk_create/update/delete bypass the
+# model signals. Arguments: action ("create", "update" or "delete") and
+# rows, a list of (id, user1_id, user2_id) of the affected promises.
+promises_changed = Signal()
+
+
+def evict_now_and_on_commit(*user_ids):
+    # evicting again on commit stops a concurrent reader from caching the
+    # pre-commit state in between
+    response_cache.evict_users(*user_ids)
+    transaction.on_commit(lambda: response_cache.evict_users(*user_ids))
+
+
+@receiver(post_save, sender=Promise)
+@receiver(post_delete, sender=Promise)
+def evict_promise_responses(sender, instance, **kwargs):
+    evict_now_and_on_commit(instance.user1_id, instance.user2_id)
+
+
+@receiver(promises_changed)
+def evict_bulk_promise_responses(sender, action, rows, **kwargs):
+    user_ids = set()
+    for _, user1_id, user2_id in rows:
+        user_ids.update((user1_id, user2_id))
+    evict_now_and_on_commit(*user_ids)
+
+
+@receiver(post_delete, sender=Promise)
+def leave_tombstone(sender, instance, **kwargs):
+    # post_delete runs inside the deleting transaction, see Sequence.allocate
+    PromiseTombstone.objects.create(seq=Sequence.objects.allocate(PROMISE_CHANGES), promise_id=instance.pk,
+                                    user1_id=instance.user1_id, user2_id=instance.user2_id)
+
+
+@receiver(promises_changed)
+def leave_bulk_tombstones(sender, action, rows, **kwargs):
+    if action != "delete":
+        return
+    first = Sequence.objects.allocate(PROMISE_CHANGES, len(rows))
+    tombstones = [PromiseTombstone(seq=seq, promise_id=promise_id, user1_id=user1_id, user2_id=user2_id)
+                  for seq, (promise_id, user1_id, user2_id) in enumerate(rows, first)]
+    PromiseTombstone.objects.bulk_create(tombstones)
+
+
+# the event streams read the change feed; these only spare streams of this
+# process the wait for the next poll
+@receiver(post_save, sender=Promise)
+@receiver(post_delete, sender=Promise)
+def wake_event_streams(sender, **kwargs):
+    events.wake_on_commit()
+
+
+@receiver(promises_changed)
+def wake_bulk_event_streams(sender, **kwargs):
+    events.wake_on_commit()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def evict_user_responses(sender, instance, **kwargs):
+    evict_now_and_on_commit(instance.pk)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def count_user_change(sender, instance, update_fields=None, **kwargs):
+    # logins only save last_login, which no response renders
+    if update_fields is not None and set(update_fields) == {"last_login"}:
+        return
+    Sequence.objects.allocate(USER_CHANGES)
+
+
+@receiver(post_delete, sender=User)
+def deny_user_tokens(sender, instance, **kwargs):
+    # tokens authenticate by their signature alone, a deleted user's would
+    # until they expire
+    deny_list.deny_user(instance.pk)
@@ -0,0 +1,72 @@
+"""
+Streaming list responses.
+
+``?stream=1`` on a list endpoint sends the whole (filtered) list as one
+JSON array without building it in memory: the queryset is read with
+``.iterator()``, serialized and rendered ``STREAM_CHUNK_SIZE`` rows at a
+time, and each chunk is written out as soon as it is rendered. The bytes
+are the same as the non streaming, unpaginated JSON response.
+"""
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import prefetch_related_objects
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class StreamingListMixin:
+    """
+    Answer list GETs with ``?stream=1`` as a streamed JSON array.
+
+    Pagination is skipped in that mode. Other media types, and indented
+    JSON, fall back to the regular list response.
+    """
+    stream_param = "stream"
+    stream_ordering = None
+
+    def should_stream(self, request):
+        if request.query_params.get(self.stream_param) not in ("1", "true"):
+            return False
+        renderer = request.accepted_renderer
+        return isinstance(renderer, JSONRenderer) and \
+            renderer.get_indent(request.accepted_media_type, self.get_renderer_context()) is None
+
+    # prefetch_related is ignored by .iterator(), so run it per chunk
+    def prepare_stream_chunk(self, objs, queryset):
+        prefetch_related_objects(objs, *queryset._prefetch_related_lookups)
+
+    def stream_chunks(self, queryset):
+        renderer = self.request.accepted_renderer
+        media_type = self.request.accepted_media_type
+        context = self.get_renderer_context()
+        # one serializer for all chunks: serializers and their bound fields
+        # are reference cycles, a new one per chunk piles up until gc runs
+        serializer = self.get_serializer(many=True)
+        yield b"["
+        separator = b""
+        for objs in chunked(queryset.iterator(chunk_size=settings.STREAM_CHUNK_SIZE), settings.STREAM_CHUNK_SIZE):
+            self.prepare_stream_chunk(objs, queryset)
+            data = serializer.to_representation(objs)
+            # "[a,b]" -> "a,b"
+            yield separator + renderer.render(data, media_type, context)[1:-1]
+            separator = b","
+        yield b"]"
+
+    # override
+    def list(self, request, *args, **kwargs):
+        if not self.should_stream(request):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.stream_ordering is not None:
+            queryset = queryset.order_by(*self.stream_ordering)
+        return StreamingHttpResponse(self.stream_chunks(queryset), content_type=request.accepted_media_type)
@@ -1,12 +1,44 @@
+import asyncio
+import base64
+import io
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
 import unittest
 from datetime import datetime, timedelta
+from unittest import mock
 
 import pytz
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.db.models import F, QuerySet
+from django.http import HttpResponse, QueryDict
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import DateTimeField
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
 
-from promises import models
+from homeworktwo.asgi import END, ASGIHandler, Channel
+from promises import events, models, renderers, schedule, serializers, views
+from promises.authentication import TokenDenyList, deny_list, issue_token
+from promises.backends import credential_cache
+from promises.events import Broadcaster, broadcaster
+from promises.response_cache import ResponseCache, response_cache
 
 
 def iso8601(dt):
@@ -26,6 +58,10 @@ class PromisesUtilMixins(unittest.TestCase):
         setattr(self, username, user)
         return user
 
+    def basic_auth(self, username, password):
+        token = base64.b64encode(f'{username}:{password}'.encode()).decode()
+        return {'HTTP_AUTHORIZATION': f'Basic {token}'}
+
     def create_promises_between_users(self, users):
         time = datetime(2018, 4, 1).astimezone(self.timezone)
         for inviter in users:
@@ -101,7 +137,86 @@ class TestPromises(TestCase, PromisesUtilMixins):
 
         # then
         self.assertEqual(resp.status_code, 200)
-        self.assertEqual(len(resp.data), 6)
+        self.assertEqual(len(resp.data['results']), 6)
+        self.assertIsNone(resp.data['next'])
+
+    def test_list_promises_paginated(self):
+        # when
+        first = self.client.get('/promises/', {'page_size': 4})
+        second = self.client.get(first.data['next'])
+
+        # then
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        self.assertIsNone(first.data['previous'])
+        self.assertIsNone(second.data['next'])
+        ids = [p['id'] for p in first.data['results'] + second.data['results']]
+        self.assertListEqual(ids, sorted(models.Promise.objects.values_list('id', flat=True)))
+
+    def test_list_promises_invalid_cursor(self):
+        # when
+        resp = self.client.get('/promises/', {'cursor': 'garbage'})
+
+        # then
+        self.assertEqual(resp.status_code, 404)
+
+    def test_list_promises_in_window(self):
+        # setup
+        window_start = self.promise_messi_neymar.sinceWhen + timedelta(minutes=30)
+        window_end = self.promise_ronaldo_messi.sinceWhen + timedelta(minutes=30)
+
+        # when
+        resp = self.client.get('/promises/', {'from': iso8601(window_start), 'to': iso8601(window_end)})
+
+        # then
+        self.assertEqual(resp.status_code, 200)
+        self.assertListEqual([p['id'] for p in resp.data['results']], [
+            self.promise_messi_neymar.id,
+            self.promise_ronaldo_messi.id,
+        ])
+
+    def test_list_promises_in_window_with_long_promise(self):
+        # setup
+        since = self.promise_messi_ronaldo.sinceWhen - timedelta(days=30)
+        long_promise = models.Promise(sinceWhen=since, tilWhen=since + timedelta(days=60),
+                                      user1=self.neymar, user2=self.messi)
+        long_promise.save()
+        window_start = self.promise_neymar_ronaldo.sinceWhen
+
+        # when
+        resp = self.client.get('/promises/', {
+            'from': iso8601(window_start),
+            'to': iso8601(window_start + timedelta(minutes=10))
+        })
+
+        # then
+        self.assertListEqual([p['id'] for p in resp.data['results']], [
+            self.promise_neymar_ronaldo.id,
+            long_promise.id,
+        ])
+
+    def test_list_promises_in_window_from_year_one(self):
+        # setup
+        window_end = self.promise_ronaldo_messi.sinceWhen + timedelta(minutes=30)
+
+        # when
+        resp = self.client.get('/promises/', {'from': '0001-01-01T00:00:00Z', 'to': iso8601(window_end)})
+
+        # then
+        self.assertEqual(resp.status_code, 200)
+        self.assertSetEqual({p['id'] for p in resp.data['results']},
+                            set(models.Promise.objects.filter(sinceWhen__lt=window_end).values_list('id', flat=True)))
+
+    def test_list_promises_with_invalid_window(self):
+        # when
+        reversed_window = self.client.get('/promises/', {'from': '2018-04-02T00:00:00Z', 'to': '2018-04-01T00:00:00Z'})
+        open_window = self.client.get('/promises/', {'from': '2018-04-01T00:00:00Z'})
+        garbage = self.client.get('/promises/', {'from': 'yesterday', 'to': '2018-04-01T00:00:00Z'})
+
+        # then
+        self.assertEqual(reversed_window.status_code, 400)
+        self.assertEqual(open_window.status_code, 400)
+        self.assertEqual(garbage.status_code, 400)
 
     def test_get_promise(self):
         # setup
@@ -116,6 +231,91 @@ class TestPromises(TestCase, PromisesUtilMixins):
                                user1=self.ronaldo.id,
                                user2=self.messi.id)
 
+    def test_get_promise_query_count(self):
+        # setup
+        self.client.force_authenticate(user=self.ronaldo)
+
+        # when, then
+        with self.assertNumQueries(1):
+            resp = self.client.get(f'/promises/{self.promise_ronaldo_messi.id}/')
+        self.assertEqual(resp.status_code, 200)
+
+    def test_list_promises_not_modified(self):
+        # setup
+        etag = self.client.get('/promises/')['ETag']
+
+        # when
+        with self.assertNumQueries(1):
+            resp = self.client.get('/promises/', HTTP_IF_NONE_MATCH=etag)
+
+        # then
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.content, b'')
+
+    def test_list_promises_modified(self):
+        # setup
+        etag = self.client.get('/promises/')['ETag']
+        self.promise_messi_neymar.delete()
+
+        # when
+        resp = self.client.get('/promises/', HTTP_IF_NONE_MATCH=etag)
+
+        # then
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp['ETag'], etag)
+
+    def test_list_promises_etag_depends_on_query(self):
+        # when
+        first_page = self.client.get('/promises/', {'page_size': 2})
+        resp = self.client.get('/promises/', HTTP_IF_NONE_MATCH=first_page['ETag'])
+
+        # then
+        self.assertEqual(resp.status_code, 200)
+
+    def test_get_promise_not_modified(self):
+        # setup
+        self.client.force_authenticate(user=self.ronaldo)
+        url = f'/promises/{self.promise_ronaldo_messi.id}/'
+        first = self.client.get(url)
+
+        # when
+        with self.assertNumQueries(1):
+            by_etag = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        by_date = self.client.get(url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+
+        # then
+        self.assertEqual(by_etag.status_code, 304)
+        self.assertEqual(by_date.status_code, 304)
+
+    def test_get_promise_modified(self):
+        # setup
+        self.client.force_authenticate(user=self.ronaldo)
+        url = f'/promises/{self.promise_ronaldo_messi.id}/'
+        etag = self.client.get(url)['ETag']
+        self.client.put(url, {
+            'sinceWhen': iso8601(self.promise_ronaldo_messi.sinceWhen),
+            'tilWhen': iso8601(self.promise_ronaldo_messi.tilWhen + timedelta(hours=1)),
+        })
+
+        # when
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        # then
+        self.assertEqual(resp.status_code, 200)
+
+    def test_get_promise_of_others_with_etag(self):
+        # setup
+        self.client.force_authenticate(user=self.messi)
+        url = f'/promises/{self.promise_messi_neymar.id}/'
+        etag = self.client.get(url)['ETag']
+        self.client.force_authenticate(user=self.ronaldo)
+
+        # when
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        # then
+        self.assertEqual(resp.status_code, 403)
+
     def test_get_promise_without_authentication(self):
         # when
         resp = self.client.get(f'/promises/{self.promise_ronaldo_messi.id}/')
@@ -164,6 +364,79 @@ class TestPromises(TestCase, PromisesUtilMixins):
                                sinceWhen=promise_since,
                                tilWhen=promise_until)
 
+    def post_promise_from(self, hours, conflicts):
+        since = self.promise_messi_ronaldo.sinceWhen + timedelta(hours=hours)
+        return self.client.post(f'/promises/?conflicts={conflicts}', data={
+            'sinceWhen': iso8601(since),
+            'tilWhen': iso8601(since + timedelta(hours=1)),
+            'user2': self.messi.id
+        })
+
+    def test_create_promise_rejecting_conflicts(self):
+        # setup
+        self.client.force_authenticate(user=self.ronaldo)
+        count = models.Promise.objects.count()
+
+        # when
+        resp = self.post_promise_from(0.5, 'reject')
+
+        # then
+        self.assertEqual(resp.status_code, 409)
+        self.assertListEqual(resp.data['conflicts'], [self.promise_messi_ronaldo.id, self.promise_messi_neymar.id])
+        self.assertEqual(models.Promise.objects.count(), count)
+
+    def test_create_promise_reporting_conflicts(self):
+        # setup
+        self.client.force_authenticate(user=self.ronaldo)
+
+        # when
+        resp = self.post_promise_from(2, 'report')
+
+        # then
+        self.assertEqual(resp.status_code, 201)
+        self.assertListEqual(resp.data['conflicts'], [self.promise_ronaldo_messi.id])
+
+    def test_create_promise_without_conflicts(self):
+        # setup
+        self.client.force_authenticate(user=self.ronaldo)
+
+        # when
+        resp = self.post_promise_from(-1, 'reject')
+
+        # then
+        self.assertEqual(resp.status_code, 201)
+        self.assertNotIn('conflicts', resp.data)
+
+    def test_create_promise_with_invalid_conflict_mode(self):
+        # setup
+        self.client.force_authenticate(user=self.ronaldo)
+
+        # when
+        resp = self.post_promise_from(-1, 'ignore')
+
+        # then
+        self.assertEqual(resp.status_code, 400)
+
+    def test_update_promise_rejecting_conflicts(self):
+        # setup
+        promise = self.promise_ronaldo_messi
+        self.client.force_authenticate(user=self.ronaldo)
+
+        # when
+        moved = self.client.put(f'/promises/{promise.id}/?conflicts=reject', {
+            'sinceWhen': iso8601(promise.sinceWhen + timedelta(hours=10)),
+            'tilWhen': iso8601(promise.tilWhen + timedelta(hours=10)),
+        })
+        overlapping = self.client.put(f'/promises/{promise.id}/?conflicts=reject', {
+            'sinceWhen': iso8601(promise.sinceWhen + timedelta(hours=1)),
+            'tilWhen': iso8601(promise.tilWhen + timedelta(hours=1)),
+        })
+
+        # then
+        self.assertEqual(moved.status_code, 200)
+        self.assertEqual(overlapping.status_code, 409)
+        self.assertListEqual(overlapping.data['conflicts'], [self.promise_ronaldo_neymar.id])
+
     def test_create_promise_invalid_timespan(self):
         # setup
         promise_since = self.timezone.localize(datetime.now())
@@ -413,6 +686,81 @@ class TestUsers(TestCase, PromisesUtilMixins):
                                    self.promise_art3mis_anorak.id
                                ])
 
+    def test_list_users_query_count(self):
+        # setup
+        self.client.get('/users/')
+        self.create_promises_between_users([self.create_user(f'sixer{i}') for i in range(5)])
+
+        # when, then
+        # 3 for the ETag, 1 for the users and 1 per prefetched relation
+        with self.assertNumQueries(6):
+            resp = self.client.get('/users/')
+        self.assertEqual(len(resp.data), 8)
+
+    def test_list_users_not_modified(self):
+        # setup
+        etag = self.client.get('/users/')['ETag']
+
+        # when
+        not_modified = self.client.get('/users/', HTTP_IF_NONE_MATCH=etag)
+        self.create_user('sorrento')
+        modified = self.client.get('/users/', HTTP_IF_NONE_MATCH=etag)
+
+        # then
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(modified.status_code, 200)
+
+    def test_list_users_renamed(self):
+        # setup
+        etags = {url: self.client.get(url)['ETag'] for url in ('/users/', '/userall/')}
+
+        # when
+        self.parzival.last_login = timezone.now()
+        self.parzival.save(update_fields=['last_login'])
+        logged_in = {url: self.client.get(url, HTTP_IF_NONE_MATCH=etag) for url, etag in etags.items()}
+        self.parzival.username = 'wade'
+        self.parzival.save()
+        renamed = {url: self.client.get(url, HTTP_IF_NONE_MATCH=etag) for url, etag in etags.items()}
+
+        # then
+        self.assertListEqual([resp.status_code for resp in logged_in.values()], [304, 304])
+        self.assertListEqual([resp.status_code for resp in renamed.values()], [200, 200])
+        self.assertEqual(renamed['/userall/'].data[0]['username'], 'wade')
+
+    def test_get_user_query_count(self):
+        # when, then
+        with self.assertNumQueries(3):
+            self.client.get(f'/users/{self.art3mis.id}/')
+
+    def test_lookup_user_by_username(self):
+        # when, then
+        with self.assertNumQueries(1):
+            resp = self.client.get('/users/', {'username': 'art3mis'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertListEqual(resp.data, [{'id': self.art3mis.id, 'username': 'art3mis'}])
+
+    def test_lookup_nonexisting_username(self):
+        # when
+        resp = self.client.get('/users/', {'username': 'sorrento'})
+
+        # then
+        self.assertEqual(resp.status_code, 200)
+        self.assertListEqual(resp.data, [])
+
+    @override_settings(USER_LOOKUP_LIMIT=2)
+    def test_search_users_by_username_prefix(self):
+        # setup
+        for name in ['aech', 'ar', 'arty', 'art']:
+            self.create_user(name)
+
+        # when
+        resp = self.client.get('/userall/', {'username__startswith': 'ar'})
+
+        # then
+        self.assertEqual(resp.status_code, 200)
+        self.assertListEqual([user['username'] for user in resp.data], ['ar', 'art'])
+        self.assertListEqual(list(resp.data[0]), ['id', 'username'])
+
     def test_get_user(self):
         # when
         resp = self.client.get(f'/users/{self.art3mis.id}/')
@@ -430,6 +778,50 @@ class TestUsers(TestCase, PromisesUtilMixins):
                                    self.promise_anorak_art3mis.id
                                ])
 
+    def test_get_agenda(self):
+        # when
+        resp = self.client.get(f'/users/{self.art3mis.id}/agenda/', {
+            'after': iso8601(self.promise_art3mis_parzival.sinceWhen),
+            'limit': 3
+        })
+
+        # then
+        self.assertEqual(resp.status_code, 200)
+        self.assertListEqual([p['id'] for p in resp.data], [
+            self.promise_art3mis_parzival.id,
+            self.promise_art3mis_anorak.id,
+            self.promise_anorak_art3mis.id,
+        ])
+
+    def test_get_agenda_reads_limit_rows_per_role(self):
+        # setup
+        since = self.timezone.localize(datetime(2018, 5, 1))
+        for hour in range(20):
+            models.Promise(sinceWhen=since + timedelta(hours=hour), tilWhen=since + timedelta(hours=hour + 1),
+                           user1=self.parzival, user2=self.anorak).save()
+
+        # when
+        with self.assertNumQueries(3):
+            resp = self.client.get(f'/users/{self.parzival.id}/agenda/', {'after': iso8601(since), 'limit': 2})
+
+        # then
+        self.assertListEqual([p['sinceWhen'] for p in resp.data],
+                             ['2018-05-01T00:00:00Z', '2018-05-01T01:00:00Z'])
+
+    def test_get_agenda_with_invalid_limit(self):
+        # when
+        resp = self.client.get(f'/users/{self.art3mis.id}/agenda/', {'limit': 0})
+
+        # then
+        self.assertEqual(resp.status_code, 400)
+
+    def test_get_agenda_of_nonexisting_user(self):
+        # when
+        resp = self.client.get('/users/9999/agenda/')
+
+        # then
+        self.assertEqual(resp.status_code, 404)
+
     def test_get_nonexisting_user(self):
         # setup
         nonexisting_id = 9999
@@ -481,6 +873,53 @@ class TestUserAll(TestCase, PromisesUtilMixins):
                                    self.promise_art3mis_anorak.id
                                ])
 
+    def test_list_userall_query_count(self):
+        # setup
+        self.create_promises_between_users([self.create_user(f'sixer{i}') for i in range(5)])
+
+        # when, then
+        # 3 for the ETag, 1 for the users and 1 for their promise ids
+        with self.assertNumQueries(5):
+            resp = self.client.get('/userall/')
+        self.assertEqual(len(resp.data), 8)
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'sqlite variable limit')
+    def test_list_userall_binds_no_parameter_per_user(self):
+        # setup
+        User.objects.bulk_create(User(username=f'sixer{i}') for i in range(60))
+        connection.ensure_connection()
+        limit = connection.connection.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+        connection.connection.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 100)
+        self.addCleanup(connection.connection.setlimit, sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, limit)
+
+        # when
+        resp = self.client.get('/userall/')
+        streamed = self.client.get('/userall/?stream=1')
+
+        # then
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.data), 63)
+        self.assertEqual(len(resp.data[0]['whole_promises']), 4)
+        self.assertEqual(json.loads(b''.join(streamed.streaming_content)), json.loads(resp.content))
+
+    def test_list_userall_not_modified(self):
+        # setup
+        etag = self.client.get('/userall/')['ETag']
+
+        # when
+        not_modified = self.client.get('/userall/', HTTP_IF_NONE_MATCH=etag)
+        self.promise_anorak_art3mis.delete()
+        modified = self.client.get('/userall/', HTTP_IF_NONE_MATCH=etag)
+
+        # then
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(modified.status_code, 200)
+
+    def test_get_userall_query_count(self):
+        # when, then
+        with self.assertNumQueries(2):
+            self.client.get(f'/userall/{self.art3mis.id}/')
+
     def test_get_userall(self):
         # when
         resp = self.client.get(f'/userall/{self.art3mis.id}/')
@@ -505,3 +944,1829 @@ class TestUserAll(TestCase, PromisesUtilMixins):
 
         # then
         self.assertEqual(resp.status_code, 404)
+
+
+class TestCachedBasicAuthentication(TestCase, PromisesUtilMixins):
+    def setUp(self):
+        credential_cache.clear()
+        self.user = User.objects.create_user('sorrento', password='ioi-6-0-0-1')
+        self.client = APIClient()
+
+    def post_promise_as(self, password):
+        return self.client.post('/promises/', {}, **self.basic_auth('sorrento', password))
+
+    def test_repeated_requests_skip_password_hash(self):
+        # when
+        with mock.patch('django.contrib.auth.base_user.check_password', wraps=check_password) as hasher:
+            first = self.post_promise_as('ioi-6-0-0-1')
+            second = self.post_promise_as('ioi-6-0-0-1')
+
+        # then
+        self.assertEqual(first.status_code, 400)
+        self.assertEqual(second.status_code, 400)
+        self.assertEqual(hasher.call_count, 1)
+
+    def test_wrong_password_is_not_cached(self):
+        # when
+        self.post_promise_as('ioi-6-0-0-1')
+        resp = self.post_promise_as('wrong')
+
+        # then
+        self.assertEqual(resp.status_code, 403)
+
+    def test_password_change_invalidates_cache(self):
+        # setup
+        self.post_promise_as('ioi-6-0-0-1')
+        self.user.set_password('changed')
+        self.user.save()
+
+        # when
+        old = self.post_promise_as('ioi-6-0-0-1')
+        new = self.post_promise_as('changed')
+
+        # then
+        self.assertEqual(old.status_code, 403)
+        self.assertEqual(new.status_code, 400)
+
+    def test_rename_invalidates_cache(self):
+        # setup
+        self.post_promise_as('ioi-6-0-0-1')
+        self.user.username = 'i-r0k'
+        self.user.save()
+
+        # when
+        resp = self.post_promise_as('ioi-6-0-0-1')
+
+        # then
+        self.assertEqual(resp.status_code, 403)
+
+    def test_deactivation_invalidates_cache(self):
+        # setup
+        self.post_promise_as('ioi-6-0-0-1')
+        self.user.is_active = False
+        self.user.save()
+
+        # when
+        resp = self.post_promise_as('ioi-6-0-0-1')
+
+        # then
+        self.assertEqual(resp.status_code, 403)
+
+
+class TestSignedTokens(TestCase, PromisesUtilMixins):
+    def setUp(self):
+        deny_list.clear()
+        self.user = User.objects.create_user('halliday', password='copper-key')
+        wade = self.create_user('wade')
+        self.create_promises_between_users([self.user, wade])
+        self.promise = self.promise_halliday_wade
+        self.client = APIClient()
+
+    def obtain_token(self):
+        resp = self.client.post('/tokens/', {'username': 'halliday', 'password': 'copper-key'})
+        return resp.data['token']
+
+    def bearer(self, token):
+        return {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+    def test_obtain_token_with_wrong_password(self):
+        # when
+        resp = self.client.post('/tokens/', {'username': 'halliday', 'password': 'jade-key'})
+
+        # then
+        self.assertEqual(resp.status_code, 400)
+
+    def test_get_promise_with_token_reads_only_promise(self):
+        # setup
+        token = self.obtain_token()
+
+        # when, then
+        with self.assertNumQueries(1):
+            resp = self.client.get(f'/promises/{self.promise.id}/', **self.bearer(token))
+        self.assertEqual(resp.status_code, 200)
+
+    def test_create_promise_with_token(self):
+        # setup
+        token = self.obtain_token()
+        promise_since = self.timezone.localize(datetime.now())
+
+        # when
+        resp = self.client.post('/promises/', {
+            'sinceWhen': iso8601(promise_since),
+            'tilWhen': iso8601(promise_since + timedelta(hours=1)),
+            'user2': self.wade.id
+        }, **self.bearer(token))
+
+        # then
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp.data['user1'], self.user.id)
+
+    def test_tampered_token(self):
+        # setup
+        token = self.obtain_token()
+
+        # when
+        resp = self.client.get(f'/promises/{self.promise.id}/', **self.bearer(token[:-1] + 'x'))
+
+        # then
+        self.assertEqual(resp.status_code, 403)
+
+    def test_refresh_revokes_old_token(self):
+        # setup
+        old = self.obtain_token()
+
+        # when
+        new = self.client.post('/tokens/refresh/', **self.bearer(old)).data['token']
+
+        # then
+        self.assertEqual(self.client.get(f'/promises/{self.promise.id}/', **self.bearer(old)).status_code, 403)
+        self.assertEqual(self.client.get(f'/promises/{self.promise.id}/', **self.bearer(new)).status_code, 200)
+
+    def test_revoke_token(self):
+        # setup
+        token = self.obtain_token()
+
+        # when
+        resp = self.client.post('/tokens/revoke/', **self.bearer(token))
+
+        # then
+        self.assertEqual(resp.status_code, 204)
+        self.assertEqual(self.client.get(f'/promises/{self.promise.id}/', **self.bearer(token)).status_code, 403)
+
+
+    def test_revocation_reaches_other_workers(self):
+        # setup
+        # two worker processes' deny lists over the production profile's backend
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        backend = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}
+        payload = {'uid': self.user.id, 'jti': 'sixer', 'iat': int(time.time())}
+
+        with override_settings(CACHES={'worker1': backend, 'worker2': backend}):
+            worker1, worker2 = TokenDenyList('worker1'), TokenDenyList('worker2')
+
+            # when
+            worker1.deny(payload['jti'], payload['iat'] + settings.ACCESS_TOKEN_TTL)
+
+            # then
+            self.assertTrue(worker2.denies(payload))
+
+    def test_token_of_deleted_user(self):
+        # setup
+        token = self.obtain_token()
+        self.user.delete()
+
+        # when
+        resp = self.client.post('/promises/', {
+            'sinceWhen': '2018-04-01T00:00:00Z',
+            'tilWhen': '2018-04-01T01:00:00Z',
+            'user2': self.promise.user2_id,
+        }, format='json', **self.bearer(token))
+
+        # then
+        self.assertEqual(resp.status_code, 403)
+
+
+class TestFreeBusy(TestCase, PromisesUtilMixins):
+    def setUp(self):
+        parzival = self.create_user('parzival')
+        art3mis = self.create_user('art3mis')
+        anorak = self.create_user('anorak')
+        # parzival/art3mis 00-01, parzival/anorak 01-02, art3mis/parzival 02-03, ...
+        self.create_promises_between_users([parzival, art3mis, anorak])
+        self.start = self.promise_parzival_art3mis.sinceWhen
+        self.client = APIClient()
+
+    def at(self, hours):
+        return iso8601(self.start + timedelta(hours=hours)).replace('+00:00', 'Z')
+
+    def test_free_busy(self):
+        # when
+        resp = self.client.get('/freebusy/', {
+            'users': f'{self.art3mis.id}',
+            'from': self.at(-1),
+            'to': self.at(7),
+        })
+
+        # then
+        self.assertEqual(resp.status_code, 200)
+        self.assertListEqual(resp.data['busy'], [
+            {'start': self.at(0), 'end': self.at(1)},
+            {'start': self.at(2), 'end': self.at(4)},
+            {'start': self.at(5), 'end': self.at(6)},
+        ])
+        self.assertListEqual(resp.data['free'], [
+            {'start': self.at(-1), 'end': self.at(0)},
+            {'start': self.at(1), 'end': self.at(2)},
+            {'start': self.at(4), 'end': self.at(5)},
+            {'start': self.at(6), 'end': self.at(7)},
+        ])
+
+    def test_free_busy_of_several_users_with_min_slot(self):
+        # when
+        with self.assertNumQueries(2):
+            resp = self.client.get('/freebusy/', {
+                'users': f'{self.parzival.id},{self.anorak.id}',
+                'from': self.at(0.5),
+                'to': self.at(8),
+                'min_slot': 90,
+            })
+
+        # then
+        self.assertEqual(resp.status_code, 200)
+        self.assertListEqual(resp.data['busy'], [{'start': self.at(0.5), 'end': self.at(6)}])
+        self.assertListEqual(resp.data['free'], [{'start': self.at(6), 'end': self.at(8)}])
+
+    def test_free_busy_from_year_one(self):
+        # when
+        resp = self.client.get('/freebusy/', {
+            'users': f'{self.art3mis.id}',
+            'from': '0001-01-01T00:00:00Z',
+            'to': self.at(1),
+        })
+
+        # then
+        self.assertEqual(resp.status_code, 200)
+        self.assertListEqual(resp.data['busy'], [{'start': self.at(0), 'end': self.at(1)}])
+
+    def test_free_busy_without_window(self):
+        # when
+        resp = self.client.get('/freebusy/', {'users': f'{self.art3mis.id}'})
+
+        # then
+        self.assertEqual(resp.status_code, 400)
+
+    def test_free_busy_with_invalid_users(self):
+        # when
+        resp = self.client.get('/freebusy/', {'users': 'art3mis', 'from': self.at(0), 'to': self.at(1)})
+
+        # then
+        self.assertEqual(resp.status_code, 400)
+
+    def test_busy_blocks_merges_overlapping_and_touching_intervals(self):
+        # when
+        blocks = schedule.busy_blocks([(5, 7), (1, 3), (2, 4), (4, 5), (9, 12)], 0, 10)
+
+        # then
+        self.assertListEqual(blocks, [(1, 7), (9, 10)])
+
+
+class TestPromiseBulk(TestCase, PromisesUtilMixins):
+    def setUp(self):
+        self.create_user('aech')
+        self.create_user('shoto')
+        self.create_user('daito')
+        self.start = self.timezone.localize(datetime(2018, 6, 1))
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.aech)
+
+    def items(self, count, user2):
+        return [{
+            'sinceWhen': iso8601(self.start + timedelta(hours=i)),
+            'tilWhen': iso8601(self.start + timedelta(hours=i + 1)),
+            'user2': user2.id
+        } for i in range(count)]
+
+    def test_bulk_create(self):
+        # setup
+        items = self.items(2, self.shoto) + self.items(1, self.daito)
+
+        # when
+        resp = self.client.post('/promises/bulk/', items, format='json')
+
+        # then
+        self.assertEqual(resp.status_code, 201)
+        self.assertListEqual(resp.data['errors'], [])
+        self.assertListEqual([c['index'] for c in resp.data['created']], [0, 1, 2])
+        for created, item in zip(resp.data['created'], items):
+            promise = models.Promise.objects.get(pk=created['id'])
+            self.assertEqual(promise.user1_id, self.aech.id)
+            self.assertEqual(promise.user2_id, item['user2'])
+            self.assertDateTimeEqual(promise.sinceWhen, self.start + timedelta(hours=created['index'] % 2))
+            self.assertEqual(promise.duration, timedelta(hours=1))
+
+    def test_bulk_create_reports_invalid_items(self):
+        # setup
+        items = self.items(4, self.shoto)
+        items[1]['user2'] = 9999
+        items[2]['tilWhen'] = items[2]['sinceWhen']
+        items[3]['user2'] = self.aech.id
+
+        # when
+        resp = self.client.post('/promises/bulk/', items + ['garbage'], format='json')
+
+        # then
+        self.assertEqual(resp.status_code, 201)
+        self.assertListEqual([c['index'] for c in resp.data['created']], [0])
+        self.assertListEqual([e['index'] for e in resp.data['errors']], [1, 2, 3, 4])
+        self.assertIn('user2', resp.data['errors'][0]['errors'])
+        self.assertIn('tilWhen', resp.data['errors'][1]['errors'])
+        self.assertEqual(models.Promise.objects.count(), 1)
+
+    def test_bulk_create_reports_mistyped_user2(self):
+        # setup
+        items = self.items(5, self.shoto)
+        items[0]['user2'] = [self.shoto.id]
+        items[1]['user2'] = {'id': self.shoto.id}
+        items[2]['user2'] = 'shoto'
+        del items[3]['user2']
+        items[4]['user2'] = str(self.shoto.id)
+
+        # when
+        resp = self.client.post('/promises/bulk/', items, format='json')
+
+        # then
+        self.assertEqual(resp.status_code, 201)
+        self.assertListEqual([c['index'] for c in resp.data['created']], [4])
+        self.assertListEqual([e['errors']['user2'] for e in resp.data['errors']], [
+            ['Incorrect type. Expected pk value, received list.'],
+            ['Incorrect type. Expected pk value, received dict.'],
+            ['Incorrect type. Expected pk value, received str.'],
+            ['This field is required.'],
+        ])
+
+    def test_bulk_create_parses_datetimes_like_datetime_field(self):
+        # setup
+        values = ['2018-06-01T02:00:00+02:00', '2018-06-01 00:00:00.5Z', '2018-06-01T00:00', '2018-06-01',
+                  '2018-06-31T00:00:00Z', '01/06/2018 00:00', '2018-04-01T12', '2018-04-01T1200',
+                  '2018-04-01T12:00:00,5', '2018-04-01T12:00:00.1234567Z', '2018-04-01T12:00+0200', '2018-04-01T12:00+02']
+        field = serializers.IsoDateTimeField()
+
+        def parse(field, value):
+            try:
+                return field.run_validation(value)
+            except ValidationError as e:
+                return e.detail
+
+        # when, then
+        for value in values:
+            self.assertEqual(parse(field, value), parse(DateTimeField(), value), value)
+
+    def test_bulk_create_without_valid_items(self):
+        # when
+        resp = self.client.post('/promises/bulk/', [{'user2': self.shoto.id}], format='json')
+
+        # then
+        self.assertEqual(resp.status_code, 400)
+        self.assertSetEqual(set(resp.data['errors'][0]['errors']), {'sinceWhen', 'tilWhen'})
+
+    def test_bulk_create_query_count_does_not_grow(self):
+        # setup
+        def count_queries(items):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.post('/promises/bulk/', items, format='json')
+            return len(queries)
+
+        # when, then
+        self.assertEqual(count_queries(self.items(5, self.shoto) + self.items(5, self.daito)),
+                         count_queries(self.items(50, self.shoto) + self.items(50, self.daito)))
+
+    def test_bulk_create_without_authentication(self):
+        # setup
+        self.client.force_authenticate(user=None)
+
+        # when
+        resp = self.client.post('/promises/bulk/', self.items(1, self.shoto), format='json')
+
+        # then
+        self.assertEqual(resp.status_code, 403)
+
+
+class TestPromiseBulkChanges(TestCase, PromisesUtilMixins):
+    def setUp(self):
+        aech = self.create_user('aech')
+        shoto = self.create_user('shoto')
+        daito = self.create_user('daito')
+        # aech_shoto, aech_daito, shoto_aech, shoto_daito, daito_aech, daito_shoto, one hour each
+        self.create_promises_between_users([aech, shoto, daito])
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.aech)
+
+    def test_bulk_delete(self):
+        # setup
+        ids = [self.promise_aech_shoto.id, self.promise_daito_aech.id, self.promise_shoto_daito.id, 9999]
+
+        # when
+        resp = self.client.delete('/promises/bulk/', {'ids': ids}, format='json')
+
+        # then
+        self.assertEqual(resp.status_code, 200)
+        self.assertListEqual(resp.data['deleted'], [self.promise_aech_shoto.id, self.promise_daito_aech.id])
+        self.assertListEqual(resp.data['denied'], [self.promise_shoto_daito.id])
+        self.assertListEqual(resp.data['missing'], [9999])
+        self.assertFalse(models.Promise.objects.filter(id__in=resp.data['deleted']).exists())
+        self.assertTrue(models.Promise.objects.filter(id=self.promise_shoto_daito.id).exists())
+
+    def test_bulk_delete_by_window(self):
+        # setup
+        start = self.promise_aech_daito.sinceWhen
+
+        # when
+        resp = self.client.delete('/promises/bulk/', {
+            'from': iso8601(start),
+            'to': iso8601(start + timedelta(hours=4)),
+        }, format='json')
+
+        # then
+        self.assertEqual(resp.status_code, 200)
+        self.assertListEqual(resp.data['deleted'], [self.promise_aech_daito.id, self.promise_shoto_aech.id,
+                                                    self.promise_daito_aech.id])
+        self.assertListEqual(resp.data['denied'], [])
+
+    def test_bulk_update_with_shift(self):
+        # setup
+        promise = self.promise_shoto_aech
+
+        # when
+        resp = self.client.patch('/promises/bulk/', {
+            'ids': [promise.id, self.promise_daito_shoto.id],
+            'shift': 1800
+        }, format='json')
+
+        # then
+        self.assertEqual(resp.status_code, 200)
+        self.assertListEqual(resp.data['updated'], [promise.id])
+        self.assertListEqual(resp.data['denied'], [self.promise_daito_shoto.id])
+        moved = models.Promise.objects.get(pk=promise.id)
+        self.assertDateTimeEqual(moved.sinceWhen, promise.sinceWhen + timedelta(minutes=30))
+        self.assertDateTimeEqual(moved.tilWhen, promise.tilWhen + timedelta(minutes=30))
+        unmoved = models.Promise.objects.get(pk=self.promise_daito_shoto.id)
+        self.assertDateTimeEqual(unmoved.sinceWhen, self.promise_daito_shoto.sinceWhen)
+
+    def test_bulk_update_with_shift_is_read_back_like_other_promises(self):
+        # setup
+        promise = self.promise_shoto_aech
+        self.client.patch('/promises/bulk/', {'ids': [promise.id], 'shift': 1800}, format='json')
+        since = promise.sinceWhen + timedelta(minutes=30)
+        til = promise.tilWhen + timedelta(minutes=30)
+
+        # when
+        listed = self.client.get('/promises/?page_size=100')
+        detail = self.client.get(f'/promises/{promise.id}/')
+        after = self.client.get('/promises/', {'from': iso8601(til), 'to': iso8601(til + timedelta(hours=1))})
+
+        # then
+        listed = next(p for p in listed.data['results'] if p['id'] == promise.id)
+        for data in (listed, detail.data):
+            self.assertEqual(data['sinceWhen'], since.strftime('%Y-%m-%dT%H:%M:%SZ'))
+            self.assertEqual(data['tilWhen'], til.strftime('%Y-%m-%dT%H:%M:%SZ'))
+        # touching is not overlapping
+        self.assertNotIn(promise.id, [p['id'] for p in after.data['results']])
+
+    def test_bulk_update_with_shift_out_of_range(self):
+        # setup
+        promise = self.promise_shoto_aech
+        shifts = [10 ** 20, 3 * 10 ** 11, -3 * 10 ** 11]
+
+        # when
+        responses = [self.client.patch('/promises/bulk/', {'ids': [promise.id], 'shift': shift}, format='json')
+                     for shift in shifts]
+
+        # then
+        self.assertListEqual([resp.status_code for resp in responses], [400] * len(shifts))
+        unmoved = models.Promise.objects.get(pk=promise.id)
+        self.assertDateTimeEqual(unmoved.sinceWhen, promise.sinceWhen)
+
+    def test_bulk_update_with_timespan(self):
+        # setup
+        since = self.timezone.localize(datetime(2018, 7, 1))
+
+        # when
+        resp = self.client.patch('/promises/bulk/', {
+            'ids': [self.promise_aech_shoto.id, self.promise_aech_daito.id],
+            'sinceWhen': iso8601(since),
+            'tilWhen': iso8601(since + timedelta(hours=2)),
+        }, format='json')
+
+        # then
+        self.assertEqual(resp.status_code, 200)
+        for promise in models.Promise.objects.filter(id__in=resp.data['updated']):
+            self.assertDateTimeEqual(promise.sinceWhen, since)
+            self.assertEqual(promise.duration, timedelta(hours=2))
+
+    def test_bulk_update_with_invalid_timespan(self):
+        # when
+        resp = self.client.patch('/promises/bulk/', {
+            'ids': [self.promise_aech_shoto.id],
+            'sinceWhen': '2018-07-01T02:00:00Z',
+            'tilWhen': '2018-07-01T01:00:00Z',
+        }, format='json')
+
+        # then
+        self.assertEqual(resp.status_code, 400)
+
+    def test_bulk_delete_query_count_does_not_grow(self):
+        # setup
+        self.create_promises_between_users([self.aech, self.create_user('art3mis')] * 10)
+        few = list(models.Promise.objects.involving(self.aech.id).values_list('id', flat=True)[:2])
+        many = list(models.Promise.objects.involving(self.aech.id).values_list('id', flat=True)[2:40])
+
+        def count_queries(ids):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.delete('/promises/bulk/', {'ids': ids}, format='json')
+            return len(queries)
+
+        # when, then
+        self.assertEqual(count_queries(few), count_queries(many))
+
+
+class TestResponseCache(TestCase, PromisesUtilMixins):
+    def setUp(self):
+        parzival = self.create_user('parzival')
+        art3mis = self.create_user('art3mis')
+        anorak = self.create_user('anorak')
+        self.create_promises_between_users([parzival, art3mis, anorak])
+        self.client = APIClient()
+        response_cache.backend.clear()
+        response_cache.reset_stats()
+
+    def test_cached_user_list(self):
+        # setup
+        first = self.client.get('/userall/')
+
+        # when
+        # only the 3 ETag queries
+        with self.assertNumQueries(3):
+            second = self.client.get('/userall/')
+
+        # then
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertDictEqual(response_cache.stats(), {'hits': 1, 'misses': 1, 'evictions': 0})
+
+    def test_cache_key_includes_query(self):
+        # setup
+        self.client.get('/users/')
+
+        # when
+        resp = self.client.get('/users/', {'format': 'json'})
+
+        # then
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(response_cache.stats()['misses'], 2)
+
+    def test_promise_change_evicts_related_users(self):
+        # setup
+        self.client.get('/users/')
+        self.client.get(f'/users/{self.art3mis.id}/')
+        self.client.get(f'/users/{self.anorak.id}/')
+        since = self.timezone.localize(datetime(2018, 5, 1))
+        promise = models.Promise(sinceWhen=since, tilWhen=since + timedelta(hours=1),
+                                 user1=self.parzival, user2=self.art3mis)
+
+        # when
+        promise.save()
+        users = self.client.get('/users/')
+        art3mis = self.client.get(f'/users/{self.art3mis.id}/')
+        with self.assertNumQueries(0):
+            self.client.get(f'/users/{self.anorak.id}/')
+
+        # then
+        self.assertIn(promise.id, users.data[0]['promises_as_inviter'])
+        self.assertIn(promise.id, art3mis.data['promises_as_invitee'])
+
+    def test_bulk_delete_evicts_related_users(self):
+        # setup
+        promise = self.promise_parzival_anorak
+        self.client.get(f'/userall/{self.anorak.id}/')
+        self.client.force_authenticate(user=self.parzival)
+
+        # when
+        self.client.delete('/promises/bulk/', {'ids': [promise.id]}, format='json')
+        resp = self.client.get(f'/userall/{self.anorak.id}/')
+
+        # then
+        self.assertNotIn(promise.id, resp.data['whole_promises'])
+
+    def test_user_change_evicts_user(self):
+        # setup
+        self.client.get(f'/userall/{self.anorak.id}/')
+        self.anorak.username = 'halliday'
+        self.anorak.save()
+
+        # when
+        resp = self.client.get(f'/userall/{self.anorak.id}/')
+
+        # then
+        self.assertEqual(resp.data['username'], 'halliday')
+
+    def test_user_change_evicts_user_under_padded_pk(self):
+        # setup
+        self.client.get(f'/userall/00{self.anorak.id}/')
+        self.anorak.username = 'halliday'
+        self.anorak.save()
+
+        # when
+        resp = self.client.get(f'/userall/00{self.anorak.id}/')
+
+        # then
+        self.assertEqual(resp.json()['username'], 'halliday')
+
+    def test_eviction_reaches_other_workers(self):
+        # setup
+        # two worker processes' caches over the production profile's backend
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        backend = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}
+        request = mock.Mock(query_params=QueryDict(), accepted_media_type='application/json')
+
+        with override_settings(CACHES={'worker1': backend, 'worker2': backend}):
+            worker1, worker2 = ResponseCache('worker1'), ResponseCache('worker2')
+            worker1.set(worker1.key('users', None, request), HttpResponse(b'[]', content_type='application/json'))
+            cached = worker2.get(worker2.key('users', None, request))
+
+            # when
+            worker2.evict_users(self.parzival.id)
+
+            # then
+            self.assertEqual(cached.content, b'[]')
+            self.assertIsNone(worker1.get(worker1.key('users', None, request)))
+
+    def test_cache_stats(self):
+        # setup
+        self.client.get('/users/')
+        admin = User.objects.create_superuser('og', 'og@gregarious.games', 'kira')
+
+        # when
+        anonymous = self.client.get('/cache/stats/')
+        self.client.force_authenticate(user=admin)
+        resp = self.client.get('/cache/stats/')
+
+        # then
+        self.assertEqual(anonymous.status_code, 403)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['misses'], 1)
+
+
+@override_settings(STREAM_CHUNK_SIZE=2)
+class TestStreamingLists(TestCase, PromisesUtilMixins):
+    def setUp(self):
+        parzival = self.create_user('parzival')
+        art3mis = self.create_user('art3mis')
+        aech = self.create_user('aech')
+        anorak = self.create_user('anorak')
+        self.create_promises_between_users([parzival, art3mis, aech, anorak])
+        self.client = APIClient()
+
+    def get_streamed(self, path, params=None):
+        resp = self.client.get(path, dict(params or {}, stream=1))
+        self.assertTrue(resp.streaming)
+        self.assertEqual(resp['Content-Type'], 'application/json')
+        return b''.join(resp.streaming_content)
+
+    def test_stream_users(self):
+        # when
+        streamed = self.get_streamed('/users/')
+
+        # then
+        self.assertEqual(streamed, self.client.get('/users/').content)
+
+    def test_stream_userall(self):
+        # when
+        streamed = self.get_streamed('/userall/')
+
+        # then
+        self.assertEqual(streamed, self.client.get('/userall/').content)
+
+    def test_stream_promises_unpaginated(self):
+        # setup
+        pages = self.client.get('/promises/', {'page_size': 2}).data
+        promises = list(pages['results'])
+        while pages['next'] is not None:
+            pages = self.client.get(pages['next']).data
+            promises.extend(pages['results'])
+
+        # when
+        streamed = self.get_streamed('/promises/')
+
+        # then
+        self.assertEqual(len(promises), 12)
+        self.assertEqual(streamed, JSONRenderer().render(promises))
+
+    def test_stream_promises_filtered(self):
+        # setup
+        start = self.timezone.localize(datetime(2018, 5, 1))
+
+        # when
+        streamed = self.get_streamed('/promises/', {'from': iso8601(start), 'to': iso8601(start + timedelta(days=1))})
+
+        # then
+        self.assertEqual(streamed, b'[]')
+
+    def test_stream_reads_queryset_once(self):
+        # setup
+        self.client.get('/users/')
+
+        # when
+        with CaptureQueriesContext(connection) as queries:
+            self.get_streamed('/users/')
+
+        # then
+        # 3 ETag queries, 1 iterator query, 2 prefetches per chunk of 2 users
+        self.assertEqual(len(queries), 3 + 1 + 2 * 2)
+
+    def test_browsable_api_is_not_streamed(self):
+        # when
+        resp = self.client.get('/users/', {'stream': 1, 'format': 'api'})
+
+        # then
+        self.assertEqual(resp.status_code, 200)
+        self.assertFalse(resp.streaming)
+
+
+class TestPromiseRowSerializer(TestCase, PromisesUtilMixins):
+    def setUp(self):
+        parzival = self.create_user('parzival')
+        art3mis = self.create_user('art3mis')
+        self.create_promises_between_users([parzival, art3mis])
+        # microseconds are rendered only when present
+        since = self.timezone.localize(datetime(2018, 5, 1, 9, 30, 15, 250))
+        models.Promise(sinceWhen=since, tilWhen=since + timedelta(hours=1), user1=parzival, user2=art3mis).save()
+
+    def assertSameJSON(self):
+        promises = models.Promise.objects.order_by('id')
+        expected = JSONRenderer().render(serializers.PromiseSerializer(promises, many=True).data)
+        # sqlite text rows, and datetime rows as other databases return them
+        for rows in (promises.rows(), promises.values('id', 'user1_id', 'user2_id', *models.DATETIME_COLUMNS)):
+            self.assertEqual(JSONRenderer().render(serializers.PromiseRowSerializer(rows, many=True).data), expected)
+            self.assertEqual(JSONRenderer().render(serializers.PromiseRowSerializer(rows[0]).data),
+                             JSONRenderer().render(serializers.PromiseSerializer(promises[0]).data))
+
+    def test_same_json_as_promise_serializer(self):
+        self.assertSameJSON()
+
+    def test_same_json_in_other_timezone(self):
+        with timezone.override(pytz.timezone('Asia/Seoul')):
+            self.assertSameJSON()
+
+    @override_settings(REST_FRAMEWORK={'DATETIME_FORMAT': '%Y-%m-%d %H:%M'})
+    def test_same_json_with_datetime_format(self):
+        self.assertSameJSON()
+
+    def test_promises_updated_by_expression(self):
+        # setup
+        # sqlite stores such sums with a "+00:00" suffix
+        models.Promise.objects.update(sinceWhen=F('sinceWhen') + timedelta(minutes=30))
+        promises = models.Promise.objects.order_by('id')
+        expected = json.loads(JSONRenderer().render(serializers.PromiseSerializer(promises, many=True).data))
+        client = APIClient()
+
+        # when
+        listed = client.get('/promises/')
+        first = client.get('/promises/', {'page_size': 2})
+        second = client.get(first.data['next'])
+        changes = client.get('/promises/changes/', {'since': 0})
+
+        # then
+        self.assertEqual(listed.json()['results'], expected)
+        self.assertEqual(first.json()['results'] + second.json()['results'], expected)
+        self.assertEqual(sorted(changes.json()['changes'], key=lambda promise: promise['id']), expected)
+        self.assertEqual(expected[0]['sinceWhen'], '2018-04-01T00:30:00Z')
+
+    def test_promise_list_uses_rows(self):
+        # setup
+        client = APIClient()
+
+        # when
+        resp = client.get('/promises/')
+        browsable = client.get('/promises/', {'format': 'api'})
+
+        # then
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.data['results']), 3)
+        self.assertIsInstance(resp.data['results'][0], dict)
+        self.assertEqual(browsable.status_code, 200)
+
+
+@unittest.skipUnless(settings.MSGPACK_ENABLED, 'msgpack is not installed')
+class TestMessagePack(TestCase, PromisesUtilMixins):
+    def setUp(self):
+        parzival = self.create_user('parzival')
+        art3mis = self.create_user('art3mis')
+        aech = self.create_user('aech')
+        self.create_promises_between_users([parzival, art3mis, aech])
+        self.client = APIClient()
+
+    def get_msgpack(self, path, params=None):
+        resp = self.client.get(path, params, HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'application/msgpack')
+        return msgpack.unpackb(resp.content, raw=False)
+
+    def post_msgpack(self, path, data):
+        return self.client.post(path, msgpack.packb(data, use_bin_type=True),
+                                content_type='application/msgpack')
+
+    def test_datetime_is_epoch_micros(self):
+        # setup
+        value = self.timezone.localize(datetime(2018, 5, 1, 9, 30, 15, 250))
+
+        # when
+        packed = renderers.MessagePackRenderer().render({'at': value})
+
+        # then
+        self.assertEqual(msgpack.unpackb(packed, raw=False), {'at': 1525167015000250})
+        self.assertEqual(renderers.from_epoch_micros(1525167015000250), value)
+
+    def test_promise_list_pages(self):
+        # setup
+        promises = []
+
+        # when
+        page = self.get_msgpack('/promises/', {'page_size': 4})
+        promises.extend(page['results'])
+        while page['next'] is not None:
+            page = self.get_msgpack(page['next'])
+            promises.extend(page['results'])
+
+        # then
+        self.assertEqual(len(promises), 6)
+        for data in promises:
+            promise = models.Promise.objects.get(pk=data['id'])
+            self.assertFieldsEqual(data, user1=promise.user1_id, user2=promise.user2_id,
+                                   created=renderers.to_epoch_micros(promise.created),
+                                   sinceWhen=renderers.to_epoch_micros(promise.sinceWhen),
+                                   tilWhen=renderers.to_epoch_micros(promise.tilWhen))
+
+    def test_promise_detail(self):
+        # setup
+        promise = self.promise_parzival_aech
+        self.client.force_authenticate(user=self.parzival)
+
+        # when
+        data = self.get_msgpack(f'/promises/{promise.id}/')
+
+        # then
+        self.assertFieldsEqual(data, id=promise.id, updated=renderers.to_epoch_micros(promise.updated),
+                               sinceWhen=renderers.to_epoch_micros(promise.sinceWhen))
+
+    def test_userall_matches_json(self):
+        # when
+        data = self.get_msgpack('/userall/')
+
+        # then
+        self.assertEqual(data, self.client.get('/userall/').json())
+
+    def test_bulk_create(self):
+        # setup
+        since = self.timezone.localize(datetime(2018, 5, 1, 9, 30, 15, 250))
+        items = [{'sinceWhen': 1525167015000250, 'tilWhen': 1525167015000250 + 3600 * 10 ** 6,
+                  'user2': self.art3mis.id},
+                 {'sinceWhen': since.isoformat(), 'tilWhen': 2 ** 63 - 1, 'user2': self.art3mis.id}]
+        self.client.force_authenticate(user=self.parzival)
+
+        # when
+        resp = self.post_msgpack('/promises/bulk/', items)
+
+        # then
+        self.assertEqual(resp.status_code, 201)
+        promise = models.Promise.objects.get(pk=resp.data['created'][0]['id'])
+        self.assertEqual(promise.sinceWhen, since)
+        self.assertEqual(promise.duration, timedelta(hours=1))
+        self.assertEqual(resp.data['errors'], [{'index': 1, 'errors': {'tilWhen': ['Datetime value out of range.']}}])
+
+    def test_create_takes_epoch_micros_only_in_msgpack(self):
+        # setup
+        item = {'sinceWhen': 1525167015000250, 'tilWhen': 1525170615000250, 'user2': self.art3mis.id}
+        self.client.force_authenticate(user=self.parzival)
+
+        # when
+        packed = self.post_msgpack('/promises/', item)
+        json = self.client.post('/promises/', item, format='json')
+
+        # then
+        self.assertEqual(packed.status_code, 201)
+        promise = models.Promise.objects.get(pk=packed.data['id'])
+        self.assertEqual(promise.sinceWhen, self.timezone.localize(datetime(2018, 5, 1, 9, 30, 15, 250)))
+        self.assertEqual(json.status_code, 400)
+        self.assertIn('sinceWhen', json.data)
+
+    def test_invalid_body(self):
+        # setup
+        self.client.force_authenticate(user=self.parzival)
+
+        # when
+        resp = self.client.post('/promises/bulk/', b'\xc1', content_type='application/msgpack')
+
+        # then
+        self.assertEqual(resp.status_code, 400)
+
+    def test_json_stays_default(self):
+        # when
+        resp = self.client.get('/promises/')
+        packed = self.client.get('/promises/', HTTP_ACCEPT='application/msgpack')
+
+        # then
+        self.assertEqual(resp['Content-Type'], 'application/json')
+        self.assertIn('Accept', resp['Vary'])
+        self.assertIn('Accept', packed['Vary'])
+        self.assertNotEqual(resp['ETag'], packed['ETag'])
+
+
+class TestPromiseChanges(TestCase, PromisesUtilMixins):
+    def setUp(self):
+        parzival = self.create_user('parzival')
+        art3mis = self.create_user('art3mis')
+        self.create_promises_between_users([parzival, art3mis])
+        self.start = self.timezone.localize(datetime(2018, 6, 1))
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.parzival)
+        self.cursor = self.client.get('/promises/changes/').data['cursor']
+
+    def sync(self, since=None, **params):
+        resp = self.client.get('/promises/changes/', dict(params, since=self.cursor if since is None else since))
+        self.assertEqual(resp.status_code, 200)
+        return resp.data
+
+    def test_full_sync(self):
+        # when
+        data = self.sync(since=0)
+
+        # then
+        self.assertListEqual([p['id'] for p in data['changes']],
+                             [self.promise_parzival_art3mis.id, self.promise_art3mis_parzival.id])
+        self.assertEqual(data['changes'][0], self.client.get('/promises/').data['results'][0])
+        self.assertEqual(data['cursor'], self.cursor)
+        self.assertFalse(data['more'])
+
+    def test_up_to_date_is_one_empty_query(self):
+        # when
+        with CaptureQueriesContext(connection) as queries:
+            data = self.sync()
+
+        # then
+        self.assertEqual(len(queries), 1)
+        self.assertDictEqual(data, {'changes': [], 'deleted': [], 'cursor': self.cursor, 'more': False})
+
+    def test_created_updated_and_deleted(self):
+        # setup
+        self.client.post('/promises/', {'sinceWhen': iso8601(self.start), 'tilWhen': iso8601(self.start + timedelta(hours=1)),
+                                        'user2': self.art3mis.id}, format='json')
+        created = models.Promise.objects.latest('id')
+        updated = self.promise_art3mis_parzival
+        updated.tilWhen += timedelta(hours=1)
+        updated.save()
+        self.client.delete(f'/promises/{self.promise_parzival_art3mis.id}/')
+
+        # when
+        data = self.sync()
+
+        # then
+        self.assertListEqual([p['id'] for p in data['changes']], [created.id, updated.id])
+        self.assertDateTimeEqual(data['changes'][1]['tilWhen'], updated.tilWhen)
+        self.assertListEqual(data['deleted'], [self.promise_parzival_art3mis.id])
+        self.assertDictEqual(self.sync(since=data['cursor']),
+                             {'changes': [], 'deleted': [], 'cursor': data['cursor'], 'more': False})
+
+    def test_bulk_changes(self):
+        # setup
+        items = [{'sinceWhen': iso8601(self.start + timedelta(hours=i)),
+                  'tilWhen': iso8601(self.start + timedelta(hours=i + 1)),
+                  'user2': self.art3mis.id} for i in range(3)]
+        created = [c['id'] for c in self.client.post('/promises/bulk/', items, format='json').data['created']]
+        self.client.patch('/promises/bulk/', {'ids': [created[2], created[0]], 'shift': 60}, format='json')
+        self.client.delete('/promises/bulk/', {'ids': [created[1], self.promise_parzival_art3mis.id]}, format='json')
+
+        # when
+        data = self.sync()
+
+        # then
+        self.assertListEqual([p['id'] for p in data['changes']], [created[0], created[2]])
+        self.assertSetEqual(set(data['deleted']), {created[1], self.promise_parzival_art3mis.id})
+        seqs = models.Promise.objects.order_by('seq').values_list('seq', flat=True)
+        self.assertEqual(len(set(seqs)), len(seqs))
+
+    def test_pages(self):
+        # setup
+        for promise in models.Promise.objects.all():
+            promise.save()
+        deleted_id = self.promise_parzival_art3mis.id
+        self.promise_parzival_art3mis.delete()
+
+        # when
+        first = self.sync(limit=1)
+        second = self.sync(since=first['cursor'], limit=1)
+
+        # then
+        self.assertListEqual([p['id'] for p in first['changes']], [self.promise_art3mis_parzival.id])
+        self.assertTrue(first['more'])
+        self.assertListEqual(second['deleted'], [deleted_id])
+        self.assertFalse(second['more'])
+
+    def test_compacted_cursor_is_gone(self):
+        # setup
+        self.promise_parzival_art3mis.delete()
+        before = self.cursor
+        after = self.sync()['cursor']
+
+        # when
+        call_command('compact_tombstones', days=0, stdout=io.StringIO())
+
+        # then
+        self.assertEqual(self.client.get('/promises/changes/', {'since': before}).status_code, 410)
+        self.assertEqual(self.client.get('/promises/changes/', {'since': 0}).status_code, 410)
+        self.assertListEqual(self.sync(since=after)['deleted'], [])
+        self.assertFalse(models.PromiseTombstone.objects.exists())
+
+    def test_retention_keeps_recent_tombstones(self):
+        # setup
+        deleted_id = self.promise_parzival_art3mis.id
+        self.promise_parzival_art3mis.delete()
+
+        # when
+        call_command('compact_tombstones', stdout=io.StringIO())
+
+        # then
+        self.assertListEqual(self.sync()['deleted'], [deleted_id])
+
+    def test_invalid_cursor(self):
+        # when
+        resp = self.client.get('/promises/changes/', {'since': 'yesterday'})
+
+        # then
+        self.assertEqual(resp.status_code, 400)
+
+
+class TestSequence(TestCase):
+    def test_allocate_after_a_concurrent_create(self):
+        # setup
+        models.Sequence.objects.create(name='test', value=5)
+        update = QuerySet.update
+        updates = []
+
+        def update_before_concurrent_create(queryset, **kwargs):
+            # the row was created by another transaction after this UPDATE
+            updates.append(kwargs)
+            return 0 if len(updates) == 1 else update(queryset, **kwargs)
+
+        # when
+        with mock.patch.object(QuerySet, 'update', update_before_concurrent_create):
+            first = models.Sequence.objects.allocate('test', 3)
+
+        # then
+        self.assertEqual(first, 6)
+        self.assertEqual(models.Sequence.objects.current('test'), 8)
+
+    def test_counters_exist_after_migrating(self):
+        # then
+        self.assertEqual(set(models.Sequence.objects.values_list('name', flat=True)),
+                         {models.PROMISE_CHANGES, models.TOMBSTONE_HORIZON, models.USER_CHANGES})
+
+
+@override_settings(EVENT_HEARTBEAT=0.01, EVENT_POLL_INTERVAL=60)
+class TestPromiseEvents(TransactionTestCase, PromisesUtilMixins):
+    # on_commit callbacks only run in a TransactionTestCase. The poller runs
+    # in a thread, and on the shared in-memory database its reads make
+    # concurrent writes fail: it polls only when a commit wakes it, and a
+    # test receives the events before writing again.
+
+    def setUp(self):
+        broadcaster.clear()
+        self.create_user('parzival')
+        self.create_user('art3mis')
+        self.create_user('aech')
+        self.start = self.timezone.localize(datetime(2018, 6, 1))
+        self.client = APIClient()
+        self.token = issue_token(self.parzival.id)
+
+    def tearDown(self):
+        broadcaster.clear()
+
+    def make_promise(self, user1, user2):
+        promise = models.Promise(sinceWhen=self.start, tilWhen=self.start + timedelta(hours=1), user1=user1, user2=user2)
+        promise.save()
+        return promise
+
+    def open_stream(self, **extra):
+        resp = self.client.get('/promises/events/', {'access_token': self.token}, **extra)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'text/event-stream')
+        return resp, iter(resp.streaming_content)
+
+    def next_event(self, stream):
+        for chunk in stream:
+            if not chunk.startswith(b':') and not chunk.startswith(b'retry:'):
+                return chunk
+
+    def queued(self, subscription):
+        events = []
+        while not subscription.queue.empty():
+            events.append(subscription.queue.get_nowait())
+        return events
+
+    def received(self, subscription, count):
+        # the next ``count`` events the poller publishes to the subscription
+        return [subscription.queue.get(timeout=5) for _ in range(count)]
+
+    def test_published_after_commit_to_involved_users(self):
+        # setup
+        parzival = broadcaster.subscribe(self.parzival.id)
+        art3mis = broadcaster.subscribe(self.art3mis.id)
+        aech = broadcaster.subscribe(self.aech.id)
+
+        # when
+        with transaction.atomic():
+            promise = self.make_promise(self.parzival, self.art3mis)
+            before_commit = self.queued(parzival)
+
+        # then
+        self.assertListEqual(before_commit, [])
+        for subscription in (parzival, art3mis):
+            [(seq, event)] = self.received(subscription, 1)
+            self.assertEqual(seq, promise.seq)
+            self.assertIn(b'event: update', event)
+            self.assertIn(f'id: {promise.seq}'.encode(), event)
+        self.assertListEqual(self.queued(aech), [])
+
+    def test_rollback_publishes_nothing(self):
+        # setup
+        subscription = broadcaster.subscribe(self.parzival.id)
+
+        # when
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.make_promise(self.parzival, self.art3mis)
+                raise RuntimeError
+        promise = self.make_promise(self.parzival, self.art3mis)
+
+        # then
+        [(seq, event)] = self.received(subscription, 1)
+        self.assertEqual(seq, promise.seq)
+
+    @override_settings(EVENT_POLL_INTERVAL=0.5)
+    def test_writes_of_other_workers(self):
+        # setup
+        subscription = broadcaster.subscribe(self.art3mis.id)
+        since = self.start + timedelta(days=1)
+
+        # when: another process inserts, nothing here wakes the poller
+        [promise_id] = models.Promise.objects.bulk_insert([(since, since + timedelta(hours=1),
+                                                            self.parzival.id, self.art3mis.id)])
+
+        # then
+        [(seq, event)] = self.received(subscription, 1)
+        self.assertEqual(seq, models.Promise.objects.get(pk=promise_id).seq)
+        self.assertEqual(json.loads(event.split(b'data: ')[1])['id'], promise_id)
+
+    def test_bulk_endpoints(self):
+        # setup
+        subscription = broadcaster.subscribe(self.art3mis.id)
+        self.client.force_authenticate(user=self.parzival)
+        items = [{'sinceWhen': iso8601(self.start), 'tilWhen': iso8601(self.start + timedelta(hours=1)),
+                  'user2': self.art3mis.id}] * 2
+
+        # when
+        ids = [c['id'] for c in self.client.post('/promises/bulk/', items, format='json').data['created']]
+        created = self.received(subscription, 2)
+        self.client.patch('/promises/bulk/', {'ids': ids, 'shift': 60}, format='json')
+        updated = self.received(subscription, 2)
+        self.client.delete('/promises/bulk/', {'ids': ids[:1]}, format='json')
+        deleted = self.received(subscription, 1)
+
+        # then
+        names = [event.split(b'\n')[1] for _, event in created + updated + deleted]
+        self.assertListEqual(names, [b'event: update'] * 4 + [b'event: delete'])
+        data = [json.loads(event.split(b'data: ')[1]) for _, event in updated + deleted]
+        self.assertListEqual([promise['id'] for promise in data[:2]], ids)
+        self.assertDateTimeEqual(data[1]['sinceWhen'], self.start + timedelta(minutes=1))
+        self.assertEqual(data[2], {'id': ids[0]})
+
+    def test_compacted_feed_drops_streams(self):
+        # setup
+        promise = self.make_promise(self.parzival, self.art3mis)
+        subscription = broadcaster.subscribe(self.parzival.id)
+
+        # when
+        with transaction.atomic():
+            promise.delete()
+            call_command('compact_tombstones', days=0, stdout=io.StringIO())
+        body = list(events.EventStream(subscription, []))
+
+        # then
+        self.assertTrue(subscription.dropped)
+        self.assertIn(b'event: overflow', body[-1])
+        self.assertEqual(len(broadcaster), 0)
+
+    def test_slow_consumer_is_dropped(self):
+        # setup
+        small = Broadcaster(queue_size=2)
+        subscription = small.subscribe(self.parzival.id)
+
+        # when
+        for seq in range(3):
+            small.publish(seq, events.encode_event('update', {'id': seq}, seq), [self.parzival.id])
+        body = list(events.EventStream(subscription, []))
+        small.clear()
+
+        # then
+        self.assertTrue(subscription.dropped)
+        self.assertEqual(len(small), 0)
+        self.assertEqual(len(body), 4)
+        self.assertIn(b'event: overflow', body[-1])
+
+    def test_stream(self):
+        # setup
+        resp, stream = self.open_stream()
+        ready = self.next_event(stream)
+
+        # when
+        promise = self.make_promise(self.art3mis, self.parzival)
+        created = self.next_event(stream)
+        resp.close()
+
+        # then
+        self.assertIn(b'event: ready', ready)
+        self.assertIn(b'event: update', created)
+        self.assertEqual(json.loads(created.split(b'data: ')[1])['id'], promise.id)
+        self.assertEqual(len(broadcaster), 0)
+
+    def test_reconnect_replays_missed_events(self):
+        # setup
+        kept = self.make_promise(self.parzival, self.art3mis)
+        gone = self.make_promise(self.art3mis, self.parzival)
+        self.make_promise(self.art3mis, self.aech)
+        last_event_id = models.Sequence.objects.current(models.PROMISE_CHANGES)
+        kept.save()
+        gone.delete()
+
+        # when
+        resp, stream = self.open_stream(HTTP_LAST_EVENT_ID=str(last_event_id))
+        replayed = [self.next_event(stream), self.next_event(stream)]
+        resp.close()
+
+        # then
+        self.assertIn(b'event: update', replayed[0])
+        self.assertIn(f'"id":{kept.id}'.encode(), replayed[0])
+        self.assertIn(b'event: delete', replayed[1])
+
+    def test_reconnect_after_compaction_resets(self):
+        # setup
+        self.make_promise(self.parzival, self.art3mis).delete()
+        call_command('compact_tombstones', days=0, stdout=io.StringIO())
+
+        # when
+        resp, stream = self.open_stream(HTTP_LAST_EVENT_ID='0')
+        event = self.next_event(stream)
+        resp.close()
+
+        # then
+        self.assertIn(b'event: reset', event)
+
+    def test_requires_authentication(self):
+        # when
+        resp = self.client.get('/promises/events/', HTTP_ACCEPT='text/event-stream')
+
+        # then
+        self.assertIn(resp.status_code, (401, 403))
+        self.assertIn(b'event: error', resp.content)
+
+
+@override_settings(EVENT_HEARTBEAT=0.01, EVENT_POLL_INTERVAL=60)
+class TestASGI(TransactionTestCase, PromisesUtilMixins):
+    # requests run in the handler's threads, which must see committed rows
+
+    def setUp(self):
+        broadcaster.clear()
+        self.create_user('parzival')
+        self.create_user('art3mis')
+        self.create_promises_between_users([self.parzival, self.art3mis])
+        self.token = issue_token(self.parzival.id)
+        self.handler = ASGIHandler(threads=1)
+
+    def tearDown(self):
+        self.handler.executor.shutdown()
+        broadcaster.clear()
+
+    def scope(self, path, method='GET', query=b'', headers=()):
+        return {
+            'type': 'http', 'method': method, 'path': path, 'root_path': '', 'query_string': query,
+            'headers': [(b'authorization', f'Bearer {self.token}'.encode()), *headers],
+            'http_version': '1.1', 'scheme': 'http', 'server': ('testserver', 80), 'client': ('127.0.0.1', 4000),
+        }
+
+    async def call(self, scope, body=b'', gone=None):
+        # (status, headers, sent body messages), once the response is complete
+        # or ``gone`` is set (the client disconnects)
+        gone = gone or asyncio.Event()
+        messages = [{'type': 'http.request', 'body': body}]
+        sent = []
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await gone.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        await self.handler(scope, receive, send)
+        return sent[0]['status'], dict(sent[0]['headers']), [m['body'] for m in sent[1:]]
+
+    def fetch(self, *args, **kwargs):
+        status, headers, chunks = asyncio.run(self.call(self.scope(*args, **kwargs)))
+        return status, headers, b''.join(chunks)
+
+    def test_get(self):
+        # setup
+        expected = APIClient().get('/promises/', HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+        # when
+        status, headers, body = self.fetch('/promises/')
+
+        # then
+        self.assertEqual(status, 200)
+        self.assertEqual(headers[b'Content-Type'], b'application/json')
+        self.assertEqual(body, expected.content)
+
+    def test_post(self):
+        # setup
+        body = json.dumps({'sinceWhen': iso8601(datetime(2018, 6, 1, tzinfo=pytz.utc)),
+                           'tilWhen': iso8601(datetime(2018, 6, 1, 1, tzinfo=pytz.utc)),
+                           'user2': self.art3mis.id}).encode()
+        scope = self.scope('/promises/', 'POST', headers=[(b'content-type', b'application/json')])
+
+        # when
+        status, _, chunks = asyncio.run(self.call(scope, body))
+
+        # then
+        self.assertEqual(status, 201)
+        self.assertTrue(models.Promise.objects.filter(id=json.loads(b''.join(chunks))['id']).exists())
+
+    def test_streamed_list(self):
+        # when
+        status, _, body = self.fetch('/promises/', query=b'stream=1')
+
+        # then
+        self.assertEqual(status, 200)
+        self.assertListEqual([p['id'] for p in json.loads(body)], list(
+            models.Promise.objects.order_by('created', 'id').values_list('id', flat=True)))
+
+    def test_disconnect_before_the_body(self):
+        # setup
+        count = models.Promise.objects.count()
+        sent = []
+
+        async def receive():
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        # when
+        asyncio.run(self.handler(self.scope('/promises/', 'POST'), receive, send))
+
+        # then
+        self.assertListEqual(sent, [])
+        self.assertEqual(models.Promise.objects.count(), count)
+
+    @override_settings(STREAM_CHUNK_SIZE=1)
+    def test_disconnect_during_a_streamed_list(self):
+        # setup
+        start = datetime(2018, 6, 1, tzinfo=pytz.utc)
+        models.Promise.objects.bulk_insert([(start + timedelta(hours=i), start + timedelta(hours=i + 1),
+                                             self.parzival.id, self.art3mis.id) for i in range(50)])
+
+        async def scenario():
+            gone = asyncio.Event()
+            sent = []
+
+            async def receive():
+                if not sent:
+                    return {'type': 'http.request', 'body': b''}
+                await gone.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                sent.append(message)
+                if message['type'] == 'http.response.body':
+                    gone.set()
+                    await asyncio.sleep(0.01)
+
+            await self.handler(self.scope('/promises/', query=b'stream=1'), receive, send)
+            # the handler's only thread was given back
+            after = await self.call(self.scope('/users/'))
+            return sent, after
+
+        # when
+        sent, (status, _, _) = asyncio.run(scenario())
+
+        # then
+        bodies = [m for m in sent if m['type'] == 'http.response.body']
+        self.assertLess(len(bodies), 5)
+        self.assertTrue(all(m.get('more_body') for m in bodies))
+        self.assertEqual(status, 200)
+
+    def test_channel_backpressure(self):
+        async def scenario():
+            loop = asyncio.get_event_loop()
+            channel = Channel(loop)
+            put = []
+
+            def produce():
+                for item in range(3):
+                    channel.put(item)
+                    put.append(item)
+                channel.put(END)
+
+            producing = loop.run_in_executor(None, produce)
+            first = await channel.get()
+            await asyncio.sleep(0.1)
+            held = list(put)
+            rest = [item async for item in channel]
+            await producing
+            return first, held, rest
+
+        # when
+        first, held, rest = asyncio.run(scenario())
+
+        # then: the thread is one item ahead of the loop at most
+        self.assertEqual(first, 0)
+        self.assertListEqual(held, [0, 1])
+        self.assertListEqual(rest, [1, 2])
+
+    def test_event_stream_holds_no_thread(self):
+        def create():
+            # in one transaction, see TestPromiseEvents
+            with transaction.atomic():
+                self.create_promises_between_users([self.art3mis, self.parzival])
+
+        async def scenario():
+            gone = asyncio.Event()
+            stream = asyncio.ensure_future(self.call(self.scope('/promises/events/'), gone=gone))
+            await asyncio.sleep(0.1)
+
+            # the handler's only thread is free for other requests
+            status, _, _ = await self.call(self.scope('/users/'))
+            await asyncio.get_event_loop().run_in_executor(None, create)
+            await asyncio.sleep(0.1)
+            gone.set()
+            return status, await stream
+
+        # when
+        status, (stream_status, headers, chunks) = asyncio.run(scenario())
+
+        # then
+        self.assertEqual(status, 200)
+        self.assertEqual(stream_status, 200)
+        self.assertEqual(headers[b'Content-Type'], b'text/event-stream')
+        body = b''.join(chunks)
+        self.assertIn(b'event: ready', body)
+        self.assertEqual(body.count(b'event: update'), 2)
+        self.assertEqual(len(broadcaster), 0)
+
+    def test_lifespan(self):
+        # setup
+        messages = [{'type': 'lifespan.shutdown'}, {'type': 'lifespan.startup'}]
+        sent = []
+
+        async def receive():
+            return messages.pop()
+
+        async def send(message):
+            sent.append(message['type'])
+
+        # when
+        asyncio.run(self.handler({'type': 'lifespan'}, receive, send))
+
+        # then
+        self.assertListEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'sqlite write lock')
+class TestConflictCheckLock(TransactionTestCase, PromisesUtilMixins):
+    # outside of TestCase's transaction, which holds the write lock already
+
+    def setUp(self):
+        self.create_promises_between_users([self.create_user('wade'), self.create_user('aech')])
+
+    def test_conflict_check_takes_the_write_lock(self):
+        # setup
+        since = self.promise_wade_aech.sinceWhen
+
+        def write_locked():
+            # whether another connection is kept from writing
+            other = sqlite3.connect(connection.settings_dict['NAME'], uri=True, timeout=0, isolation_level=None)
+            try:
+                other.execute('BEGIN IMMEDIATE')
+                other.execute('ROLLBACK')
+                return False
+            except sqlite3.OperationalError:
+                return True
+            finally:
+                other.close()
+
+        # when
+        with transaction.atomic():
+            conflicts = views.ConflictCheckMixin().find_conflicts(
+                'reject', [self.wade.id, self.aech.id], since, since + timedelta(hours=1))
+            locked = write_locked()
+
+        # then
+        self.assertListEqual(conflicts, [self.promise_wade_aech.id])
+        self.assertTrue(locked)
+
+
+class TestConcurrentWriters(TransactionTestCase, PromisesUtilMixins):
+    # DATABASE_PROFILE=production; threads cannot share an in-memory database
+
+    writers = 8
+    rounds = 10
+
+    def setUp(self):
+        if connection.is_in_memory_db():
+            self.skipTest('needs a database file')
+        self.users = [self.create_user(f'writer{i}') for i in range(self.writers)]
+        self.start = self.timezone.localize(datetime(2018, 6, 1))
+
+    def write(self, user, partner, statuses):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        try:
+            for i in range(self.rounds):
+                since = self.start + timedelta(hours=i)
+                created = client.post('/promises/', {'sinceWhen': iso8601(since), 'tilWhen': iso8601(since + timedelta(hours=1)),
+                                                     'user2': partner.id}, format='json')
+                statuses.append(created.status_code)
+                if created.status_code != 201:
+                    continue
+                url = f'/promises/{created.data["id"]}/'
+                statuses.append(client.patch(url, {'sinceWhen': iso8601(since), 'tilWhen': iso8601(since + timedelta(hours=2))},
+                                             format='json').status_code)
+                # reads, then writes in one transaction
+                statuses.append(client.patch('/promises/bulk/', {'ids': [created.data['id']], 'shift': 60},
+                                             format='json').status_code)
+                if i % 2:
+                    statuses.append(client.delete(url).status_code)
+        except Exception as e:
+            statuses.append(repr(e))
+        finally:
+            connection.close()
+
+    def test_parallel_conflict_checks(self):
+        # setup
+        statuses = []
+        since = self.start + timedelta(days=1)
+        body = {'sinceWhen': iso8601(since), 'tilWhen': iso8601(since + timedelta(hours=1)), 'user2': self.users[0].id}
+
+        def create(user):
+            client = APIClient()
+            client.force_authenticate(user=user)
+            try:
+                statuses.append(client.post('/promises/?conflicts=reject', body, format='json').status_code)
+            finally:
+                connection.close()
+        threads = [threading.Thread(target=create, args=(self.users[1],)) for _ in range(self.writers)]
+
+        # when
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # then
+        self.assertListEqual(sorted(statuses), [201] + [409] * (self.writers - 1))
+
+    def test_pragmas(self):
+        # setup
+        pragmas = connection.settings_dict['OPTIONS'].get('pragmas')
+        if not pragmas:
+            self.skipTest('no pragmas configured')
+
+        # when
+        with connection.cursor() as cursor:
+            values = {}
+            for name in pragmas:
+                cursor.execute(f'PRAGMA {name}')
+                values[name] = cursor.fetchone()[0]
+
+        # then
+        self.assertEqual(values.pop('journal_mode').upper(), pragmas['journal_mode'])
+        self.assertEqual(values.pop('synchronous'), 1)  # NORMAL
+        for name, value in values.items():
+            self.assertEqual(value, pragmas[name], name)
+
+    def test_parallel_writers(self):
+        # setup
+        statuses = []
+        threads = [threading.Thread(target=self.write, args=(user, self.users[i - 1], statuses))
+                   for i, user in enumerate(self.users)]
+
+        # when
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # then
+        self.assertListEqual(sorted(set(map(str, statuses))), ['200', '201', '204'])
+        self.assertEqual(models.Promise.objects.count(), self.writers * self.rounds // 2)
+        self.assertEqual(models.PromiseTombstone.objects.count(), self.writers * self.rounds // 2)
+
+
+class TestReadReplicas(TransactionTestCase, PromisesUtilMixins):
+    # two replica database files, brought up to date with the primary by sync()
+
+    replicas = ('test_replica1', 'test_replica2')
+    databases = {'default', *replicas}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        for alias in cls.replicas:
+            connections.databases[alias] = dict(connections.databases['default'], TEST={},
+                                                NAME=os.path.join(cls.directory.name, f'{alias}.sqlite3'))
+        cls.replica_settings = override_settings(READ_REPLICAS=list(cls.replicas))
+        cls.replica_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.replica_settings.disable()
+        for alias in cls.replicas:
+            connections[alias].close()
+            delattr(connections._connections, alias)
+            del connections.databases[alias]
+        cls.directory.cleanup()
+
+    def setUp(self):
+        # user ids repeat after each test's flush
+        caches[settings.PRIMARY_STICKY_CACHE_ALIAS].clear()
+        self.create_user('parzival')
+        self.create_user('art3mis')
+        self.start = self.timezone.localize(datetime(2018, 6, 1))
+        self.sync()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.parzival)
+
+    def sync(self):
+        primary = connections['default']
+        primary.ensure_connection()
+        for alias in self.replicas:
+            connections[alias].ensure_connection()
+            primary.connection.backup(connections[alias].connection)
+
+    def make_promise(self):
+        promise = models.Promise(sinceWhen=self.start, tilWhen=self.start + timedelta(hours=1),
+                                 user1=self.parzival, user2=self.art3mis)
+        promise.save()
+        return promise
+
+    def post_promise(self):
+        resp = self.client.post('/promises/', {'sinceWhen': iso8601(self.start),
+                                               'tilWhen': iso8601(self.start + timedelta(hours=1)),
+                                               'user2': self.art3mis.id}, format='json')
+        self.assertEqual(resp.status_code, 201)
+        return resp.data['id']
+
+    def promise_ids(self, client=None):
+        return [p['id'] for p in (client or self.client).get('/promises/').data['results']]
+
+    def test_reads_go_to_a_replica(self):
+        # setup
+        promise = self.make_promise()
+
+        # when
+        stale = self.promise_ids()
+        self.sync()
+        fresh = self.promise_ids()
+
+        # then
+        self.assertListEqual(stale, [])
+        self.assertListEqual(fresh, [promise.id])
+
+    def test_streamed_reads_go_to_a_replica(self):
+        # setup
+        self.make_promise()
+
+        # when
+        resp = self.client.get('/promises/', {'stream': 1})
+
+        # then
+        self.assertEqual(b''.join(resp.streaming_content), b'[]')
+
+    def test_writes_go_to_the_primary(self):
+        # when
+        promise_id = self.post_promise()
+
+        # then
+        self.assertTrue(models.Promise.objects.using('default').filter(id=promise_id).exists())
+        for alias in self.replicas:
+            self.assertFalse(models.Promise.objects.using(alias).exists())
+
+    def test_own_writes_are_read_from_the_primary(self):
+        # setup
+        other = APIClient()
+        other.force_authenticate(user=self.art3mis)
+
+        # when
+        promise_id = self.post_promise()
+
+        # then
+        self.assertListEqual(self.promise_ids(), [promise_id])
+        self.assertListEqual(self.promise_ids(other), [])
+
+    def test_sticky_window_follows_the_user(self):
+        # setup: another device of the same user, sharing no cookies
+        device = APIClient()
+        device.force_authenticate(user=self.parzival)
+
+        # when
+        promise_id = self.post_promise()
+
+        # then
+        self.assertListEqual(self.promise_ids(device), [promise_id])
+
+    def test_replica_reads_are_not_cached(self):
+        # setup
+        other = APIClient()
+        other.force_authenticate(user=self.art3mis)
+        self.create_user('aech')
+
+        # when
+        stale = [user['username'] for user in other.get('/users/').json()]
+        self.sync()
+        fresh = [user['username'] for user in other.get('/users/').json()]
+
+        # then
+        self.assertNotIn('aech', stale)
+        self.assertIn('aech', fresh)
+
+    @override_settings(PRIMARY_STICKY_SECONDS=0)
+    def test_sticky_window_expires(self):
+        # when
+        self.post_promise()
+
+        # then
+        self.assertListEqual(self.promise_ids(), [])
+
+    def test_event_replay_reads_from_the_primary(self):
+        # setup
+        promise = self.make_promise()
+
+        # when
+        resp = self.client.get('/promises/events/', HTTP_LAST_EVENT_ID='0')
+        chunks = iter(resp.streaming_content)
+        next(chunks)
+        replayed = next(chunks)
+        resp.close()
+
+        # then
+        self.assertIn(f'"id":{promise.id}'.encode(), replayed)
+
+
+class TestSeed(TestCase, PromisesUtilMixins):
+
+    def seed(self, **options):
+        call_command('seed', seed=1, stdout=io.StringIO(), **options)
+
+    def test_seed(self):
+        # when
+        with mock.patch('promises.management.commands.seed.make_password', wraps=make_password) as hasher:
+            with CaptureQueriesContext(connection) as queries:
+                self.seed(users=5, promises=50, batch_size=20)
+
+        # then
+        users = User.objects.filter(username__startswith='seed')
+        self.assertEqual(users.count(), 5)
+        self.assertEqual(hasher.call_count, 1)
+        self.assertEqual(len({user.password for user in users}), 1)
+        self.assertTrue(users[0].check_password('seed'))
+
+        promises = models.Promise.objects.order_by('seq')
+        self.assertEqual(promises.count(), 50)
+        self.assertEqual(len([q for q in queries if 'INSERT INTO "promises_promise"' in q['sql']]), 3)
+        for promise in promises:
+            self.assertNotEqual(promise.user1_id, promise.user2_id)
+            self.assertEqual(promise.tilWhen - promise.sinceWhen, promise.duration)
+            self.assertEqual(promise.sinceWhen.minute % 15, 0)
+        seqs = list(promises.values_list('seq', flat=True))
+        self.assertEqual(len(set(seqs)), 50)
+        self.assertEqual(seqs[-1], models.Sequence.objects.current(models.PROMISE_CHANGES))
+
+    def test_seed_again_adds_users(self):
+        # when
+        self.seed(users=3, promises=0)
+        self.seed(users=3, promises=0)
+
+        # then
+        self.assertEqual(User.objects.filter(username__startswith='seed').count(), 6)
+
+    def test_seed_numbers_on_past_other_names(self):
+        # setup
+        self.create_user('seedling')
+        self.create_user('seed5')
+
+        # when
+        self.seed(users=2, promises=0)
+
+        # then
+        self.assertListEqual(sorted(User.objects.filter(username__startswith='seed').values_list('username', flat=True)),
+                             ['seed5', 'seed6', 'seed7', 'seedling'])
+
+    def test_promises_need_two_users(self):
+        # when, then
+        with self.assertRaises(CommandError):
+            self.seed(users=1, promises=1)
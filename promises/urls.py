@@ -5,9 +5,18 @@ from promises import views
 urlpatterns = [
     url(r'^promises/$', views.PromiseList.as_view()),
     url(r'^promises/(?P<pk>[0-9]+)/$', views.PromiseDetail.as_view()),
+    url(r'^promises/bulk/$', views.PromiseBulk.as_view()),
+    url(r'^promises/changes/$', views.PromiseChanges.as_view()),
+    url(r'^promises/events/$', views.PromiseEvents.as_view()),
     url(r'^users/$', views.UserList.as_view()),
     url(r'^users/(?P<pk>[0-9]+)/$', views.UserDetail.as_view()),
+    url(r'^users/(?P<pk>[0-9]+)/agenda/$', views.UserAgenda.as_view()),
     url(r'^userall/$', views.UserAllList.as_view()),
     url(r'^userall/(?P<pk>[0-9]+)/$', views.UserAllDetail.as_view()),
+    url(r'^cache/stats/$', views.ResponseCacheStats.as_view()),
+    url(r'^freebusy/$', views.FreeBusy.as_view()),
+    url(r'^tokens/$', views.TokenObtain.as_view()),
+    url(r'^tokens/refresh/$', views.TokenRefresh.as_view()),
+    url(r'^tokens/revoke/$', views.TokenRevoke.as_view()),
 ]
 
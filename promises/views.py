@@ -1,17 +1,133 @@
-from promises.models import Promise
+from datetime import timedelta
+
+from promises.models import CHANGED, DELETED, EXPIRED, PROMISE_CHANGES, Promise, Sequence, ShiftedDatetime
+from promises.pagination import PromiseCursorPagination
 from promises.serializers import PromiseSerializer, UserSerializer
-from promises.serializers import PromiseSerializerWithoutUser
-from promises.serializers import UserAllSerializer
+from promises.serializers import PromiseRowSerializer, PromiseSerializerWithoutUser
+from promises.serializers import UserAllSerializer, UserLookupSerializer
+from promises.serializers import IsoDateTimeField, epoch_micros_input
 from promises.permissions import IsRelated
-from rest_framework import generics, permissions, status
+from promises import conditional
+from promises.response_cache import CachedResponseMixin, response_cache
+from promises.signals import promises_changed
+from promises.streaming import StreamingListMixin
+from promises.schedule import busy_blocks, free_slots
+from promises import events
+from promises.middleware import PrimaryAfterWritesMixin
+from promises.authentication import SignedTokenAuthentication, SignedTokenQueryAuthentication
+from promises.authentication import issue_token, revoke_token
+from rest_framework import generics, permissions, serializers, status
+from rest_framework.exceptions import ValidationError
+from rest_framework.authtoken.serializers import AuthTokenSerializer
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import F, Max, Min, Prefetch
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from rest_framework.response import Response
 
 
-class PromiseList(generics.ListCreateAPIView):
+def get_datetime_param(params, name, epoch_micros=False):
+    value = params.get(name)
+    if value is None:
+        return None
+    try:
+        return IsoDateTimeField(epoch_micros=epoch_micros).to_internal_value(value)
+    except ValidationError as e:
+        raise ValidationError({name: e.detail})
+
+
+def get_int_param(request, name, default, maximum):
+    value = request.query_params.get(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        value = 0
+    if not 0 < value <= maximum:
+        raise ValidationError({name: f"Must be an integer between 1 and {maximum}."})
+    return value
+
+
+def get_window_params(params, epoch_micros=False):
+    # from/to as a pair of aware datetimes, or (None, None) if absent
+    start = get_datetime_param(params, "from", epoch_micros)
+    end = get_datetime_param(params, "to", epoch_micros)
+    if start is None and end is None:
+        return None, None
+    if start is None or end is None or start >= end:
+        raise ValidationError({"detail": "from and to must be given together, with from < to."})
+    return start, end
+
+
+class ConflictCheckMixin:
+    """
+    Opt-in double booking check for writes.
+
+    ?conflicts=reject answers 409 with the ids of the participants' promises
+    overlapping the new time span, ?conflicts=report saves anyway and adds
+    those ids to the response. The check runs inside the write transaction
+    after taking a write lock, so concurrent writers for the same users are
+    serialized: the participants' rows where the database locks rows, the
+    whole database on sqlite.
+    """
+    conflict_modes = ("reject", "report")
+
+    def get_conflict_mode(self):
+        mode = self.request.query_params.get("conflicts")
+        if mode is not None and mode not in self.conflict_modes:
+            raise ValidationError({"conflicts": f"Must be one of {', '.join(self.conflict_modes)}."})
+        return mode
+
+    # call inside transaction.atomic(), before any other query in it
+    def find_conflicts(self, mode, user_ids, sinceWhen, tilWhen, exclude=None):
+        if mode is None:
+            return []
+        if transaction.get_connection().features.has_select_for_update:
+            list(User.objects.select_for_update().filter(id__in=user_ids).order_by("id").values_list("id"))
+        else:
+            # sqlite has no FOR UPDATE, but any write takes its write lock
+            # until commit, even in a deferred transaction: a no-op UPDATE of
+            # the change counter, which the promise write bumps anyway
+            Sequence.objects.filter(name=PROMISE_CHANGES).update(value=F("value"))
+        conflicts = Promise.objects.involving(*user_ids).overlapping(sinceWhen, tilWhen)
+        if exclude is not None:
+            conflicts = conflicts.exclude(pk=exclude)
+        return list(conflicts.order_by("id").values_list("id", flat=True))
+
+
+@method_decorator(condition(etag_func=conditional.promise_list_etag), name="get")
+class PromiseList(PrimaryAfterWritesMixin, StreamingListMixin, ConflictCheckMixin, generics.ListCreateAPIView):
     queryset = Promise.objects.all()
     serializer_class = PromiseSerializer
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
+    pagination_class = PromiseCursorPagination
+    stream_ordering = PromiseCursorPagination.ordering
+
+    # ?from=<datetime>&to=<datetime> keeps promises overlapping that window
+    # override
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        start, end = get_window_params(self.request.query_params)
+        if start is not None:
+            queryset = queryset.overlapping(start, end)
+        if self.request.method == "GET":
+            queryset = queryset.rows()
+        return queryset
+
+    # reads render plain rows, see PromiseRowSerializer
+    # override
+    def get_serializer_class(self):
+        if self.request.method == "GET":
+            return PromiseRowSerializer
+        return super().get_serializer_class()
 
     # automatically add user info when creating promise
     # override
@@ -34,16 +150,35 @@ class PromiseList(generics.ListCreateAPIView):
         if sinceWhen >= tilWhen or user1_id == user2_id :
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
-        self.perform_create(serializer)
-        headers = self.get_success_headers(serializer.data)
-        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+        mode = self.get_conflict_mode()
+        with transaction.atomic():
+            conflicts = self.find_conflicts(mode, [user1_id, user2_id], sinceWhen, tilWhen)
+            if conflicts and mode == "reject":
+                return Response({"conflicts": conflicts}, status=status.HTTP_409_CONFLICT)
+            self.perform_create(serializer)
+
+        data = serializer.data
+        if mode == "report":
+            data["conflicts"] = conflicts
+        headers = self.get_success_headers(data)
+        return Response(data, status=status.HTTP_201_CREATED, headers=headers)
 
 
-class PromiseDetail(generics.RetrieveUpdateDestroyAPIView):
+@method_decorator(condition(etag_func=conditional.promise_detail_etag,
+                            last_modified_func=conditional.promise_detail_last_modified), name="get")
+class PromiseDetail(PrimaryAfterWritesMixin, ConflictCheckMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Promise.objects.all()
     serializer_class = PromiseSerializerWithoutUser
     permission_classes = (permissions.IsAuthenticated, IsRelated,)
 
+    # send ETag/Last-Modified from the loaded promise, so an unconditional
+    # GET stays one query
+    # override
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        serializer = self.get_serializer(instance)
+        return Response(serializer.data, headers=conditional.promise_validators(request, instance))
+
     # check if sicneWhen < tilWhen
     # override
     def update(self, request, *args, **kwargs):
@@ -58,31 +193,426 @@ class PromiseDetail(generics.RetrieveUpdateDestroyAPIView):
         # custom invalid data
         if sinceWhen >= tilWhen :
             return Response(status=status.HTTP_400_BAD_REQUEST)
-        self.perform_update(serializer)
+
+        mode = self.get_conflict_mode()
+        with transaction.atomic():
+            conflicts = self.find_conflicts(mode, [instance.user1_id, instance.user2_id],
+                                            sinceWhen, tilWhen, exclude=instance.pk)
+            if conflicts and mode == "reject":
+                return Response({"conflicts": conflicts}, status=status.HTTP_409_CONFLICT)
+            self.perform_update(serializer)
 
         if getattr(instance, '_prefetched_objects_cache', None):
             # If 'prefetch_related' has been applied to a queryset, we need to
             # forcibly invalidate the prefetch cache on the instance.
             instance._prefetched_objects_cache = {}
 
-        return Response(serializer.data)
+        data = serializer.data
+        if mode == "report":
+            data["conflicts"] = conflicts
+        return Response(data)
+
+
+class PromiseBulk(APIView):
+    permission_classes = (permissions.IsAuthenticated,)
+
+    # create promises from an array of {sinceWhen, tilWhen, user2}, with
+    # the requesting user as user1. Valid items are inserted together, invalid
+    # ones are reported by their index.
+    def post(self, request, *args, **kwargs):
+        items = request.data
+        if not isinstance(items, list) or not items:
+            raise ValidationError({"detail": "Expected a non-empty list of promises."})
+        if len(items) > settings.BULK_MAX_ITEMS:
+            raise ValidationError({"detail": f"At most {settings.BULK_MAX_ITEMS} promises per request."})
+
+        user1_id = request.user.id
+        # user2 of every item as a pk, or its errors as PrimaryKeyRelatedField
+        # reports them; then all of them are looked up in one query
+        user2_ids, user2_errors = {}, {}
+        for index, item in enumerate(items):
+            if isinstance(item, dict):
+                try:
+                    user2_ids[index] = self.get_user2_id(item)
+                except ValidationError as e:
+                    user2_errors[index] = e.detail
+        existing_user_ids = set(User.objects.filter(id__in=set(user2_ids.values())).values_list("id", flat=True))
+
+        field = IsoDateTimeField(epoch_micros=epoch_micros_input(request))
+        rows, indexes, errors = [], [], []
+        for index, item in enumerate(items):
+            item_errors = {}
+            if not isinstance(item, dict):
+                errors.append({"index": index, "errors": {"detail": "Expected an object."}})
+                continue
+            values = {}
+            for name in ("sinceWhen", "tilWhen"):
+                try:
+                    values[name] = field.run_validation(item.get(name, serializers.empty))
+                except ValidationError as e:
+                    item_errors[name] = e.detail
+            user2_id = user2_ids.get(index)
+            if index in user2_errors:
+                item_errors["user2"] = user2_errors[index]
+            elif user2_id not in existing_user_ids:
+                item_errors["user2"] = [f'Invalid pk "{user2_id}" - object does not exist.']
+            elif user2_id == user1_id:
+                item_errors["user2"] = ["Cannot make a promise with yourself."]
+            if not item_errors and values["sinceWhen"] >= values["tilWhen"]:
+                item_errors["tilWhen"] = ["Must be later than sinceWhen."]
+
+            if item_errors:
+                errors.append({"index": index, "errors": item_errors})
+                continue
+            rows.append((values["sinceWhen"], values["tilWhen"], user1_id, user2_id))
+            indexes.append(index)
+
+        if not rows:
+            return Response({"created": [], "errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            ids = Promise.objects.bulk_insert(rows)
+            promises_changed.send(sender=Promise, action="create",
+                                  rows=[(pk, user1_id, row[3]) for pk, row in zip(ids, rows)])
+
+        created = [{"index": index, "id": pk} for index, pk in zip(indexes, ids)]
+        return Response({"created": created, "errors": errors}, status=status.HTTP_201_CREATED)
+
+    # raises ValidationError with PrimaryKeyRelatedField's messages
+    def get_user2_id(self, item):
+        value = item.get("user2")
+        if value is None:
+            raise ValidationError(["This field is required."])
+        try:
+            return User._meta.pk.to_python(value)
+        except DjangoValidationError:
+            raise ValidationError([f"Incorrect type. Expected pk value, received {type(value).__name__}."])
+
+    # select promises by {"ids": [...]} or by {"from": ..., "to": ...}, the
+    # latter only among the requesting user's promises. Returns the related
+    # (id, user1_id, user2_id) rows, the ids of others' promises and the ids
+    # that do not exist.
+    def select(self, request):
+        user_id = request.user.id
+        if not isinstance(request.data, dict):
+            raise ValidationError({"detail": "Expected an object."})
+        ids = request.data.get("ids")
+        if ids is not None:
+            if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+                raise ValidationError({"ids": "Must be a list of promise ids."})
+            if len(ids) > settings.BULK_MAX_ITEMS:
+                raise ValidationError({"ids": f"At most {settings.BULK_MAX_ITEMS} ids per request."})
+            rows = Promise.objects.filter(id__in=ids).values_list("id", "user1", "user2")
+        else:
+            start, end = get_window_params(request.data, epoch_micros_input(request))
+            if start is None:
+                raise ValidationError({"detail": "Expected ids, or from and to."})
+            rows = Promise.objects.involving(user_id).overlapping(start, end).values_list("id", "user1", "user2")
+
+        # IsRelated, for the whole set at once
+        allowed, denied = [], []
+        for row in sorted(rows):
+            if user_id in row[1:]:
+                allowed.append(row)
+            else:
+                denied.append(row[0])
+        missing = sorted(set(ids) - {row[0] for row in allowed} - set(denied)) if ids is not None else []
+        return allowed, denied, missing
+
+    # reschedule the selected promises, either to {"sinceWhen", "tilWhen"}
+    # or by {"shift": <seconds>}, with one UPDATE
+    def patch(self, request, *args, **kwargs):
+        if not isinstance(request.data, dict):
+            raise ValidationError({"detail": "Expected an object."})
+        if "shift" in request.data:
+            try:
+                shift = timedelta(seconds=int(request.data["shift"]))
+            except (TypeError, ValueError, OverflowError):
+                raise ValidationError({"shift": "Must be a number of seconds."})
+            changes = {"sinceWhen": ShiftedDatetime("sinceWhen", shift), "tilWhen": ShiftedDatetime("tilWhen", shift)}
+        else:
+            sinceWhen = get_datetime_param(request.data, "sinceWhen", epoch_micros_input(request))
+            tilWhen = get_datetime_param(request.data, "tilWhen", epoch_micros_input(request))
+            if sinceWhen is None or tilWhen is None or sinceWhen >= tilWhen:
+                raise ValidationError({"detail": "Expected shift, or sinceWhen and tilWhen with sinceWhen < tilWhen."})
+            changes = {"sinceWhen": sinceWhen, "tilWhen": tilWhen, "duration": tilWhen - sinceWhen}
+        # update() skips auto_now
+        changes["updated"] = timezone.now()
+
+        with transaction.atomic():
+            allowed, denied, missing = self.select(request)
+            allowed_ids = [row[0] for row in allowed]
+            if allowed and "shift" in request.data:
+                self.check_shift(allowed_ids, shift)
+            if allowed:
+                # a distinct, increasing seq per row from the one UPDATE: id
+                # offsets into a block as wide as the id range, gaps are fine
+                low = min(allowed_ids)
+                first = Sequence.objects.allocate(PROMISE_CHANGES, max(allowed_ids) - low + 1)
+                changes["seq"] = F("id") + (first - low)
+                Promise.objects.filter(id__in=allowed_ids).involving(request.user.id).update(**changes)
+                promises_changed.send(sender=Promise, action="update", rows=allowed)
+        return Response({"updated": allowed_ids, "denied": denied, "missing": missing})
+
+    # raises ValidationError if the shift moves any of the promises out of
+    # the datetime range
+    def check_shift(self, ids, shift):
+        bounds = Promise.objects.filter(id__in=ids).aggregate(earliest=Min("sinceWhen"), latest=Max("tilWhen"))
+        try:
+            bounds["earliest"] + shift, bounds["latest"] + shift
+        except OverflowError:
+            raise ValidationError({"shift": "Moves promises out of the supported datetime range."})
+
+    # delete the selected promises with one DELETE
+    def delete(self, request, *args, **kwargs):
+        with transaction.atomic():
+            allowed, denied, missing = self.select(request)
+            allowed_ids = [row[0] for row in allowed]
+            if allowed:
+                Promise.objects.bulk_delete(allowed_ids)
+                promises_changed.send(sender=Promise, action="delete", rows=allowed)
+        return Response({"deleted": allowed_ids, "denied": denied, "missing": missing})
+
+
+class PromiseChanges(PrimaryAfterWritesMixin, APIView):
+    """
+    Change feed for keeping a copy of the promise list current.
+
+    Without ?since= it answers the current cursor only: take it, read the
+    full list, then follow the feed from it. ?since=<cursor> answers the
+    promises created or updated after the cursor, rendered as in /promises/,
+    the ids of the promises deleted after it, the cursor to continue from,
+    and whether more changes are waiting. 410 Gone means tombstones after
+    the cursor were compacted away; the client has to start over.
+    """
+    permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
+
+    def get(self, request, *args, **kwargs):
+        if "since" not in request.query_params:
+            cursor = Sequence.objects.current(PROMISE_CHANGES)
+            return Response({"changes": [], "deleted": [], "cursor": cursor, "more": False})
+        try:
+            since = int(request.query_params["since"])
+        except ValueError:
+            since = -1
+        if since < 0:
+            raise ValidationError({"since": "Must be a cursor returned by this feed."})
+        limit = get_int_param(request, "limit", settings.CHANGES_PAGE_SIZE, settings.CHANGES_MAX_PAGE_SIZE)
+
+        rows = Promise.objects.changes(since, limit + 1)
+        if any(kind == EXPIRED for _, _, kind in rows):
+            return Response({"detail": "Changes after this cursor are no longer available, sync from scratch."},
+                            status=status.HTTP_410_GONE)
+        more = len(rows) > limit
+        rows = rows[:limit]
+        cursor = rows[-1][0] if rows else since
+
+        changed = []
+        if any(kind == CHANGED for _, _, kind in rows):
+            # the same range again: promises updated meanwhile moved past cursor
+            changed = Promise.objects.filter(seq__gt=since, seq__lte=cursor).order_by("seq").rows()
+        return Response({
+            "changes": PromiseRowSerializer(changed, many=True, context={"request": request}).data,
+            "deleted": [promise_id for _, promise_id, kind in rows if kind == DELETED],
+            "cursor": cursor,
+            "more": more,
+        })
 
 
-class UserList(generics.ListAPIView):
-    queryset = User.objects.all()
+class PromiseEvents(APIView):
+    """
+    Server-sent events for the requesting user's promises, see promises.events.
+
+    EventSource cannot send headers, so besides the usual authentication a
+    token from /tokens/ is accepted as ?access_token=. A reconnecting browser
+    sends Last-Event-ID and is replayed what it missed.
+    """
+    authentication_classes = (SignedTokenQueryAuthentication,) + tuple(api_settings.DEFAULT_AUTHENTICATION_CLASSES)
+    permission_classes = (permissions.IsAuthenticated,)
+    renderer_classes = (events.EventStreamRenderer,)
+    # a lagging replica would miss changes made before subscribing
+    read_from_primary = True
+
+    def get(self, request, *args, **kwargs):
+        last_event_id = request.META.get("HTTP_LAST_EVENT_ID")
+        try:
+            last_event_id = None if last_event_id is None else int(last_event_id)
+        except ValueError:
+            raise ValidationError({"Last-Event-ID": "Must be an event id from this stream."})
+
+        stream = events.open_stream(request.user.id, last_event_id)
+        response = StreamingHttpResponse(stream, content_type=events.EventStreamRenderer.media_type)
+        # the ASGI handler iterates this one on the event loop
+        response.async_streaming_content = stream
+        response["Cache-Control"] = "no-cache"
+        # nginx would buffer the stream otherwise
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
+class UsernameLookupMixin:
+    """
+    ?username=<name> finds one user, ?username__startswith=<prefix> lists
+    matching users for autocompletion. Both answer with id and username only
+    and at most USER_LOOKUP_LIMIT rows.
+    """
+
+    # override
+    def get(self, request, *args, **kwargs):
+        username = request.query_params.get("username")
+        prefix = request.query_params.get("username__startswith")
+        if username is None and prefix is None:
+            return super().get(request, *args, **kwargs)
+
+        users = User.objects.order_by("username")
+        if username is not None:
+            users = users.filter(username=username)
+        else:
+            # a range instead of LIKE, so sqlite can scan the unique username index
+            users = users.filter(username__gte=prefix, username__lt=prefix + "\U0010ffff")
+
+        users = users.values("id", "username")[:settings.USER_LOOKUP_LIMIT]
+        return Response(UserLookupSerializer(users, many=True).data)
+
+
+# UserSerializer only renders promise ids, so prefetch just the id and the
+# foreign key needed to group them per user: 3 queries for any number of users
+users_with_promise_ids = User.objects.prefetch_related(
+    Prefetch("promises_as_inviter", queryset=Promise.objects.only("id", "user1").order_by("id")),
+    Prefetch("promises_as_invitee", queryset=Promise.objects.only("id", "user2").order_by("id")),
+)
+
+
+@method_decorator(condition(etag_func=conditional.user_list_etag), name="get")
+class UserList(PrimaryAfterWritesMixin, UsernameLookupMixin, CachedResponseMixin, StreamingListMixin,
+               generics.ListAPIView):
+    queryset = users_with_promise_ids
     serializer_class = UserSerializer
+    cache_endpoint = "users"
 
 
-class UserDetail(generics.RetrieveAPIView):
-    queryset = User.objects.all()
+class UserDetail(PrimaryAfterWritesMixin, CachedResponseMixin, generics.RetrieveAPIView):
+    queryset = users_with_promise_ids
     serializer_class = UserSerializer
+    cache_endpoint = "users"
+
+
+class UserAgenda(PrimaryAfterWritesMixin, generics.ListAPIView):
+    serializer_class = PromiseSerializerWithoutUser
 
+    # next ?limit= promises of the user, as inviter or invitee, starting at
+    # ?after= (default now)
+    # override
+    def list(self, request, *args, **kwargs):
+        if not User.objects.filter(pk=kwargs["pk"]).exists():
+            raise Http404
+        after = get_datetime_param(request.query_params, "after") or timezone.now()
+        limit = get_int_param(request, "limit", settings.AGENDA_LENGTH, settings.AGENDA_MAX_LENGTH)
 
-class UserAllList(generics.ListAPIView):
-    queryset = User.objects.all()
+        promises = Promise.objects.agenda(kwargs["pk"], after, limit)
+        serializer = self.get_serializer(promises, many=True)
+        return Response(serializer.data)
+
+
+@method_decorator(condition(etag_func=conditional.user_list_etag), name="get")
+class UserAllList(PrimaryAfterWritesMixin, UsernameLookupMixin, CachedResponseMixin, StreamingListMixin,
+                  generics.ListAPIView):
+    queryset = User.objects.only("id", "username").order_by("id")
     serializer_class = UserAllSerializer
+    cache_endpoint = "userall"
+
+    # override
+    def prepare_stream_chunk(self, users, queryset):
+        # the queryset is in id order, so the chunk is an id range of it
+        Promise.objects.attach_whole_promises(users, queryset.filter(pk__range=(users[0].pk, users[-1].pk)))
+
+    # compute whole_promises for every user with a single query
+    # override
+    def list(self, request, *args, **kwargs):
+        if self.should_stream(request):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        users = list(queryset)
+        Promise.objects.attach_whole_promises(users, queryset)
+        serializer = self.get_serializer(users, many=True)
+        return Response(serializer.data)
 
 
-class UserAllDetail(generics.RetrieveAPIView):
-    queryset = User.objects.all()
+class UserAllDetail(PrimaryAfterWritesMixin, CachedResponseMixin, generics.RetrieveAPIView):
+    queryset = User.objects.only("id", "username").order_by("id")
     serializer_class = UserAllSerializer
+    cache_endpoint = "userall"
+
+    # override
+    def get_object(self):
+        user = super().get_object()
+        Promise.objects.attach_whole_promises([user])
+        return user
+
+
+class TokenObtain(generics.GenericAPIView):
+    serializer_class = AuthTokenSerializer
+    permission_classes = (permissions.AllowAny,)
+
+    # trade username/password for a signed access token
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data["user"]
+        return Response({"token": issue_token(user.id), "expires_in": settings.ACCESS_TOKEN_TTL})
+
+
+class TokenRefresh(APIView):
+    authentication_classes = (SignedTokenAuthentication,)
+    permission_classes = (permissions.IsAuthenticated,)
+
+    # revoke the presented token and issue a fresh one for the same user
+    def post(self, request, *args, **kwargs):
+        revoke_token(request.auth)
+        return Response({"token": issue_token(request.user.id), "expires_in": settings.ACCESS_TOKEN_TTL})
+
+
+class TokenRevoke(APIView):
+    authentication_classes = (SignedTokenAuthentication,)
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def post(self, request, *args, **kwargs):
+        revoke_token(request.auth)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class FreeBusy(PrimaryAfterWritesMixin, APIView):
+    permission_classes = (permissions.AllowAny,)
+
+    # ?users=<id>,<id>,...&from=<datetime>&to=<datetime>[&min_slot=<minutes>]
+    # busy blocks of the users merged together, and the free slots between them
+    def get(self, request, *args, **kwargs):
+        start, end = get_window_params(request.query_params)
+        if start is None:
+            raise ValidationError({"detail": "from and to are required."})
+        try:
+            user_ids = [int(user_id) for user_id in request.query_params.get("users", "").split(",")]
+        except ValueError:
+            raise ValidationError({"users": "Must be a comma separated list of user ids."})
+        if len(user_ids) > settings.FREEBUSY_MAX_USERS:
+            raise ValidationError({"users": f"At most {settings.FREEBUSY_MAX_USERS} users."})
+        min_slot = timedelta(minutes=get_int_param(request, "min_slot", 1, 24 * 60))
+
+        intervals = Promise.objects.involving(*user_ids).overlapping(start, end).values_list("sinceWhen", "tilWhen")
+        busy = busy_blocks(intervals, start, end)
+        free = free_slots(busy, start, end, min_slot)
+
+        field = serializers.DateTimeField()
+        return Response({
+            "from": field.to_representation(start),
+            "to": field.to_representation(end),
+            "busy": [{"start": field.to_representation(since), "end": field.to_representation(til)} for since, til in busy],
+            "free": [{"start": field.to_representation(since), "end": field.to_representation(til)} for since, til in free],
+        })
+
+
+class ResponseCacheStats(APIView):
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request, *args, **kwargs):
+        return Response(response_cache.stats())
@@ -84,6 +84,15 @@ def get_json_or_error(link):
         print("ERROR: Cannot get {0}".format(link))
         exit(1)
 
+def get_all_pages_or_error(link):
+    # /promises/ is cursor paginated; follow "next" until the last page
+    results = []
+    while link:
+        page = get_json_or_error(link)
+        results += page["results"]
+        link = page["next"]
+    return results
+
 def forbidden_or_error(method, link, uname, upwd):
     sleep(0.05)
     try:
@@ -138,7 +147,7 @@ print(users)
 print("******************************************************************************************************************")        
 # remove existing proms
 print("2. Checking GET http://localhost:8000/promises/")
-prom_old = get_json_or_error("http://localhost:8000/promises/")
+prom_old = get_all_pages_or_error("http://localhost:8000/promises/")
 print(prom_old)
 
 print("******************************************************************************************************************")        
@@ -184,7 +193,7 @@ for i in range(0, promN):
     print("\tposting with user: {0}".format((pname, ppwd)))
     post_or_error(link, payload, pname, ppwd)
 
-proms_json = get_json_or_error("http://localhost:8000/promises/")
+proms_json = get_all_pages_or_error("http://localhost:8000/promises/")
 print(proms_json)
 print(proms)
 if len(proms_json) != len(proms):